@@ -43,7 +43,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'main_app.apps.MainAppConfig',  # Custom app config
-    'django_apscheduler',  # APScheduler
     
 ]
 
@@ -92,6 +91,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Web workers, the scheduler (manage.py runscheduler) and the task worker
+# share cached analytics and the version counters that invalidate them, so
+# the cache must be shared between processes: Redis when REDIS_URL is set,
+# otherwise a database table (create it with manage.py createcachetable).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'habit_tracker_cache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -147,6 +169,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGOUT_REDIRECT_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'# Login redirects
 TESTING = False  # Flag used by app_config to decide whether to run the scheduler
+SCHEDULER_SHARDS = int(os.environ.get('SCHEDULER_SHARDS', 0))  # Worker processes for the nightly sweep (0 = run inline)
+JOB_HISTORY_RETENTION_DAYS = int(os.environ.get('JOB_HISTORY_RETENTION_DAYS', 14))  # Scheduler execution records older than this are pruned
 
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development - prints emails to console
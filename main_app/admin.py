@@ -2,10 +2,12 @@ from django.contrib import admin
 from .models import (
     MissedHabit, UserProfile, Category, Habit, UserHabit, 
     HabitCompletion, HabitStreak, Reminder,
-    HabitAnalytics, HabitHistory,
+    HabitAnalytics, DailyUserStats, DailyHabitStats, UserCohort, HabitHistory,
     # Gamification models
     PointTransaction, UserPoints, Badge, UserBadge,
-    Achievement, UserAchievement, LeaderboardEntry
+    Achievement, UserAchievement, LeaderboardEntry,
+    # Scheduler models
+    SweepWatermark, BackgroundTask, SchedulerLease, JobRun
 )
 
 @admin.register(UserProfile)
@@ -50,6 +52,21 @@ class ReminderAdmin(admin.ModelAdmin):
 class HabitAnalyticsAdmin(admin.ModelAdmin):
     list_display = ['user', 'habit', 'longest_streak', 'missed_count']
 
+@admin.register(DailyUserStats)
+class DailyUserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'completions', 'misses', 'points']
+    date_hierarchy = 'date'
+
+@admin.register(DailyHabitStats)
+class DailyHabitStatsAdmin(admin.ModelAdmin):
+    list_display = ['habit', 'date', 'completions', 'misses', 'distinct_users']
+    date_hierarchy = 'date'
+
+@admin.register(UserCohort)
+class UserCohortAdmin(admin.ModelAdmin):
+    list_display = ['user', 'joined', 'cohort_week', 'cohort_month', 'first_active_day', 'last_active_day']
+    date_hierarchy = 'joined'
+
 @admin.register(HabitHistory)
 class HabitHistoryAdmin(admin.ModelAdmin):
     list_display = ['user_habit', 'completion_date']
@@ -107,3 +124,44 @@ class MissedHabitAdmin(admin.ModelAdmin):
     list_filter = ['missed_date']
     date_hierarchy = 'missed_date'
     search_fields = ['user_habit__user__username', 'user_habit__habit__name']
+
+# Scheduler admin models
+@admin.register(SweepWatermark)
+class SweepWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['periodicity', 'timezone', 'last_processed_date', 'updated_at']
+    list_filter = ['periodicity']
+
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'available_at', 'locked_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+
+
+@admin.register(SchedulerLease)
+class SchedulerLeaseAdmin(admin.ModelAdmin):
+    list_display = ['name', 'holder', 'acquired_at', 'heartbeat_at', 'expires_at']
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = [
+        'job_name', 'started_at', 'duration_display', 'queries',
+        'rows_read', 'rows_written', 'peak_memory_display', 'succeeded'
+    ]
+    list_filter = ['job_name', 'succeeded']
+    date_hierarchy = 'started_at'
+    ordering = ['-started_at']
+    readonly_fields = [field.name for field in JobRun._meta.fields]
+    
+    @admin.display(description='Duration', ordering='duration')
+    def duration_display(self, obj):
+        return f"{obj.duration * 1000:.0f} ms"
+    
+    @admin.display(description='Peak memory', ordering='peak_memory')
+    def peak_memory_display(self, obj):
+        return f"{obj.peak_memory / (1024 * 1024):.1f} MiB"
+    
+    def has_add_permission(self, request):
+        return False
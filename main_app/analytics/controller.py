@@ -1,13 +1,21 @@
-from django.db.models import Count, Sum, Avg, Max, F, Q
+from django.core.cache import cache
+from django.db.models import Count, Sum, Avg, Max, F, Q, Value, CharField, DateField, IntegerField
 from django.utils import timezone
 from datetime import datetime, timedelta
 from ..models import (
     User, HabitCompletion, UserHabit, MissedHabit, 
     HabitAnalytics, LeaderboardEntry, Habit, 
-    PointTransaction, UserPoints
+    PointTransaction, UserPoints, DailyUserStats
 )
 from ..services.analytics_service import AnalyticsService
 
+SYSTEM_OVERVIEW_CACHE_KEY = 'analytics:system-overview'
+SYSTEM_OVERVIEW_CACHE_TTL = 60
+
+# Entries in a user's recent activity stream
+RECENT_ACTIVITY_LIMIT = 10
+
+
 class AnalyticsController:
     """
     Controller class for analytics functionality.
@@ -19,37 +27,66 @@ class AnalyticsController:
         """
         Get system-wide analytics for admin dashboard
         Returns counts and statistics about the entire application
+        
+        Built from a fixed number of grouped and conditional aggregates and
+        cached for SYSTEM_OVERVIEW_CACHE_TTL seconds in the shared cache;
+        call invalidate_system_overview() from any process after changes
+        that must show at once.
         """
+        overview = cache.get(SYSTEM_OVERVIEW_CACHE_KEY)
+        if overview is None:
+            overview = AnalyticsController._build_system_overview()
+            cache.set(SYSTEM_OVERVIEW_CACHE_KEY, overview, SYSTEM_OVERVIEW_CACHE_TTL)
+        return overview
+    
+    @staticmethod
+    def invalidate_system_overview():
+        """Drop the cached system overview"""
+        cache.delete(SYSTEM_OVERVIEW_CACHE_KEY)
+    
+    @staticmethod
+    def _build_system_overview():
         today = timezone.now().date()
         yesterday = today - timedelta(days=1)
         thirty_days_ago = today - timedelta(days=30)
         
         # User stats
-        total_users = User.objects.count()
-        active_users = User.objects.filter(
-            last_login__gte=thirty_days_ago
-        ).count()
-        new_users_today = User.objects.filter(
-            date_joined__date=today
-        ).count()
+        users = User.objects.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(last_login__gte=timezone.now() - timedelta(days=30))),
+            new_today=Count('id', filter=Q(date_joined__date=today))
+        )
+        total_users = users['total']
+        active_users = users['active']
         
         # Habit stats
         total_habits = Habit.objects.count()
-        total_user_habits = UserHabit.objects.count()
-        active_habits = UserHabit.objects.filter(
-            is_active=True
-        ).count()
+        user_habits = UserHabit.objects.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(is_active=True))
+        )
+        total_user_habits = user_habits['total']
+        active_habits = user_habits['active']
         
-        # Completion stats
-        completions_today = HabitCompletion.objects.filter(
-            completion_date=today
-        ).count()
-        completions_yesterday = HabitCompletion.objects.filter(
-            completion_date=yesterday
-        ).count()
-        completions_this_month = HabitCompletion.objects.filter(
-            completion_date__gte=thirty_days_ago
-        ).count()
+        # Completions per day over the trend window, with empty days filled in
+        per_day = dict(
+            HabitCompletion.objects.filter(
+                completion_date__gte=thirty_days_ago,
+                completion_date__lte=today
+            ).values('completion_date').annotate(
+                count=Count('id')
+            ).order_by().values_list('completion_date', 'count')
+        )
+        daily_completions = []
+        for i in range(30, -1, -1):
+            date = today - timedelta(days=i)
+            daily_completions.append({
+                'date': date.strftime('%Y-%m-%d'),
+                'count': per_day.get(date, 0)
+            })
+        completions_today = per_day.get(today, 0)
+        completions_yesterday = per_day.get(yesterday, 0)
+        completions_this_month = sum(per_day.values())
         
         # Missed habits
         missed_yesterday = MissedHabit.objects.filter(
@@ -57,29 +94,17 @@ class AnalyticsController:
         ).count()
         
         # Points and gamification
-        total_points_awarded = PointTransaction.objects.aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        points_today = PointTransaction.objects.filter(
-            timestamp__date=today
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Activity trend
-        daily_completions = []
-        for i in range(30, -1, -1):
-            date = today - timedelta(days=i)
-            count = HabitCompletion.objects.filter(completion_date=date).count()
-            daily_completions.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'count': count
-            })
+        points = PointTransaction.objects.aggregate(
+            total=Sum('amount'),
+            today=Sum('amount', filter=Q(timestamp__date=today))
+        )
         
         return {
             'user_stats': {
                 'total': total_users,
                 'active': active_users,
                 'active_percentage': round(active_users / total_users * 100 if total_users else 0, 1),
-                'new_today': new_users_today,
+                'new_today': users['new_today'],
             },
             'habit_stats': {
                 'total_habits': total_habits,
@@ -97,14 +122,53 @@ class AnalyticsController:
                 'missed_yesterday': missed_yesterday,
             },
             'points': {
-                'total_awarded': total_points_awarded,
-                'today': points_today,
+                'total_awarded': points['total'] or 0,
+                'today': points['today'] or 0,
             },
             'trends': {
                 'daily_completions': daily_completions,
             }
         }
     
+    @staticmethod
+    def _recent_activity(user, limit=RECENT_ACTIVITY_LIMIT):
+        """
+        A user's latest completions and point transactions as one stream,
+        merged and sorted by a single UNION query. Each side is cut to its
+        ``limit`` newest rows first, so the query stays small however long
+        the user's history is.
+        
+        Returns:
+            List of (kind, timestamp, date, habit_name, amount, description)
+            tuples, newest first
+        """
+        columns = ('kind', 'at', 'day', 'habit_name', 'points', 'note')
+        latest_completions = HabitCompletion.objects.filter(
+            user_habit__user=user
+        ).order_by('-created_at').values('pk')[:limit]
+        latest_points = PointTransaction.objects.filter(
+            user=user
+        ).order_by('-timestamp').values('pk')[:limit]
+        
+        completions = HabitCompletion.objects.filter(pk__in=latest_completions).annotate(
+            kind=Value('completion', output_field=CharField()),
+            at=F('created_at'),
+            day=F('completion_date'),
+            habit_name=F('user_habit__habit__name'),
+            points=Value(None, output_field=IntegerField()),
+            note=Value(None, output_field=CharField())
+        ).values_list(*columns)
+        transactions = PointTransaction.objects.filter(pk__in=latest_points).annotate(
+            kind=Value('points', output_field=CharField()),
+            at=F('timestamp'),
+            day=Value(None, output_field=DateField()),
+            habit_name=Value(None, output_field=CharField()),
+            points=F('amount'),
+            note=F('description')
+        ).values_list(*columns)
+        
+        return list(completions.union(transactions, all=True).order_by('-at')[:limit])
+    
     @staticmethod
     def get_user_analytics(user_id=None, username=None):
         """
@@ -122,8 +186,8 @@ class AnalyticsController:
             if not user:
                 return {'error': 'User not found'}
             
-            # Get habits
-            user_habits = UserHabit.objects.filter(user=user)
+            # Get habits; their completion and miss counts are kept as counters
+            user_habits = list(UserHabit.objects.filter(user=user).select_related('habit'))
             habit_details = []
             
             total_completions = 0
@@ -131,19 +195,16 @@ class AnalyticsController:
             max_streak = 0
             
             for habit in user_habits:
-                completions_count = HabitCompletion.objects.filter(user_habit=habit).count()
-                missed_count = MissedHabit.objects.filter(user_habit=habit).count()
-                
-                total_completions += completions_count
-                total_missed += missed_count
+                total_completions += habit.completions_count
+                total_missed += habit.missed_count
                 max_streak = max(max_streak, habit.streak)
                 
                 habit_details.append({
                     'id': habit.id,
                     'name': habit.habit.name,
                     'current_streak': habit.streak,
-                    'completions_count': completions_count,
-                    'missed_count': missed_count,
+                    'completions_count': habit.completions_count,
+                    'missed_count': habit.missed_count,
                     'is_active': habit.is_active,
                     'start_date': habit.start_date.strftime('%Y-%m-%d'),
                     'last_completed': habit.last_completed.strftime('%Y-%m-%d') if habit.last_completed else None
@@ -159,40 +220,23 @@ class AnalyticsController:
             except UserPoints.DoesNotExist:
                 points = {'total': 0, 'level': 0}
             
-            # Recent activity
+            # Recent activity, newest first
             recent_activity = []
-            
-            # Recent completions
-            recent_completions = HabitCompletion.objects.filter(
-                user_habit__user=user
-            ).order_by('-completion_date', '-timestamp')[:10]
-            
-            for completion in recent_completions:
-                recent_activity.append({
-                    'type': 'completion',
-                    'date': completion.completion_date.strftime('%Y-%m-%d'),
-                    'habit_name': completion.user_habit.habit.name,
-                    'timestamp': completion.timestamp.strftime('%Y-%m-%d %H:%M')
-                })
-            
-            # Recent point transactions
-            recent_points = PointTransaction.objects.filter(
-                user=user
-            ).order_by('-timestamp')[:10]
-            
-            for transaction in recent_points:
-                recent_activity.append({
-                    'type': 'points',
-                    'amount': transaction.amount,
-                    'description': transaction.description,
-                    'timestamp': transaction.timestamp.strftime('%Y-%m-%d %H:%M')
-                })
-            
-            # Sort by timestamp (newest first)
-            recent_activity.sort(
-                key=lambda x: datetime.strptime(x['timestamp'], '%Y-%m-%d %H:%M'), 
-                reverse=True
-            )
+            for kind, timestamp, day, habit_name, amount, description in AnalyticsController._recent_activity(user):
+                if kind == 'completion':
+                    recent_activity.append({
+                        'type': 'completion',
+                        'date': day.strftime('%Y-%m-%d'),
+                        'habit_name': habit_name,
+                        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M')
+                    })
+                else:
+                    recent_activity.append({
+                        'type': 'points',
+                        'amount': amount,
+                        'description': description,
+                        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M')
+                    })
             
             return {
                 'user': {
@@ -203,8 +247,8 @@ class AnalyticsController:
                     'last_login': user.last_login.strftime('%Y-%m-%d %H:%M') if user.last_login else None
                 },
                 'summary': {
-                    'total_habits': user_habits.count(),
-                    'active_habits': user_habits.filter(is_active=True).count(),
+                    'total_habits': len(user_habits),
+                    'active_habits': sum(1 for habit in user_habits if habit.is_active),
                     'total_completions': total_completions,
                     'total_missed': total_missed,
                     'completion_ratio': round(
@@ -216,7 +260,7 @@ class AnalyticsController:
                 },
                 'points': points,
                 'habits': habit_details,
-                'recent_activity': recent_activity[:10]  # Take only 10 most recent
+                'recent_activity': recent_activity
             }
         
         except User.DoesNotExist:
@@ -319,26 +363,18 @@ class AnalyticsController:
             if not user:
                 return {'error': 'User not found'}
             
-            # Get habits and recalculate analytics
-            user_habits = UserHabit.objects.filter(user=user)
+            # Recalculate every habit of the user in one bulk pass
+            user_habit_ids = list(UserHabit.objects.filter(user=user).values_list('id', flat=True))
             results = []
             
-            for habit in user_habits:
-                try:
-                    analytics = AnalyticsService.recalculate_analytics(habit)
-                    results.append({
-                        'habit_name': habit.habit.name,
-                        'success': True,
-                        'longest_streak': analytics.longest_streak,
-                        'missed_count': analytics.missed_count,
-                        'completion_rate': analytics.completion_rate
-                    })
-                except Exception as e:
-                    results.append({
-                        'habit_name': habit.habit.name,
-                        'success': False,
-                        'error': str(e)
-                    })
+            for habit, analytics in AnalyticsService.recalculate_analytics_bulk(user_habit_ids):
+                results.append({
+                    'habit_name': habit.habit.name,
+                    'success': True,
+                    'longest_streak': analytics.longest_streak,
+                    'missed_count': analytics.missed_count,
+                    'completion_rate': analytics.completion_rate
+                })
             
             return {
                 'username': user.username,
@@ -396,53 +432,32 @@ class AnalyticsController:
             user_habits = UserHabit.objects.filter(user=user, is_active=True)
             total_habits = user_habits.count()
             
-            # Get completions for current period
-            completions = HabitCompletion.objects.filter(
-                user_habit__in=user_habits,
-                completion_date__gte=start_date,
-                completion_date__lte=end_date
-            )
-            total_completions = completions.count()
-            
-            # Get missed habits for current period
-            missed = MissedHabit.objects.filter(
-                user_habit__in=user_habits,
-                missed_date__gte=start_date,
-                missed_date__lte=end_date
+            # Completions, misses and points of both periods from the daily rollup
+            current = Q(date__gte=start_date, date__lte=end_date)
+            previous = Q(date__gte=previous_start, date__lte=previous_end)
+            totals = DailyUserStats.objects.filter(user=user).aggregate(
+                completions=Sum('completions', filter=current, default=0),
+                missed=Sum('misses', filter=current, default=0),
+                points=Sum('points', filter=current, default=0),
+                previous_completions=Sum('completions', filter=previous, default=0),
+                previous_points=Sum('points', filter=previous, default=0)
             )
-            total_missed = missed.count()
+            total_completions = totals['completions']
+            total_missed = totals['missed']
+            points = totals['points']
+            previous_completions = totals['previous_completions']
+            previous_points = totals['previous_points']
             
             # Calculate completion rate
             completion_rate = 0
             if total_completions + total_missed > 0:
                 completion_rate = round(total_completions / (total_completions + total_missed) * 100, 1)
             
-            # Get completions for previous period for comparison
-            previous_completions = HabitCompletion.objects.filter(
-                user_habit__in=user_habits,
-                completion_date__gte=previous_start,
-                completion_date__lte=previous_end
-            ).count()
-            
             # Calculate change from previous period
             completion_change = 0
             if previous_completions > 0:
                 completion_change = round((total_completions - previous_completions) / previous_completions * 100, 1)
             
-            # Get points for current period
-            points = PointTransaction.objects.filter(
-                user=user,
-                timestamp__date__gte=start_date,
-                timestamp__date__lte=end_date
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            # Get points for previous period
-            previous_points = PointTransaction.objects.filter(
-                user=user,
-                timestamp__date__gte=previous_start,
-                timestamp__date__lte=previous_end
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
             # Calculate points change
             points_change = 0
             if previous_points > 0:
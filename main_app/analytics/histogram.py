@@ -0,0 +1,86 @@
+"""
+Bucketed distributions computed in a single query.
+
+Every bucket is a conditional COUNT over the same scan, so a histogram of
+any number of buckets, optionally split by a grouping column, costs one
+query instead of one count per bucket.
+"""
+
+from django.db.models import Count, Q
+
+
+def _buckets(edges):
+    """
+    Normalise bucket edges to (lower, upper, label) triples.
+
+    Args:
+        edges: Ascending lower bounds, each either a number or a
+            (number, label) pair; the last bucket is open-ended
+    """
+    pairs = [edge if isinstance(edge, (tuple, list)) else (edge, None) for edge in edges]
+    lowers = [lower for lower, _ in pairs]
+    if lowers != sorted(set(lowers)):
+        raise ValueError("Bucket edges must be strictly ascending")
+
+    buckets = []
+    for i, (lower, label) in enumerate(pairs):
+        upper = pairs[i + 1][0] if i + 1 < len(pairs) else None
+        if label is None:
+            label = f"{lower}+" if upper is None else f"{lower}-{upper}"
+        buckets.append((lower, upper, label))
+    return buckets
+
+
+def _histogram_row(buckets, row):
+    total = row['total'] or 0
+    return {
+        'total': total,
+        'buckets': [
+            {
+                'label': label,
+                'min': lower,
+                'max': upper,
+                'count': row[f'bucket_{i}'],
+                'percentage': round(row[f'bucket_{i}'] / total * 100, 1) if total else 0,
+            }
+            for i, (lower, upper, label) in enumerate(buckets)
+        ],
+    }
+
+
+def histogram(queryset, value, edges, group_by=None):
+    """
+    Count the rows of a queryset per bucket of a value, in one query.
+
+    Bucket i holds the rows with edges[i] <= value < edges[i + 1]; the last
+    bucket has no upper bound. Rows whose value is NULL or below the first
+    edge are counted in the total but in no bucket.
+
+    Args:
+        queryset: Rows to count
+        value: Field name or expression to bucket on
+        edges: Ascending lower bounds, numbers or (number, label) pairs
+        group_by: Optional field name; one histogram per distinct value
+
+    Returns:
+        {'total': n, 'buckets': [{'label', 'min', 'max', 'count', 'percentage'}]}
+        with 'max' exclusive (None for the last bucket), or a dictionary of
+        those per group when group_by is given
+    """
+    buckets = _buckets(edges)
+    if not isinstance(value, str):
+        queryset = queryset.annotate(histogram_value=value)
+        value = 'histogram_value'
+
+    aggregates = {'total': Count('pk')}
+    for i, (lower, upper, _) in enumerate(buckets):
+        condition = Q(**{f'{value}__gte': lower})
+        if upper is not None:
+            condition &= Q(**{f'{value}__lt': upper})
+        aggregates[f'bucket_{i}'] = Count('pk', filter=condition)
+
+    if group_by is None:
+        return _histogram_row(buckets, queryset.aggregate(**aggregates))
+
+    rows = queryset.values(group_by).annotate(**aggregates).order_by(group_by)
+    return {row[group_by]: _histogram_row(buckets, row) for row in rows}
@@ -2,13 +2,55 @@
 Analytics metrics for measuring user engagement, habit adherence and system health
 """
 
-from django.db.models import Count, Sum, Avg, F, Q, Window
-from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
+from django.db.models import Count, Sum, Avg, F, Q, Window, ExpressionWrapper, FloatField
+from django.db.models.functions import NullIf, TruncDate, TruncWeek, TruncMonth
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import datetime, timedelta
 from ..models import (
     User, HabitCompletion, UserHabit, Habit, MissedHabit,
-    PointTransaction, LeaderboardEntry
+    PointTransaction, LeaderboardEntry, DailyUserStats, DailyHabitStats, UserCohort
+)
+from ..services.cohorts import cohort_version
+from .histogram import histogram
+
+# Day offsets and number of weeks in the retention matrix
+RETENTION_DAYS = (1, 7, 30)
+RETENTION_WEEKS = 8
+
+# Safety net should a nightly cohort build be skipped
+RETENTION_CACHE_TTL = 26 * 60 * 60
+
+# Lower bounds of the streak_distribution buckets
+STREAK_BUCKETS = [
+    (0, "No streak"),
+    (1, "1 day"),
+    (2, "2-3 days"),
+    (4, "4-6 days"),
+    (7, "1 week"),
+    (14, "2 weeks"),
+    (21, "3 weeks"),
+    (30, "1 month"),
+    (60, "2 months"),
+    (90, "3 months"),
+    (180, "6 months"),
+    (365, "1 year+")
+]
+
+# Lower bounds of the per-habit completion rate buckets, in percent
+COMPLETION_RATE_BUCKETS = [
+    (0, "0-24%"),
+    (25, "25-49%"),
+    (50, "50-74%"),
+    (75, "75-99%"),
+    (100, "100%")
+]
+
+# Share of a habit's recorded periods that were completed, from its counters;
+# NULL for habits with neither completions nor misses yet
+HABIT_COMPLETION_RATE = ExpressionWrapper(
+    F('completions_count') * 100.0 / NullIf(F('completions_count') + F('missed_count'), 0),
+    output_field=FloatField()
 )
 
 class EngagementMetrics:
@@ -22,13 +64,12 @@ class EngagementMetrics:
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days_back)
         
-        # Get daily active users (users who completed at least one habit on each day)
+        # Users who completed at least one habit on each day, from the daily rollup
         daily_users = (
-            HabitCompletion.objects
-            .filter(completion_date__gte=start_date, completion_date__lte=end_date)
-            .annotate(date=TruncDate('completion_date'))
+            DailyUserStats.objects
+            .filter(date__gte=start_date, date__lte=end_date, completions__gt=0)
             .values('date')
-            .annotate(count=Count('user_habit__user', distinct=True))
+            .annotate(count=Count('id'))
             .order_by('date')
         )
         
@@ -55,43 +96,84 @@ class EngagementMetrics:
         Calculate retention rates for user cohorts
         Returns percentage of users who are still active after registration
         """
-        today = timezone.now().date()
+        matrix = EngagementMetrics.retention_matrix(days=(cohort_days,), weeks=0)
+        return [
+            {
+                'period': cohort['period'],
+                'cohort_size': cohort['cohort_size'],
+                'retention_30d': cohort['days'][0]['rate'] or 0
+            }
+            for cohort in matrix
+        ]
+    
+    @staticmethod
+    def retention_matrix(period='month', cohorts=12, days=RETENTION_DAYS, weeks=RETENTION_WEEKS):
+        """
+        Retention of the most recent signup cohorts, in one grouped query over
+        the cohort tables, cached until the next cohort build.
         
-        # Define cohorts (users who registered during specific periods)
-        cohorts = []
+        Day N retention is the share of a cohort active on day N after signup
+        or later; week N retention the share active during week N after
+        signup. Only users who have reached day N (or the start of week N) by
+        yesterday count towards a cell, so recent cohorts are not understated.
         
-        # Last 12 cohorts (months)
-        for i in range(0, 12):
-            cohort_start = today.replace(day=1) - timedelta(days=i*30)
-            cohort_end = (cohort_start.replace(month=cohort_start.month+1) 
-                         if cohort_start.month < 12 
-                         else cohort_start.replace(year=cohort_start.year+1, month=1)) - timedelta(days=1)
-            
-            # Users who registered in this cohort
-            users_in_cohort = User.objects.filter(
-                date_joined__date__gte=cohort_start,
-                date_joined__date__lte=cohort_end
-            )
-            cohort_size = users_in_cohort.count()
-            
-            # Skip empty cohorts
-            if cohort_size == 0:
-                continue
-                
-            # Check how many users are still active
-            active_after_30d = users_in_cohort.filter(
-                habitcompletion__completion_date__gte=F('date_joined') + timedelta(days=30)
-            ).distinct().count()
+        Args:
+            period: 'week' or 'month' cohorts
+            cohorts: Number of cohorts, most recent first
+            days: Day offsets of the D-N columns
+            weeks: Number of week-N columns, starting from week 1
             
-            retention_30d = round(active_after_30d / cohort_size * 100, 1) if cohort_size else 0
-            
-            cohorts.append({
-                'period': f"{cohort_start.strftime('%b %Y')}",
-                'cohort_size': cohort_size,
-                'retention_30d': retention_30d
+        Returns:
+            One dictionary per cohort with its 'days' and 'weeks' cells, each
+            holding the eligible users, the retained users and the rate (None
+            while no user is eligible)
+        """
+        days = tuple(days)
+        key = f'retention:{period}:{cohorts}:{",".join(map(str, days))}:{weeks}:{cohort_version()}'
+        matrix = cache.get(key)
+        if matrix is None:
+            matrix = EngagementMetrics._build_retention_matrix(period, cohorts, days, weeks)
+            cache.set(key, matrix, RETENTION_CACHE_TTL)
+        return matrix
+    
+    @staticmethod
+    def _build_retention_matrix(period, cohorts, days, weeks):
+        if period not in ('week', 'month'):
+            raise ValueError(f"Unknown cohort period: {period}")
+        field = f'cohort_{period}'
+        as_of = timezone.localdate() - timedelta(days=1)
+        
+        # Users are counted once per cell however many weeks they were active in
+        columns = [('day', n, n, Q(last_active_day__gte=n)) for n in days]
+        columns += [('week', n, n * 7, Q(activity__week=n)) for n in range(1, weeks + 1)]
+        aggregates = {'cohort_size': Count('pk', distinct=True)}
+        for i, (_, _, offset, retained) in enumerate(columns):
+            eligible = Q(joined__lte=as_of - timedelta(days=offset))
+            aggregates[f'eligible_{i}'] = Count('pk', distinct=True, filter=eligible)
+            aggregates[f'retained_{i}'] = Count('pk', distinct=True, filter=eligible & retained)
+        
+        rows = UserCohort.objects.values(field).annotate(**aggregates).order_by(f'-{field}')[:cohorts]
+        
+        matrix = []
+        for row in rows:
+            start = row[field]
+            cells = {'day': [], 'week': []}
+            for i, (kind, n, _, _) in enumerate(columns):
+                eligible, retained = row[f'eligible_{i}'], row[f'retained_{i}']
+                cells[kind].append({
+                    kind: n,
+                    'users': eligible,
+                    'retained': retained,
+                    'rate': round(retained / eligible * 100, 1) if eligible else None
+                })
+            matrix.append({
+                'cohort': start,
+                'period': start.strftime('%b %Y') if period == 'month' else f"Week of {start:%d %b %Y}",
+                'cohort_size': row['cohort_size'],
+                'days': cells['day'],
+                'weeks': cells['week']
             })
-            
-        return cohorts
+        return matrix
 
 
 class HabitMetrics:
@@ -105,31 +187,35 @@ class HabitMetrics:
         today = timezone.now().date()
         thirty_days_ago = today - timedelta(days=30)
         
-        # All active habits during the time period
-        active_habits = UserHabit.objects.filter(
-            is_active=True,
-            start_date__lte=today
+        # Active habits per periodicity and the distribution of their
+        # all-time completion rates, in one query
+        distributions = histogram(
+            UserHabit.objects.filter(is_active=True, start_date__lte=today),
+            HABIT_COMPLETION_RATE,
+            COMPLETION_RATE_BUCKETS,
+            group_by='habit__periodicity'
         )
         
+        # Completions and misses from the daily habit rollup
+        totals = {
+            row['habit__periodicity']: row for row in
+            DailyHabitStats.objects.filter(date__gte=thirty_days_ago)
+            .values('habit__periodicity')
+            .annotate(completions=Sum('completions'), misses=Sum('misses'))
+            .order_by()
+        }
+        
         results = []
         
         for periodicity, _ in Habit.PERIODICITY_CHOICES:
-            habits_of_type = active_habits.filter(habit__periodicity=periodicity)
-            habit_count = habits_of_type.count()
+            distribution = distributions.get(periodicity)
+            habit_count = distribution['total'] if distribution else 0
             
             if habit_count == 0:
                 continue
-                
-            # Calculate completions and misses
-            completions = HabitCompletion.objects.filter(
-                user_habit__in=habits_of_type,
-                completion_date__gte=thirty_days_ago
-            ).count()
             
-            misses = MissedHabit.objects.filter(
-                user_habit__in=habits_of_type,
-                missed_date__gte=thirty_days_ago
-            ).count()
+            completions = totals.get(periodicity, {}).get('completions') or 0
+            misses = totals.get(periodicity, {}).get('misses') or 0
             
             total = completions + misses
             completion_rate = round(completions / total * 100, 1) if total > 0 else 0
@@ -139,7 +225,8 @@ class HabitMetrics:
                 'completion_rate': completion_rate,
                 'total_habits': habit_count,
                 'completions': completions,
-                'misses': misses
+                'misses': misses,
+                'distribution': distribution['buckets']
             })
             
         return results
@@ -159,48 +246,18 @@ class HabitMetrics:
     @staticmethod
     def streak_distribution():
         """Calculate distribution of streak lengths"""
-        # Define streak buckets
-        buckets = [
-            (0, "No streak"), 
-            (1, "1 day"),
-            (2, "2-3 days"),
-            (4, "4-6 days"),
-            (7, "1 week"),
-            (14, "2 weeks"),
-            (21, "3 weeks"),
-            (30, "1 month"),
-            (60, "2 months"),
-            (90, "3 months"),
-            (180, "6 months"),
-            (365, "1 year+")
-        ]
-        
-        # Count habits in each streak bucket
-        results = []
-        all_habits = UserHabit.objects.all()
-        total_count = all_habits.count()
+        distribution = histogram(UserHabit.objects.all(), 'streak', STREAK_BUCKETS)
         
-        if total_count == 0:
+        if distribution['total'] == 0:
             return []
-            
-        for i, (days, label) in enumerate(buckets):
-            # Define the range for this bucket
-            min_streak = days
-            max_streak = buckets[i+1][0]-1 if i+1 < len(buckets) else None
-            
-            if max_streak:
-                count = all_habits.filter(streak__gte=min_streak, streak__lte=max_streak).count()
-            else:
-                count = all_habits.filter(streak__gte=min_streak).count()
-                
-            percentage = round(count / total_count * 100, 1)
-            
-            results.append({
-                'label': label,
-                'count': count,
-                'percentage': percentage,
-                'min_days': min_streak,
-                'max_days': max_streak
-            })
-            
-        return results
+        
+        return [
+            {
+                'label': bucket['label'],
+                'count': bucket['count'],
+                'percentage': bucket['percentage'],
+                'min_days': bucket['min'],
+                'max_days': bucket['max'] - 1 if bucket['max'] is not None else None
+            }
+            for bucket in distribution['buckets']
+        ]
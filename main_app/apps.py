@@ -8,5 +8,5 @@ class MainAppConfig(AppConfig):
     def ready(self):
         import main_app.signals
         import main_app.templatetags.habit_extras
-        from main_app.updater import start
-        start()
\ No newline at end of file
+        # Scheduled jobs run in their own process (manage.py runscheduler), so
+        # web and CLI processes never import or start APScheduler
@@ -0,0 +1,89 @@
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management.base import BaseCommand
+from main_app.services.email_delivery import deliver_messages
+from main_app.services.notification_service import NotificationService
+from types import SimpleNamespace
+import time
+
+STUB_BACKEND = 'main_app.management.commands.bench_email_delivery.LatencyBackend'
+
+
+class LatencyBackend(BaseEmailBackend):
+    """
+    Stand-in for an SMTP server: sleeps for the connection handshake and for
+    every message instead of talking to the network.
+    """
+    connect_seconds = 0.0
+    send_seconds = 0.0
+
+    def open(self):
+        time.sleep(self.connect_seconds)
+        return True
+
+    def send_messages(self, email_messages):
+        time.sleep(self.send_seconds * len(email_messages))
+        return len(email_messages)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks batched reminder email delivery against a stub backend with '
+        'simulated SMTP latency, compared with one connection per message.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10_000)
+        parser.add_argument('--connect-ms', type=float, default=20.0,
+                            help='Simulated connection setup time')
+        parser.add_argument('--send-ms', type=float, default=2.0,
+                            help='Simulated time per message on an open connection')
+        parser.add_argument('--workers', default='1,4,8',
+                            help='Comma separated connection pool sizes to measure')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        LatencyBackend.connect_seconds = options['connect_ms'] / 1000
+        LatencyBackend.send_seconds = options['send_ms'] / 1000
+        messages = self._build_messages(options['messages'])
+        self.stdout.write(f"Prepared {len(messages)} reminder emails")
+
+        rows = [('per-message', self._send_individually(messages))]
+        for workers in (int(n) for n in options['workers'].split(',')):
+            started = time.perf_counter()
+            results = deliver_messages(
+                messages,
+                workers=workers,
+                batch_size=options['batch_size'],
+                backend=STUB_BACKEND
+            )
+            elapsed = time.perf_counter() - started
+            if not all(result.sent for result in results):
+                self.stderr.write(f'{workers} workers: some messages were not sent')
+            rows.append((f'{workers} workers', elapsed))
+
+        self.stdout.write(f"{'mode':>12} {'seconds':>10} {'msgs/sec':>10}")
+        for mode, elapsed in rows:
+            self.stdout.write(f'{mode:>12} {elapsed:>10.2f} {len(messages) / elapsed:>10.0f}')
+
+    def _build_messages(self, count):
+        """Render reminder emails for synthetic users and habits"""
+        messages = []
+        for i in range(count):
+            user = SimpleNamespace(username=f'user{i}', first_name='', email=f'user{i}@example.com')
+            habit = SimpleNamespace(name=f'Habit {i % 50}', description='Synthetic benchmark habit')
+            context = {'user': user, 'habit': habit, 'streak': i % 30}
+            messages.append(NotificationService._build_email(
+                f"Reminder: Complete your habit '{habit.name}'", 'habit_reminder', context, user
+            ))
+        return messages
+
+    def _send_individually(self, messages):
+        """Baseline: what send_mail does, a fresh connection for every message"""
+        started = time.perf_counter()
+        for message in messages:
+            connection = get_connection(STUB_BACKEND)
+            connection.open()
+            connection.send_messages([message])
+            connection.close()
+        return time.perf_counter() - started
@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+from main_app.models import Category, Habit, UserHabit, HabitCompletion, MissedHabit
+from main_app.updater.scheduler import run_sharded_sweep
+from datetime import timedelta
+import random
+import time
+import uuid
+
+BENCH_PREFIX = 'bench_sweep_'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the sharded missed-habit sweep on a synthetic dataset. '
+        'Run it against a scratch database: it creates (and by default removes) '
+        'synthetic users. Parallel shards need a database that allows concurrent '
+        'writers (e.g. PostgreSQL); SQLite serialises them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=1_000_000,
+                            help='Number of synthetic UserHabit rows')
+        parser.add_argument('--habits-per-user', type=int, default=5)
+        parser.add_argument('--completion-rate', type=float, default=0.6,
+                            help='Share of habits completed yesterday')
+        parser.add_argument('--shards', default='1,2,4,8',
+                            help='Comma separated shard counts to measure')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the synthetic dataset for later runs')
+
+    def handle(self, *args, **options):
+        shard_counts = [int(n) for n in options['shards'].split(',')]
+        yesterday = timezone.now().date() - timedelta(days=1)
+
+        user_habit_ids = self._build_dataset(options, yesterday)
+        self.stdout.write(f'Dataset: {len(user_habit_ids)} habits on {connection.vendor}')
+
+        rows = []
+        for shard_count in shard_counts:
+            self._reset(yesterday)
+            started = time.perf_counter()
+            summary = run_sharded_sweep(shard_count, start_date=yesterday)
+            elapsed = time.perf_counter() - started
+            rows.append((shard_count, elapsed, sum(summary['missed'].values())))
+
+        baseline = rows[0][1]
+        self.stdout.write(f"{'shards':>6} {'seconds':>10} {'speedup':>8} {'missed':>10}")
+        for shard_count, elapsed, missed in rows:
+            self.stdout.write(
+                f'{shard_count:>6} {elapsed:>10.2f} {baseline / elapsed:>7.2f}x {missed:>10}'
+            )
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+            Habit.objects.filter(name__startswith=BENCH_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS('Removed synthetic dataset'))
+
+    def _build_dataset(self, options, yesterday):
+        """Create synthetic users, habits and completions unless they already exist"""
+        existing = list(
+            UserHabit.objects.filter(
+                user__username__startswith=BENCH_PREFIX
+            ).values_list('id', flat=True)
+        )
+        if existing:
+            return existing
+
+        batch_size = options['batch_size']
+        habit_count = options['habits']
+        user_count = -(-habit_count // options['habits_per_user'])
+
+        category = Category.objects.create(name=f'{BENCH_PREFIX}category')
+        habit = Habit.objects.create(
+            name=f'{BENCH_PREFIX}daily',
+            description='Synthetic benchmark habit',
+            periodicity='DAILY',
+            category=category
+        )
+
+        User.objects.bulk_create(
+            (User(username=f'{BENCH_PREFIX}{i}', password='!') for i in range(user_count)),
+            batch_size=batch_size
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith=BENCH_PREFIX).values_list('id', flat=True)
+        )
+
+        user_habits = [
+            UserHabit(
+                id=str(uuid.uuid4()),
+                user_id=user_ids[i % len(user_ids)],
+                habit=habit,
+                streak=random.randint(0, 30),
+                start_date=yesterday - timedelta(days=30)
+            )
+            for i in range(habit_count)
+        ]
+        UserHabit.objects.bulk_create(user_habits, batch_size=batch_size)
+
+        HabitCompletion.objects.bulk_create(
+            (
+                HabitCompletion(user_habit_id=user_habit.id, completion_date=yesterday)
+                for user_habit in user_habits
+                if random.random() < options['completion_rate']
+            ),
+            batch_size=batch_size
+        )
+        self.stdout.write(self.style.SUCCESS(f'Created {habit_count} synthetic habits'))
+        return [user_habit.id for user_habit in user_habits]
+
+    def _reset(self, yesterday):
+        """Undo the previous run so every shard count sweeps the same work"""
+        bench_habits = UserHabit.objects.filter(user__username__startswith=BENCH_PREFIX)
+        MissedHabit.objects.filter(
+            user_habit__in=bench_habits,
+            missed_date=yesterday
+        ).delete()
+        bench_habits.filter(streak=0).update(streak=1)
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so every sample pays the full import cost
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", {settings_module!r})
+import django
+django.setup()
+if {with_scheduler!r}:
+    from main_app.updater import updater
+    updater.start()
+ready = time.perf_counter()
+from django.test import Client
+status = Client(SERVER_NAME="localhost").get({path!r}).status_code
+first_request = time.perf_counter()
+if {with_scheduler!r}:
+    updater._shutdown()
+print(json.dumps({{
+    "import": ready - started,
+    "first_request": first_request - started,
+    "status": status,
+    "apscheduler_modules": sum(1 for name in sys.modules if name.startswith("apscheduler")),
+}}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures process startup (Django setup and imports) and time to first '
+        'request, with and without starting the scheduler in-process. The runs '
+        'with the scheduler write its lease and job rows to the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/',
+                            help='URL requested as the first request')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'mode':>16} {'import s':>10} {'first req s':>12} {'apscheduler mods':>17}")
+        for label, with_scheduler in (('web (no sched)', False), ('with scheduler', True)):
+            samples = [self._probe(with_scheduler, options['path']) for _ in range(options['runs'])]
+            self.stdout.write(
+                f"{label:>16} "
+                f"{statistics.median(s['import'] for s in samples):>10.3f} "
+                f"{statistics.median(s['first_request'] for s in samples):>12.3f} "
+                f"{samples[-1]['apscheduler_modules']:>17}"
+            )
+
+    def _probe(self, with_scheduler, path):
+        script = PROBE.format(
+            settings_module=settings.SETTINGS_MODULE,
+            with_scheduler=with_scheduler,
+            path=path
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', script],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from main_app.analytics.controller import AnalyticsController
+from main_app.services.completion_import import import_completions, IMPORT_BATCH_SIZE
+import csv
+import json
+import os
+import sys
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports habit completions in bulk from a CSV or NDJSON file. Each row '
+        'needs a completion_date (YYYY-MM-DD) and either a user_habit_id or a '
+        'username and habit name. Streaks, streak history, analytics and points '
+        'are recomputed once per affected habit after the insert.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for standard input")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Rows validated and inserted per batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or self._format_from_extension(path)
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = self._read_csv(stream) if input_format == 'csv' else self._read_ndjson(stream)
+            result = import_completions(rows, batch_size=options['batch_size'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        AnalyticsController.invalidate_system_overview()
+
+        for row_number, message in result.errors:
+            self.stderr.write(f'Row {row_number}: {message}')
+        if result.invalid > len(result.errors):
+            self.stderr.write(f'... and {result.invalid - len(result.errors)} more invalid rows')
+
+        self.stdout.write(
+            f'{result.rows} rows: {result.created} imported, {result.skipped} already recorded, '
+            f'{result.invalid} invalid'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {result.habits} habits and awarded {result.points} points '
+            f'in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s)'
+        ))
+
+    def _format_from_extension(self, path):
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            return 'csv'
+        if extension in ('.ndjson', '.jsonl'):
+            return 'ndjson'
+        raise CommandError('Cannot tell the input format from the file name; pass --format')
+
+    def _read_csv(self, stream):
+        yield from csv.DictReader(stream)
+
+    def _read_ndjson(self, stream):
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise CommandError(f'Line {line_number} is not valid JSON: {e}')
+            # Values are validated as text, like CSV fields
+            yield {key: '' if value is None else str(value) for key, value in row.items()}
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from main_app.services.streaks import rebuild_all_streaks, REBUILD_BATCH_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds every habit\'s current streak, HabitStreak history and longest '
+        'streak from its completions, repairing drifted or corrupted streak data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE,
+                            help='Habits rebuilt per batch')
+        parser.add_argument('--quiet', action='store_true',
+                            help='Only print the final summary')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(totals):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{totals['habits']} habits, {totals['completions']} completions "
+                f"({totals['completions'] / elapsed:.0f}/s)"
+            )
+
+        totals = rebuild_all_streaks(
+            batch_size=options['batch_size'],
+            progress=None if options['quiet'] else progress
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {totals['habits']} habits ({totals['runs']} streaks from "
+            f"{totals['completions']} completions) in {elapsed:.2f}s; "
+            f"repaired {totals['repaired']} current streaks"
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from main_app.services.analytics_service import AnalyticsService, ANALYTICS_BATCH_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculates the analytics (longest streak, missed count and completion '
+        'rate) of every habit, a batch at a time, repairing the streak history first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ANALYTICS_BATCH_SIZE,
+                            help='Habits recalculated per batch')
+        parser.add_argument('--quiet', action='store_true',
+                            help='Only print the final summary')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(totals):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{totals['processed']} habits ({totals['processed'] / elapsed:.0f}/s), "
+                f"{totals['failed']} failed"
+            )
+
+        totals = AnalyticsService.recalculate_all_analytics(
+            batch_size=options['batch_size'],
+            progress=None if options['quiet'] else progress
+        )
+        elapsed = time.perf_counter() - started
+        style = self.style.SUCCESS if not totals['failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"Recalculated analytics for {totals['succeeded']} of {totals['processed']} "
+            f"habits in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from main_app.services.counters import reconcile_counters
+from main_app.services.streaks import REBUILD_BATCH_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Repairs every habit\'s completion, miss and longest streak counters '
+        '(on UserHabit and HabitAnalytics) from the completion and missed-habit rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE,
+                            help='Habits reconciled per batch')
+        parser.add_argument('--quiet', action='store_true',
+                            help='Only print the final summary')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(totals):
+            self.stdout.write(
+                f"{totals['habits']} habits recounted, {totals['missed_repaired']} miss counters repaired"
+            )
+
+        totals = reconcile_counters(
+            batch_size=options['batch_size'],
+            progress=None if options['quiet'] else progress
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {totals['habits']} habits in {elapsed:.2f}s; repaired the completion "
+            f"counters of {totals['repaired']} and the miss counters of {totals['missed_repaired']}"
+        ))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from main_app.tasks import run_pending
+from main_app.tasks.queue import DEFAULT_VISIBILITY_TIMEOUT
+import os
+import signal
+import socket
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs background tasks from the database task queue. Start as many '
+        'worker processes as needed; each task is claimed by one worker at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Tasks claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--visibility-timeout', type=int, default=DEFAULT_VISIBILITY_TIMEOUT,
+                            help='Seconds before a claimed task may be retried by another worker')
+        parser.add_argument('--once', action='store_true',
+                            help='Run until the queue is empty, then exit')
+
+    def handle(self, *args, **options):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f'Worker {worker_id} started')
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            count = run_pending(
+                worker_id,
+                limit=options['batch_size'],
+                visibility_timeout=options['visibility_timeout']
+            )
+            processed += count
+            if count == 0:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped after {processed} tasks'))
+
+    def _stop(self, signum, frame):
+        """Finish the current batch, then exit"""
+        self.stopping = True
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+import logging
+import signal
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the scheduled jobs (missed-habit sweep, reminders). Web and CLI '
+        'processes do not start the scheduler; run this in its own process. '
+        'Several instances may run for failover: only the lease holder runs jobs.'
+    )
+
+    def handle(self, *args, **options):
+        # Imported here so that no other command pays for loading the scheduler
+        from main_app.updater import updater
+
+        logging.basicConfig(level=logging.INFO)
+        signal.signal(signal.SIGTERM, lambda signum, frame: updater._scheduler.shutdown(wait=False))
+
+        self.stdout.write('Starting scheduler, press Ctrl+C to stop')
+        try:
+            updater.run_scheduler()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Scheduler stopped'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0004_sweepwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sweepwatermark',
+            name='timezone',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='sweepwatermark',
+            name='periodicity',
+            field=models.CharField(choices=[('DAILY', 'Daily'), ('WEEKLY', 'Weekly'), ('MONTHLY', 'Monthly')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='timezone',
+            field=models.CharField(db_index=True, default='UTC', max_length=50),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sweepwatermark',
+            unique_together={('periodicity', 'timezone')},
+        ),
+    ]
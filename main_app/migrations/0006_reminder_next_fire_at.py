@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:16
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# A frozen copy of models.habit_models.next_reminder_fire_time, so the
+# migration keeps working whatever becomes of the application code
+def next_reminder_fire_time(reminder_time, reminder_date, timezone_name, after):
+    try:
+        tz = ZoneInfo(timezone_name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = ZoneInfo('UTC')
+    
+    if reminder_date:
+        fire_at = datetime.combine(reminder_date, reminder_time, tzinfo=tz)
+        return fire_at.astimezone(dt_timezone.utc) if fire_at > after else None
+    
+    local_date = after.astimezone(tz).date()
+    fire_at = datetime.combine(local_date, reminder_time, tzinfo=tz)
+    if fire_at <= after:
+        fire_at = datetime.combine(local_date + timedelta(days=1), reminder_time, tzinfo=tz)
+    return fire_at.astimezone(dt_timezone.utc)
+
+
+def backfill_next_fire_at(apps, schema_editor):
+    Reminder = apps.get_model('main_app', 'Reminder')
+    UserProfile = apps.get_model('main_app', 'UserProfile')
+    
+    now = timezone.now()
+    timezones = dict(UserProfile.objects.values_list('user_id', 'timezone'))
+    reminders = list(Reminder.objects.select_related('user_habit'))
+    for reminder in reminders:
+        reminder.next_fire_at = next_reminder_fire_time(
+            reminder.reminder_time,
+            reminder.reminder_date,
+            timezones.get(reminder.user_habit.user_id),
+            now
+        )
+    Reminder.objects.bulk_update(reminders, ['next_fire_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0005_sweep_timezone_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='next_fire_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_next_fire_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:31
+
+import main_app.models.base
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0008_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_name', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField(default=main_app.models.base.get_current_datetime)),
+                ('duration', models.FloatField(default=0)),
+                ('queries', models.IntegerField(default=0)),
+                ('rows_read', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('peak_memory', models.BigIntegerField(default=0)),
+                ('succeeded', models.BooleanField(default=True)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job_name', 'started_at'], name='main_app_jo_job_nam_762b49_idx'), models.Index(fields=['started_at'], name='main_app_jo_started_a7d792_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+# Frozen copies of services.periods.period_index and
+# services.completion_bitmap.build_bitmap, so the migration keeps working
+# whatever becomes of the application code
+def period_index(periodicity, day):
+    if periodicity == 'WEEKLY':
+        return (day.toordinal() - 1) // 7
+    if periodicity == 'MONTHLY':
+        return day.year * 12 + day.month - 1
+    return day.toordinal()
+
+
+def build_bitmap(indices):
+    origin = min(indices)
+    value = 0
+    for index in indices:
+        value |= 1 << (index - origin)
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little'), origin
+
+
+def backfill_completion_bitmaps(apps, schema_editor):
+    UserHabit = apps.get_model('main_app', 'UserHabit')
+    HabitCompletion = apps.get_model('main_app', 'HabitCompletion')
+    
+    periodicities = dict(UserHabit.objects.values_list('id', 'habit__periodicity'))
+    indices = {}
+    for user_habit_id, completion_date in HabitCompletion.objects.values_list(
+        'user_habit_id', 'completion_date'
+    ).iterator():
+        indices.setdefault(user_habit_id, []).append(
+            period_index(periodicities[user_habit_id], completion_date)
+        )
+    
+    user_habits = []
+    for user_habit_id, habit_indices in indices.items():
+        bitmap, origin = build_bitmap(habit_indices)
+        user_habits.append(UserHabit(id=user_habit_id, completion_bitmap=bitmap, bitmap_origin=origin))
+    UserHabit.objects.bulk_update(user_habits, ['completion_bitmap', 'bitmap_origin'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_jobrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userhabit',
+            name='bitmap_origin',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userhabit',
+            name='completion_bitmap',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.RunPython(backfill_completion_bitmaps, migrations.RunPython.noop),
+    ]
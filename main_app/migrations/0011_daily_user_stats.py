@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_daily_user_stats(apps, schema_editor):
+    HabitCompletion = apps.get_model('main_app', 'HabitCompletion')
+    DailyUserStats = apps.get_model('main_app', 'DailyUserStats')
+    
+    totals = HabitCompletion.objects.values(
+        'user_habit__user_id', 'completion_date'
+    ).annotate(completions=Count('id')).order_by()
+    DailyUserStats.objects.bulk_create(
+        (
+            DailyUserStats(
+                user_id=row['user_habit__user_id'],
+                date=row['completion_date'],
+                completions=row['completions']
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_completion_bitmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completions', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily user stats',
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:02
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_rollups(apps, schema_editor):
+    HabitCompletion = apps.get_model('main_app', 'HabitCompletion')
+    MissedHabit = apps.get_model('main_app', 'MissedHabit')
+    PointTransaction = apps.get_model('main_app', 'PointTransaction')
+    DailyUserStats = apps.get_model('main_app', 'DailyUserStats')
+    DailyHabitStats = apps.get_model('main_app', 'DailyHabitStats')
+    
+    users = defaultdict(dict)
+    for row in HabitCompletion.objects.values('user_habit__user_id', 'completion_date').annotate(
+        total=Count('id')
+    ).order_by().iterator():
+        users[row['user_habit__user_id'], row['completion_date']]['completions'] = row['total']
+    for row in MissedHabit.objects.values('user_habit__user_id', 'missed_date').annotate(
+        total=Count('id')
+    ).order_by().iterator():
+        users[row['user_habit__user_id'], row['missed_date']]['misses'] = row['total']
+    for row in PointTransaction.objects.annotate(day=TruncDate('timestamp')).values(
+        'user_id', 'day'
+    ).annotate(total=Sum('amount')).order_by().iterator():
+        users[row['user_id'], row['day']]['points'] = row['total']
+    
+    habits = defaultdict(dict)
+    for row in HabitCompletion.objects.values('user_habit__habit_id', 'completion_date').annotate(
+        total=Count('id'),
+        users=Count('user_habit__user_id', distinct=True)
+    ).order_by().iterator():
+        habits[row['user_habit__habit_id'], row['completion_date']].update(
+            completions=row['total'], distinct_users=row['users']
+        )
+    for row in MissedHabit.objects.values('user_habit__habit_id', 'missed_date').annotate(
+        total=Count('id')
+    ).order_by().iterator():
+        habits[row['user_habit__habit_id'], row['missed_date']]['misses'] = row['total']
+    
+    DailyUserStats.objects.all().delete()
+    DailyUserStats.objects.bulk_create(
+        (DailyUserStats(user_id=user_id, date=day, **counts) for (user_id, day), counts in users.items()),
+        batch_size=500
+    )
+    DailyHabitStats.objects.bulk_create(
+        (DailyHabitStats(habit_id=habit_id, date=day, **counts) for (habit_id, day), counts in habits.items()),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_daily_user_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyuserstats',
+            name='misses',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyuserstats',
+            name='points',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DailyHabitStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completions', models.IntegerField(default=0)),
+                ('misses', models.IntegerField(default=0)),
+                ('distinct_users', models.IntegerField(default=0)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='main_app.habit')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily habit stats',
+                'unique_together': {('habit', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:15
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_counters(apps, schema_editor):
+    UserHabit = apps.get_model('main_app', 'UserHabit')
+    HabitCompletion = apps.get_model('main_app', 'HabitCompletion')
+    MissedHabit = apps.get_model('main_app', 'MissedHabit')
+    HabitStreak = apps.get_model('main_app', 'HabitStreak')
+    HabitAnalytics = apps.get_model('main_app', 'HabitAnalytics')
+    
+    def per_habit(model, aggregate):
+        return Coalesce(Subquery(
+            model.objects.filter(user_habit=OuterRef('pk')).order_by().values('user_habit').annotate(
+                value=aggregate
+            ).values('value')
+        ), 0)
+    
+    UserHabit.objects.update(
+        completions_count=per_habit(HabitCompletion, Count('id')),
+        missed_count=per_habit(MissedHabit, Count('id')),
+        longest_streak=Greatest('streak', per_habit(HabitStreak, Max('streak_length')))
+    )
+    
+    def per_analytics(field):
+        return Coalesce(Subquery(
+            UserHabit.objects.filter(
+                user_id=OuterRef('user_id'), habit_id=OuterRef('habit_id')
+            ).order_by().values('user_id').annotate(value=Sum(field)).values('value')
+        ), 0)
+    
+    HabitAnalytics.objects.update(
+        completions_count=per_analytics('completions_count'),
+        missed_count=per_analytics('missed_count')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habitanalytics',
+            name='completions_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userhabit',
+            name='completions_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userhabit',
+            name='longest_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userhabit',
+            name='missed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
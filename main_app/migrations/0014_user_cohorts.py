@@ -0,0 +1,83 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:25
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_cohorts(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserCohort = apps.get_model('main_app', 'UserCohort')
+    CohortActivity = apps.get_model('main_app', 'CohortActivity')
+    DailyUserStats = apps.get_model('main_app', 'DailyUserStats')
+    
+    cohorts = {}
+    for user_id, date_joined in User.objects.values_list('id', 'date_joined').iterator():
+        joined = timezone.localdate(date_joined)
+        cohorts[user_id] = UserCohort(
+            user_id=user_id,
+            joined=joined,
+            cohort_week=joined - timedelta(days=joined.weekday()),
+            cohort_month=joined.replace(day=1)
+        )
+    
+    weeks = {}
+    for user_id, day in DailyUserStats.objects.filter(completions__gt=0).values_list('user_id', 'date').iterator():
+        cohort = cohorts.get(user_id)
+        if cohort is None or day < cohort.joined:
+            continue
+        offset = (day - cohort.joined).days
+        if cohort.first_active_day is None:
+            cohort.first_active_day = cohort.last_active_day = offset
+        cohort.first_active_day = min(cohort.first_active_day, offset)
+        cohort.last_active_day = max(cohort.last_active_day, offset)
+        span = weeks.setdefault((user_id, offset // 7), [offset, offset])
+        span[0], span[1] = min(span[0], offset), max(span[1], offset)
+    
+    UserCohort.objects.bulk_create(cohorts.values(), batch_size=500)
+    CohortActivity.objects.bulk_create(
+        (
+            CohortActivity(cohort_id=user_id, week=week, first_day=first, last_day=last)
+            for (user_id, week), (first, last) in weeks.items()
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('main_app', '0013_habit_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCohort',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cohort', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('joined', models.DateField()),
+                ('cohort_week', models.DateField(db_index=True)),
+                ('cohort_month', models.DateField(db_index=True)),
+                ('first_active_day', models.IntegerField(blank=True, null=True)),
+                ('last_active_day', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CohortActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.IntegerField()),
+                ('first_day', models.IntegerField()),
+                ('last_day', models.IntegerField()),
+                ('cohort', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='main_app.usercohort')),
+            ],
+            options={
+                'verbose_name_plural': 'Cohort activity',
+                'unique_together': {('cohort', 'week')},
+            },
+        ),
+        migrations.RunPython(backfill_cohorts, migrations.RunPython.noop),
+    ]
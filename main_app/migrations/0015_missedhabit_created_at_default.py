@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:58
+
+import main_app.models.base
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_user_cohorts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='missedhabit',
+            name='created_at',
+            field=models.DateTimeField(default=main_app.models.base.get_current_datetime),
+        ),
+    ]
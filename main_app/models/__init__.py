@@ -17,7 +17,9 @@ from .habit_models import (
 )
 
 # Analytics models
-from .analytics_models import HabitAnalytics
+from .analytics_models import (
+    HabitAnalytics, DailyUserStats, DailyHabitStats, UserCohort, CohortActivity
+)
 
 # Gamification models
 from .gamification_models import (
@@ -27,3 +29,6 @@ from .gamification_models import (
 
 # Redemption models
 from .redemption_models import Reward, Redemption
+
+# Scheduler models
+from .scheduler_models import SweepWatermark, BackgroundTask, SchedulerLease, JobRun
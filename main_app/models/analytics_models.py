@@ -2,7 +2,8 @@
 Analytics models for the Habit Tracker application.
 """
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from .base import get_uuid
 
@@ -14,6 +15,7 @@ class HabitAnalytics(models.Model):
     habit = models.ForeignKey('Habit', on_delete=models.CASCADE, related_name='analytics', to_field='id')
     longest_streak = models.IntegerField(default=0)
     missed_count = models.IntegerField(default=0)
+    completions_count = models.IntegerField(default=0)
     completion_rate = models.FloatField(default=0)  # Percentage of days completed
     last_calculated = models.DateTimeField(auto_now=True)
     
@@ -25,32 +27,112 @@ class HabitAnalytics(models.Model):
         return f"Analytics for {self.user.username}'s {self.habit.name}"
     
     def calculate_analytics(self):
-        """Calculate analytics for this habit"""
-        from .habit_models import HabitCompletion, MissedHabit
-        from django.db.models import Max, Count
-        from django.utils import timezone
-        import datetime
+        """Calculate analytics for this habit from its user habit's counters"""
+        from ..services.analytics_service import AnalyticsService
         
         # Get the user habit
-        user_habit = self.habit.users.filter(user=self.user).first()
+        user_habit = self.habit.users.filter(user=self.user).select_related('habit').first()
         if not user_habit:
             return
         
-        # Calculate longest streak
-        self.longest_streak = user_habit.streak
+        self.longest_streak = max(user_habit.longest_streak, user_habit.streak)
+        self.missed_count = user_habit.missed_count
+        self.completions_count = user_habit.completions_count
         
-        # Calculate missed count
-        self.missed_count = MissedHabit.objects.filter(user_habit=user_habit).count()
-        
-        # Calculate completion rate
-        start_date = user_habit.start_date
-        today = timezone.now().date()
-        days_since_start = (today - start_date).days + 1
-        completions = HabitCompletion.objects.filter(user_habit=user_habit).count()
-        
-        if days_since_start > 0:
-            self.completion_rate = (completions / days_since_start) * 100
-        else:
-            self.completion_rate = 0
+        # Completed periods over periods tracked, like every other path
+        self.completion_rate = AnalyticsService.calculate_completion_rate(user_habit)
             
         self.save()
+
+
+class DailyRollup(models.Model):
+    """
+    Base for per-day rollup rows. Counters are incremented as events land
+    and recomputed from the events by the nightly reconciliation.
+    """
+    date = models.DateField()
+    completions = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def increment(cls, day, counts, **key):
+        """
+        Add to the counters of one row in a single conditional UPDATE,
+        creating the row if it does not exist yet.
+        
+        Args:
+            day: Date of the row
+            counts: Dictionary of counter name to amount
+            **key: The rest of the row's key, e.g. user_id=1
+        """
+        rows = cls.objects.filter(date=day, **key)
+        changes = {name: F(name) + amount for name, amount in counts.items()}
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(date=day, **key, **counts)
+        except IntegrityError:
+            # Another event created the row first
+            rows.update(**changes)
+
+
+class DailyUserStats(DailyRollup):
+    """Per-user, per-day completions, misses and points earned"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    points = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'date']
+        verbose_name_plural = "Daily user stats"
+    
+    def __str__(self):
+        return f"{self.user.username} on {self.date}: {self.completions} completions"
+
+
+class DailyHabitStats(DailyRollup):
+    """Per-habit, per-day completions, misses and number of users completing it"""
+    habit = models.ForeignKey('Habit', on_delete=models.CASCADE, related_name='daily_stats', to_field='id')
+    distinct_users = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['habit', 'date']
+        verbose_name_plural = "Daily habit stats"
+    
+    def __str__(self):
+        return f"{self.habit.name} on {self.date}: {self.completions} completions"
+
+
+class UserCohort(models.Model):
+    """
+    A user's signup cohorts and the first and last days they were active,
+    counted in days since signup. Built incrementally by the nightly cohort
+    build from the daily user rollups.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='cohort')
+    joined = models.DateField()
+    cohort_week = models.DateField(db_index=True)  # Monday of the signup week
+    cohort_month = models.DateField(db_index=True)  # First day of the signup month
+    first_active_day = models.IntegerField(null=True, blank=True)
+    last_active_day = models.IntegerField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user.username} joined {self.joined}"
+
+
+class CohortActivity(models.Model):
+    """First and last active day of a user within one week since signup"""
+    cohort = models.ForeignKey(UserCohort, on_delete=models.CASCADE, related_name='activity')
+    week = models.IntegerField()  # 0 for the first seven days after signup
+    first_day = models.IntegerField()
+    last_day = models.IntegerField()
+    
+    class Meta:
+        unique_together = ['cohort', 'week']
+        verbose_name_plural = "Cohort activity"
+    
+    def __str__(self):
+        return f"{self.cohort.user.username} in week {self.week}: days {self.first_day}-{self.last_day}"
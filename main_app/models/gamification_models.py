@@ -2,8 +2,11 @@
 Gamification models for the Habit Tracker application.
 """
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .analytics_models import DailyUserStats
 from .base import get_uuid, get_current_datetime
 
 
@@ -58,9 +61,44 @@ class UserPoints(models.Model):
             description=description,
             reference_id=reference_id
         )
+        DailyUserStats.increment(timezone.localdate(), {'points': amount}, user_id=self.user_id)
         
         return level_changed, transaction
     
+    @classmethod
+    def credit(cls, user_id, amount, transaction_type, description, reference_id=None):
+        """
+        Add points without loading the row first: a conditional UPDATE that
+        also recomputes the level, plus the transaction record and the
+        day's points rollup.
+        
+        Returns:
+            The PointTransaction created
+        """
+        cls.add_to_total(user_id, amount)
+        DailyUserStats.increment(timezone.localdate(), {'points': amount}, user_id=user_id)
+        return PointTransaction.objects.create(
+            user_id=user_id,
+            amount=amount,
+            transaction_type=transaction_type,
+            description=description,
+            reference_id=reference_id
+        )
+    
+    @classmethod
+    def add_to_total(cls, user_id, amount):
+        """Add to a user's total and level in one conditional UPDATE, creating the row if needed"""
+        new_total = F('total_points') + amount
+        rows = cls.objects.filter(user_id=user_id)
+        if rows.update(total_points=new_total, level=1 + new_total / 1000):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, total_points=amount, level=1 + amount // 1000)
+        except IntegrityError:
+            # Another credit created the row first
+            rows.update(total_points=new_total, level=1 + new_total / 1000)
+    
     def calculate_level(self):
         """Calculate user level based on points"""
         # Simple level formula: level = 1 + points/1000
@@ -2,7 +2,9 @@
 Habit-related models for the Habit Tracker application.
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 from .base import get_uuid, get_current_date, get_current_datetime
@@ -51,6 +53,15 @@ class UserHabit(models.Model):
     is_active = models.BooleanField(default=True)
     start_date = models.DateField(default=get_current_date)
     last_completed = models.DateField(null=True, blank=True)
+    # One bit per period from period bitmap_origin on, derived from the
+    # completions and maintained by the streak engine (services.completion_bitmap)
+    completion_bitmap = models.BinaryField(default=b'', blank=True)
+    bitmap_origin = models.IntegerField(null=True, blank=True)
+    # Counters kept up to date with F() updates by the completion and miss
+    # paths and repaired by manage.py reconcile_counters (services.counters)
+    completions_count = models.IntegerField(default=0)
+    missed_count = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
     
     def increment_streak(self):
         """Increment the streak count"""
@@ -66,40 +77,32 @@ class UserHabit(models.Model):
         return f"{self.user.username}'s {self.habit.name}"
     
     def calculate_streak(self):
-        """Calculate the current streak based on completions"""
+        """
+        Calculate the streak ending at the most recent completed period from
+        all completions. Streaks are maintained incrementally by
+        services.streaks; this full walk is only used to repair them.
+        """
         from .habit_models import HabitCompletion
-        from datetime import timedelta
+        from ..services.periods import PERIODICITIES, completed_periods, period_index
         
-        # Get completions in descending order (most recent first)
-        completions = HabitCompletion.objects.filter(
-            user_habit=self
-        ).order_by('-completion_date')
+        # Like the streak engine, track habits without a valid periodicity daily
+        periodicity = self.habit.periodicity if self.habit.periodicity in PERIODICITIES else 'DAILY'
         
-        if not completions:
-            return 0
+        # One row per completed period, most recent first
+        period_starts = completed_periods(
+            HabitCompletion.objects.filter(user_habit=self), periodicity
+        ).order_by('-period_start').values_list('period_start', flat=True)
         
-        # Start with the most recent completion
-        streak = 1
-        last_date = completions[0].completion_date
-        
-        # Check for consecutive dates (depending on periodicity)
-        for i in range(1, len(completions)):
-            completion = completions[i]
-            expected_date = None
-            
-            if self.habit.periodicity == 'DAILY':
-                expected_date = last_date - timedelta(days=1)
-            elif self.habit.periodicity == 'WEEKLY':
-                expected_date = last_date - timedelta(days=7)
-            elif self.habit.periodicity == 'MONTHLY':
-                # Approximate for monthly
-                expected_date = last_date - timedelta(days=30)
-            
-            if completion.completion_date == expected_date:
-                streak += 1
-                last_date = completion.completion_date
-            else:
+        # Count back from the most recent completed period while the
+        # periods stay consecutive
+        streak = 0
+        expected_index = None
+        for start in period_starts.iterator():
+            index = period_index(periodicity, start)
+            if expected_index is not None and index != expected_index:
                 break
+            streak += 1
+            expected_index = index - 1
         
         return streak
 
@@ -126,8 +129,10 @@ class HabitCompletion(models.Model):
                 'completion_date': 'A completion record already exists for this habit on this date.'
             })
     
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, validate=True, **kwargs):
+        # CompletionService skips validation and relies on the unique constraint
+        if validate:
+            self.full_clean()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -182,12 +187,72 @@ class MissedHabit(models.Model):
         return f"{self.user_habit} missed on {self.missed_date}"
 
 
+def next_reminder_fire_time(reminder_time, reminder_date, timezone_name, after):
+    """
+    Compute when a reminder should fire next, as an aware UTC datetime.
+    
+    Args:
+        reminder_time: Local time of day the reminder fires at
+        reminder_date: Date of a one-off reminder, or None for a daily reminder
+        timezone_name: The user's timezone the reminder time is expressed in
+        after: Aware datetime; the result is strictly later than this
+    
+    Returns:
+        Aware UTC datetime, or None for a one-off reminder that already passed
+    """
+    try:
+        tz = ZoneInfo(timezone_name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = ZoneInfo('UTC')
+    
+    if reminder_date:
+        fire_at = datetime.combine(reminder_date, reminder_time, tzinfo=tz)
+        return fire_at.astimezone(dt_timezone.utc) if fire_at > after else None
+    
+    local_date = after.astimezone(tz).date()
+    fire_at = datetime.combine(local_date, reminder_time, tzinfo=tz)
+    if fire_at <= after:
+        fire_at = datetime.combine(local_date + timedelta(days=1), reminder_time, tzinfo=tz)
+    return fire_at.astimezone(dt_timezone.utc)
+
+
 class Reminder(models.Model):
     """Reminders for habit completion"""
     id = models.CharField(primary_key=True, max_length=36, default=get_uuid)
     user_habit = models.ForeignKey(UserHabit, on_delete=models.CASCADE, related_name='reminders', to_field='id')
     reminder_time = models.TimeField()
     reminder_date = models.DateField(null=True, blank=True)
+    # Next time the reminder is due in UTC; None once a one-off reminder has fired
+    next_fire_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    def compute_next_fire_at(self, after=None):
+        """Return the next fire time after ``after`` (default: now) in the user's timezone"""
+        user = self.user_habit.user
+        try:
+            timezone_name = user.profile.timezone
+        except ObjectDoesNotExist:
+            timezone_name = 'UTC'
+        
+        return next_reminder_fire_time(
+            self._meta.get_field('reminder_time').to_python(self.reminder_time),
+            self._meta.get_field('reminder_date').to_python(self.reminder_date),
+            timezone_name,
+            after or get_current_datetime()
+        )
+    
+    def save(self, *args, **kwargs):
+        # Reschedule on every full save so time, date and timezone edits take effect
+        if kwargs.get('update_fields') is None:
+            self.next_fire_at = self.compute_next_fire_at()
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def reschedule_for_user(cls, user):
+        """Recompute next_fire_at for all of a user's reminders, e.g. after a timezone change"""
+        reminders = cls.objects.filter(user_habit__user=user).select_related('user_habit__user__profile')
+        for reminder in reminders:
+            reminder.next_fire_at = reminder.compute_next_fire_at()
+        cls.objects.bulk_update(reminders, ['next_fire_at'])
     
     def __str__(self):
         date_info = f" on {self.reminder_date}" if self.reminder_date else " (recurring)"
@@ -0,0 +1,120 @@
+"""
+Models backing the background scheduler of the Habit Tracker application.
+"""
+
+import json
+from django.db import models
+from .base import get_current_datetime
+
+
+class SweepWatermark(models.Model):
+    """
+    Last fully processed period of the missed-habit sweep for one periodicity.
+    Staggered sweeps keep one watermark per timezone; an empty timezone is
+    the watermark of sweeps covering every user.
+    """
+    PERIODICITY_CHOICES = [
+        ('DAILY', 'Daily'),
+        ('WEEKLY', 'Weekly'),
+        ('MONTHLY', 'Monthly'),
+    ]
+    
+    periodicity = models.CharField(max_length=10, choices=PERIODICITY_CHOICES)
+    timezone = models.CharField(max_length=50, blank=True, default='')
+    last_processed_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['periodicity', 'timezone']
+    
+    def __str__(self):
+        scope = f" ({self.timezone})" if self.timezone else ""
+        return f"{self.get_periodicity_display()} sweep{scope} processed through {self.last_processed_date}"
+
+
+class BackgroundTask(models.Model):
+    """
+    A unit of deferred work in the database-backed task queue.
+    
+    A worker claims a task by setting locked_until; if the worker dies the
+    task becomes claimable again once that visibility timeout has passed.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    _payload = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    available_at = models.DateTimeField(default=get_current_datetime)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+    
+    @property
+    def payload(self):
+        if not self._payload:
+            return {}
+        return json.loads(self._payload)
+    
+    @payload.setter
+    def payload(self, value):
+        self._payload = json.dumps(value)
+
+
+class SchedulerLease(models.Model):
+    """
+    Cluster-wide lease deciding which process runs the scheduled jobs.
+    
+    The holder renews expires_at with every heartbeat; once it lapses any
+    other process may take the lease over.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=100, blank=True, default='')
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(default=get_current_datetime)
+    
+    def __str__(self):
+        if not self.holder:
+            return f"{self.name} lease (free)"
+        return f"{self.name} lease held by {self.holder} until {self.expires_at}"
+
+
+class JobRun(models.Model):
+    """Resource usage of one run of a scheduled job"""
+    job_name = models.CharField(max_length=100)
+    started_at = models.DateTimeField(default=get_current_datetime)
+    duration = models.FloatField(default=0)  # Seconds
+    queries = models.IntegerField(default=0)
+    # Rows returned by SELECTs, where the database reports them (not SQLite)
+    rows_read = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    peak_memory = models.BigIntegerField(default=0)  # Bytes, as seen by tracemalloc
+    succeeded = models.BooleanField(default=True)
+    error = models.TextField(blank=True, default='')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['job_name', 'started_at']),
+            models.Index(fields=['started_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.job_name} at {self.started_at} ({self.duration:.2f}s)"
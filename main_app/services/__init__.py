@@ -7,5 +7,6 @@ Services package for the Habit Tracker application.
 # Import main services for convenience
 from .points.points_service import PointsService
 from .notification_service import NotificationService
+from .completion_service import CompletionService
 from .achievements import AchievementService
 from .events import EventSystem, EventTypes
@@ -9,7 +9,7 @@ from django.db import transaction, models
 from django.utils import timezone
 
 from ...models import (
-    Achievement, UserAchievement, HabitCompletion, UserHabit, HabitStreak
+    Achievement, UserAchievement, UserHabit
 )
 from ..points.points_service import PointsService
 from .achievement_strategies import AchievementStrategyFactory
@@ -157,17 +157,13 @@ class AchievementService:
             }
     
     def _get_habit_completion_count(self, user: User) -> int:
-        """Get total habit completions for a user"""
-        return HabitCompletion.objects.filter(user_habit__user=user).count()
+        """Get total habit completions for a user, from the habits' counters"""
+        return UserHabit.objects.filter(user=user).aggregate(
+            total=models.Sum('completions_count', default=0)
+        )['total']
     
     def _get_max_streak(self, user: User) -> int:
-        """Get the user's maximum streak"""
-        # Check current streaks
-        current_max = UserHabit.objects.filter(user=user).aggregate(models.Max('streak'))
-        current_max_streak = current_max.get('streak__max', 0) or 0
-        
-        # Check historical streaks
-        historical_max = HabitStreak.objects.filter(user_habit__user=user).aggregate(models.Max('streak_length'))
-        historical_max_streak = historical_max.get('streak_length__max', 0) or 0
-        
-        return max(current_max_streak, historical_max_streak)
+        """Get the user's maximum streak, current or historical, from the habits' counters"""
+        return UserHabit.objects.filter(user=user).aggregate(
+            longest=models.Max('longest_streak', default=0)
+        )['longest']
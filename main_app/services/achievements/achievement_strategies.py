@@ -4,7 +4,8 @@ Implements Strategy and Factory patterns.
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 from django.contrib.auth.models import User
-from ...models import Achievement, HabitCompletion, UserHabit, HabitStreak
+from django.db.models import Sum
+from ...models import Achievement, UserHabit
 
 class AchievementStrategy(ABC):
     """Base class for achievement checking strategies"""
@@ -21,14 +22,15 @@ class HabitCompletionCountStrategy(AchievementStrategy):
         required_count = context.get('required_count', 0)
         habit_type = context.get('habit_type')
         
-        # Query to get completion count
-        completions_query = HabitCompletion.objects.filter(user_habit__user=user)
+        # Completions are counted on each habit
+        habits_query = UserHabit.objects.filter(user=user)
         
         # Filter by habit type if specified
         if habit_type:
-            completions_query = completions_query.filter(user_habit__habit__type=habit_type)
+            habits_query = habits_query.filter(habit__type=habit_type)
             
-        return completions_query.count() >= required_count
+        total = habits_query.aggregate(total=Sum('completions_count', default=0))['total']
+        return total >= required_count
 
 class StreakStrategy(AchievementStrategy):
     """Strategy for achievements based on habit streaks"""
@@ -37,15 +39,15 @@ class StreakStrategy(AchievementStrategy):
         required_streak = context.get('required_streak', 0)
         habit_type = context.get('habit_type')
         
-        # Query to get streak information
-        streaks_query = HabitStreak.objects.filter(user_habit__user=user)
+        # Each habit keeps its longest streak as a counter
+        habits_query = UserHabit.objects.filter(user=user)
         
         # Filter by habit type if specified
         if habit_type:
-            streaks_query = streaks_query.filter(user_habit__habit__type=habit_type)
+            habits_query = habits_query.filter(habit__type=habit_type)
             
         # Check if any streak meets the requirement
-        return streaks_query.filter(current_streak__gte=required_streak).exists()
+        return habits_query.filter(longest_streak__gte=required_streak).exists()
 
 class HabitDiversityStrategy(AchievementStrategy):
     """Strategy for achievements based on maintaining multiple habits"""
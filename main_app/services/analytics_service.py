@@ -1,12 +1,23 @@
 from main_app.models.habit_models import HabitStreak
-from ..models import UserProfile, HabitCompletion, UserHabit, LeaderboardEntry, HabitAnalytics, MissedHabit
-from django.db.models import Count, Avg, Max, Q
+from ..models import UserProfile, HabitCompletion, UserHabit, LeaderboardEntry, HabitAnalytics, MissedHabit, DailyUserStats
+from django.db.models import Count, Sum, Avg, Max, Q
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .completion_bitmap import CompletionBitmap
+from .counters import repair_missed_counts
+from .periods import count_periods
+from .streaks import rebuild_streak_history
+from .sharding import shard_filter, shard_pool, map_shards
 import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Habits recalculated per batch by recalculate_all_analytics
+ANALYTICS_BATCH_SIZE = 500
+
+
 class AnalyticsService:
     """Service to handle analytics while respecting user privacy settings"""
     
@@ -84,16 +95,15 @@ class AnalyticsService:
         # Filter users based on privacy settings
         users = cls.filter_users_by_privacy(User.objects.all(), visibility)
         
-        # Get completions for these users
-        completions = HabitCompletion.objects.filter(
-            user_habit__user__in=users
-        )
-        
-        # Calculate totals
+        # Calculate totals; completions come from the daily rollup
         today = datetime.date.today()
         total_habits = UserHabit.objects.filter(user__in=users).count()
-        habits_completed_today = completions.filter(completion_date=today).count()
-        total_completions = completions.count()
+        completions = DailyUserStats.objects.filter(user__in=users).aggregate(
+            today=Sum('completions', filter=Q(date=today), default=0),
+            total=Sum('completions', default=0)
+        )
+        habits_completed_today = completions['today']
+        total_completions = completions['total']
         
         # Get streak stats
         max_streak = UserHabit.objects.filter(user__in=users).aggregate(max_streak=Max('streak'))
@@ -123,26 +133,18 @@ class AnalyticsService:
             habit=habit
         )
         
-        # Update longest streak if current streak is longer
-        if user_habit.streak > analytics.longest_streak:
-            analytics.longest_streak = user_habit.streak
-            
-        # Get the completion rate
-        total_days = AnalyticsService._calculate_total_tracking_days(user_habit)
-        completed_days = HabitCompletion.objects.filter(
-            user_habit=user_habit
-        ).count()
-        
-        if total_days > 0:
-            completion_rate = (completed_days / total_days) * 100
-            analytics.completion_rate = round(completion_rate, 2)
+        # Copy the habit's counters
+        analytics.longest_streak = max(analytics.longest_streak, user_habit.longest_streak, user_habit.streak)
+        analytics.completions_count = user_habit.completions_count
             
+        analytics.completion_rate = AnalyticsService.calculate_completion_rate(user_habit)
         analytics.save()
         
-        # Log for debugging
-        print(f"Updated analytics for {user.username}'s habit '{habit.name}': "
-              f"longest_streak={analytics.longest_streak}, "
-              f"missed_count={analytics.missed_count}")
+        logger.debug(
+            f"Updated analytics for {user.username}'s habit '{habit.name}': "
+            f"longest_streak={analytics.longest_streak}, "
+            f"missed_count={analytics.missed_count}"
+        )
     
     @staticmethod
     def update_analytics_for_missed_habit(user_habit):
@@ -159,58 +161,53 @@ class AnalyticsService:
             habit=habit
         )
         
-        # Increment missed count
-        analytics.missed_count += 1
-        
-        # Recalculate completion rate
-        total_days = AnalyticsService._calculate_total_tracking_days(user_habit)
-        completed_days = HabitCompletion.objects.filter(
-            user_habit=user_habit
-        ).count()
-        
-        if total_days > 0:
-            completion_rate = (completed_days / total_days) * 100
-            analytics.completion_rate = round(completion_rate, 2)
+        # The miss path has already counted the miss on the habit
+        analytics.missed_count = user_habit.missed_count
         
+        analytics.completion_rate = AnalyticsService.calculate_completion_rate(user_habit)
         analytics.save()
         
-        # Log for debugging
-        print(f"Updated analytics for {user.username}'s habit '{habit.name}' after miss: "
-              f"missed_count={analytics.missed_count}, "
-              f"completion_rate={analytics.completion_rate}%")
+        logger.debug(
+            f"Updated analytics for {user.username}'s habit '{habit.name}' after miss: "
+            f"missed_count={analytics.missed_count}, "
+            f"completion_rate={analytics.completion_rate}%"
+        )
     
     @staticmethod
-    def _calculate_total_tracking_days(user_habit):
-        """Calculate the total number of days since habit tracking began"""
-        start_date = user_habit.start_date
-        today = datetime.now().date()
-        
-        # Calculate days based on periodicity
-        if user_habit.habit.periodicity == 'DAILY':
-            # For daily habits, it's just the number of days since start
-            delta = today - start_date
-            return max(1, delta.days + 1)  # Include today
-            
-        elif user_habit.habit.periodicity == 'WEEKLY':
-            # For weekly habits, count the number of weeks
-            delta = today - start_date
-            weeks = delta.days // 7 + 1  # Include current week
-            return max(1, weeks)
-            
-        elif user_habit.habit.periodicity == 'MONTHLY':
-            # For monthly habits, count the number of months
-            months = (today.year - start_date.year) * 12 + today.month - start_date.month
-            if today.day >= start_date.day:
-                months += 1  # Include current month if we've passed the start day
-            return max(1, months)
-            
-        return 1  # Default fallback
+    def _calculate_total_tracking_days(user_habit, today=None):
+        """
+        Calculate the number of periods (days, weeks or months, depending on
+        periodicity) since habit tracking began, including the current one
+        """
+        today = today or timezone.now().date()
+        
+        try:
+            return max(1, count_periods(user_habit.habit.periodicity, user_habit.start_date, today))
+        except ValueError:
+            return 1  # Default fallback for unknown periodicities
+    
+    @staticmethod
+    def calculate_completion_rate(user_habit, today=None):
+        """
+        Percentage of the periods since habit tracking began, including the
+        current one, in which the habit was completed. Read from the
+        completion bitmap, so the habit should be loaded with its habit.
+        """
+        today = today or timezone.now().date()
+        bitmap = CompletionBitmap.for_user_habit(user_habit)
+        total_periods = AnalyticsService._calculate_total_tracking_days(user_habit, today)
+        return round(bitmap.completed_periods(user_habit.start_date, today) / total_periods * 100, 2)
     
     @staticmethod
-    def recalculate_analytics(user_habit):
+    def recalculate_analytics(user_habit, rebuild_streaks=True):
         """
         Recalculate all analytics for a user habit based on historical data
         This can fix analytics that have gotten out of sync
+        
+        Args:
+            user_habit: The UserHabit to recalculate
+            rebuild_streaks: Rebuild the streak and streak history from the
+                completions first; pass False if that was just done
         """
         user = user_habit.user
         habit = user_habit.habit
@@ -221,70 +218,160 @@ class AnalyticsService:
             habit=habit
         )
         
-        # Calculate longest streak from streak history
-        max_streak_from_history = HabitStreak.objects.filter(
-            user_habit=user_habit
-        ).aggregate(Max('streak_length'))['streak_length__max'] or 0
-        
-        # If current streak is longer than any historical streak, use that
-        analytics.longest_streak = max(max_streak_from_history, user_habit.streak)
-        
-        # Count missed days
-        analytics.missed_count = MissedHabit.objects.filter(
-            user_habit=user_habit
-        ).count()
-        
-        # Calculate completion rate
-        total_days = AnalyticsService._calculate_total_tracking_days(user_habit)
-        completed_days = HabitCompletion.objects.filter(
-            user_habit=user_habit
-        ).count()
-        
-        if total_days > 0:
-            completion_rate = (completed_days / total_days) * 100
-            analytics.completion_rate = round(completion_rate, 2)
-        else:
-            analytics.completion_rate = 0
-            
+        # Repair the streak history and the counters before trusting them
+        if rebuild_streaks:
+            rebuild_streak_history([user_habit.pk])
+            repair_missed_counts([user_habit.pk])
+            user_habit.refresh_from_db(fields=[
+                'streak', 'last_completed', 'completion_bitmap', 'bitmap_origin',
+                'completions_count', 'missed_count', 'longest_streak'
+            ])
+        
+        # Longest streak and completed periods come from the completion bitmap
+        bitmap = CompletionBitmap.for_user_habit(user_habit)
+        analytics.longest_streak = max(bitmap.longest_streak(), user_habit.streak)
+        analytics.missed_count = user_habit.missed_count
+        analytics.completions_count = user_habit.completions_count
+        
+        analytics.completion_rate = AnalyticsService.calculate_completion_rate(user_habit)
         analytics.save()
         
-        # Log what was updated
-        print(f"Recalculated analytics for {user.username}'s habit '{habit.name}': "
-              f"longest_streak={analytics.longest_streak}, "
-              f"missed_count={analytics.missed_count}, "
-              f"completion_rate={analytics.completion_rate}%")
+        logger.debug(
+            f"Recalculated analytics for {user.username}'s habit '{habit.name}': "
+            f"longest_streak={analytics.longest_streak}, "
+            f"missed_count={analytics.missed_count}, "
+            f"completion_rate={analytics.completion_rate}%"
+        )
         
         return analytics
     
     @staticmethod
-    def recalculate_all_analytics():
+    def recalculate_analytics_bulk(user_habit_ids, today=None, rebuild_streaks=True):
+        """
+        Recalculate the analytics of many user habits with a fixed number of
+        queries: a streak history rebuild and a miss recount that repair the
+        habits' counters, one load and one upsert of the HabitAnalytics rows.
+        
+        Args:
+            user_habit_ids: The UserHabits to recalculate
+            today: Last day of the completion rate
+            rebuild_streaks: Rebuild the streaks and recount the misses first;
+                pass False if that was just done
+        
+        Returns:
+            List of (user_habit, analytics) pairs; analytics are HabitAnalytics
+            instances holding the values written
+        """
+        today = today or timezone.now().date()
+        user_habit_ids = list(user_habit_ids)
+        if rebuild_streaks:
+            rebuild_streak_history(user_habit_ids, today)
+            repair_missed_counts(user_habit_ids)
+        
+        results = {}
+        user_habits = UserHabit.objects.filter(id__in=user_habit_ids).select_related('habit')
+        for user_habit in user_habits:
+            bitmap = CompletionBitmap.for_user_habit(user_habit)
+            analytics = HabitAnalytics(
+                user_id=user_habit.user_id,
+                habit_id=user_habit.habit_id,
+                longest_streak=max(bitmap.longest_streak(), user_habit.streak),
+                missed_count=user_habit.missed_count,
+                completions_count=user_habit.completions_count,
+                completion_rate=AnalyticsService.calculate_completion_rate(user_habit, today)
+            )
+            # Analytics are kept per user and habit
+            results[user_habit.user_id, user_habit.habit_id] = (user_habit, analytics)
+        
+        HabitAnalytics.objects.bulk_create(
+            [analytics for _, analytics in results.values()],
+            update_conflicts=True,
+            unique_fields=['user', 'habit'],
+            update_fields=['longest_streak', 'missed_count', 'completions_count', 'completion_rate', 'last_calculated'],
+            batch_size=500
+        )
+        return list(results.values())
+    
+    @staticmethod
+    def recalculate_all_analytics(shard_index=None, shard_count=None, batch_size=ANALYTICS_BATCH_SIZE,
+                                  progress=None, today=None):
         """
         Recalculate analytics for all user habits
         This is useful for fixing analytics data across the entire application
-        """
-        user_habits = UserHabit.objects.all()
-        results = []
         
-        for user_habit in user_habits:
+        Streams through the habits in primary key order a batch at a time;
+        each batch is recalculated by recalculate_analytics_bulk in its own
+        transaction, so a failing batch is rolled back and skipped.
+        
+        Args:
+            shard_index: Optional shard to restrict the run to
+            shard_count: Total number of shards when shard_index is given
+            batch_size: Habits per batch
+            progress: Optional callable receiving the running totals after each batch
+        
+        Returns:
+            Totals of processed, succeeded and failed habits
+        """
+        today = today or timezone.now().date()
+        user_habits = UserHabit.objects.order_by('id')
+        if shard_count:
+            user_habits = shard_filter(user_habits, shard_index, shard_count)
+        totals = {'processed': 0, 'succeeded': 0, 'failed': 0}
+        
+        last_id = None
+        while True:
+            batch = user_habits if last_id is None else user_habits.filter(id__gt=last_id)
+            ids = list(batch.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            
             try:
-                analytics = AnalyticsService.recalculate_analytics(user_habit)
-                results.append({
-                    'user_habit': user_habit,
-                    'analytics': analytics,
-                    'success': True
-                })
+                with transaction.atomic():
+                    AnalyticsService.recalculate_analytics_bulk(ids, today)
+                totals['succeeded'] += len(ids)
             except Exception as e:
-                results.append({
-                    'user_habit': user_habit,
-                    'error': str(e),
-                    'success': False
-                })
+                logger.error(f"Failed to recalculate analytics for {len(ids)} habits after {ids[0]}: {str(e)}")
+                totals['failed'] += len(ids)
+            totals['processed'] += len(ids)
+            if progress:
+                progress(totals)
+        
+        logger.info(f"Recalculated analytics for {totals['succeeded']}/{totals['processed']} habits successfully")
+        return totals
+    
+    @staticmethod
+    def recalculate_analytics_shard(shard_index, shard_count):
+        """Pool worker: recalculate one shard and return its row counts"""
+        totals = AnalyticsService.recalculate_all_analytics(shard_index, shard_count)
+        return {
+            'processed': totals['processed'],
+            'succeeded': totals['succeeded'],
+        }
+    
+    @staticmethod
+    def recalculate_all_analytics_sharded(shard_count, max_workers=None):
+        """
+        Recalculate analytics for all user habits across a pool of worker processes
         
-        # Log summary
-        success_count = sum(1 for r in results if r['success'])
-        print(f"Recalculated analytics for {success_count}/{len(results)} habits successfully")
+        Args:
+            shard_count: Number of partitions of the users
+            max_workers: Worker processes to use (0 runs every shard in this process)
         
-        return results
+        Returns:
+            Summary with total and per-shard row counts
+        """
+        with shard_pool(shard_count, max_workers) as pool:
+            shard_results = map_shards(
+                pool, AnalyticsService.recalculate_analytics_shard, shard_count
+            )
+        
+        return {
+            'shards': shard_count,
+            'processed': sum(r['processed'] for r in shard_results),
+            'succeeded': sum(r['succeeded'] for r in shard_results),
+            'per_shard': shard_results,
+        }
         
     @staticmethod
     def troubleshoot_habit_analytics(user_habit):
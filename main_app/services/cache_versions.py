@@ -0,0 +1,30 @@
+"""
+Versioned cache keys.
+
+A version counter in the cache invalidates everything derived from some data
+in one write: readers put the current version in their cache keys or ETags,
+and bumping it leaves the old entries to expire unread. Writers and readers
+are usually different processes, so this relies on the cache being shared
+between them (see CACHES in the settings).
+"""
+
+import time
+from django.core.cache import cache
+
+
+def cache_version(key):
+    """The current value of the version counter stored under ``key``"""
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a version lost with the cache is never reused
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(key):
+    """Move the version counter stored under ``key`` on"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
@@ -0,0 +1,183 @@
+"""
+Signup cohorts.
+
+Every user has a UserCohort row holding their signup week and month and the
+first and last days they were active, as days since signup, and one
+CohortActivity row per week since signup in which they were active. A day
+counts as active when the user completed a habit on it (a DailyUserStats row
+with completions).
+
+The nightly ``build_cohorts`` job maintains both incrementally: it adds the
+cohort rows of new users and folds the last few days of daily rollups into
+the activity, so the retention matrix (``EngagementMetrics.retention_matrix``)
+is one grouped query over these tables. Folding is idempotent, so days that
+are rebuilt twice are harmless. The matrices cached by web workers are
+dropped once a build commits in the scheduler by bumping a cache version
+(see services.cache_versions).
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from ..models import CohortActivity, DailyUserStats, User, UserCohort
+from .cache_versions import bump_cache_version, cache_version
+
+logger = logging.getLogger(__name__)
+
+# Days of activity folded in by the nightly build, ending yesterday; covers
+# a few missed nights and the rollup reconciliation
+COHORT_BUILD_DAYS = 7
+
+COHORT_BATCH_SIZE = 500
+
+_VERSION_KEY = 'cohorts:version'
+
+
+def cohort_version():
+    """The current cohort build version; cached matrices are keyed on it"""
+    return cache_version(_VERSION_KEY)
+
+
+def bump_cohort_version():
+    """Invalidate the cached retention matrices"""
+    bump_cache_version(_VERSION_KEY)
+
+
+def new_cohort(user_id, date_joined):
+    """The UserCohort of a user, without any activity yet"""
+    joined = timezone.localdate(date_joined)
+    return UserCohort(
+        user_id=user_id,
+        joined=joined,
+        cohort_week=joined - timedelta(days=joined.weekday()),
+        cohort_month=joined.replace(day=1)
+    )
+
+
+def add_new_cohorts(batch_size=COHORT_BATCH_SIZE):
+    """
+    Create the cohort rows of users who do not have one yet.
+
+    Returns:
+        Number of cohort rows created
+    """
+    created = 0
+    while True:
+        users = list(
+            User.objects.filter(cohort__isnull=True).order_by('id').values_list('id', 'date_joined')[:batch_size]
+        )
+        if not users:
+            return created
+        UserCohort.objects.bulk_create(
+            [new_cohort(user_id, date_joined) for user_id, date_joined in users],
+            ignore_conflicts=True
+        )
+        created += len(users)
+
+
+def _fold_activity(user_ids, first_day, last_day):
+    """
+    Fold the active days of a batch of users between two dates into their
+    cohort and weekly activity rows.
+
+    Returns:
+        Number of users with activity in the range
+    """
+    active = defaultdict(list)
+    for user_id, day in DailyUserStats.objects.filter(
+        user_id__in=user_ids, date__range=(first_day, last_day), completions__gt=0
+    ).values_list('user_id', 'date'):
+        active[user_id].append(day)
+
+    cohorts = UserCohort.objects.in_bulk(list(active))
+    changed = []
+    weeks = {}
+    for user_id, days in active.items():
+        cohort = cohorts.get(user_id)
+        if cohort is None:
+            continue
+        offsets = [(day - cohort.joined).days for day in days if day >= cohort.joined]
+        if not offsets:
+            continue
+
+        first, last = min(offsets), max(offsets)
+        if cohort.first_active_day is not None:
+            first = min(first, cohort.first_active_day)
+            last = max(last, cohort.last_active_day)
+        if (first, last) != (cohort.first_active_day, cohort.last_active_day):
+            cohort.first_active_day, cohort.last_active_day = first, last
+            changed.append(cohort)
+
+        for offset in offsets:
+            span = weeks.setdefault((user_id, offset // 7), [offset, offset])
+            span[0], span[1] = min(span[0], offset), max(span[1], offset)
+
+    # Merge with the days already recorded for the same weeks
+    for record in CohortActivity.objects.filter(
+        cohort_id__in={user_id for user_id, _ in weeks},
+        week__in={week for _, week in weeks}
+    ).values_list('cohort_id', 'week', 'first_day', 'last_day'):
+        span = weeks.get(record[:2])
+        if span:
+            span[0], span[1] = min(span[0], record[2]), max(span[1], record[3])
+
+    CohortActivity.objects.bulk_create(
+        [
+            CohortActivity(cohort_id=user_id, week=week, first_day=first, last_day=last)
+            for (user_id, week), (first, last) in weeks.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['cohort', 'week'],
+        update_fields=['first_day', 'last_day']
+    )
+    UserCohort.objects.bulk_update(changed, ['first_active_day', 'last_active_day'])
+    return len(cohorts)
+
+
+def build_cohorts(days=COHORT_BUILD_DAYS, today=None, batch_size=COHORT_BATCH_SIZE, progress=None):
+    """
+    Nightly job: add the cohorts of new users and fold the activity of the
+    last ``days`` days before today into the cohort tables, a batch of active
+    users at a time.
+
+    Args:
+        days: Days of activity to fold in; None for the whole history
+        progress: Optional callable receiving the running totals after each batch
+
+    Returns:
+        Totals of cohort rows created and active users folded in
+    """
+    today = today or timezone.localdate()
+    last_day = today - timedelta(days=1)
+    if days is None:
+        first_day = DailyUserStats.objects.aggregate(first=Min('date'))['first'] or today
+    else:
+        first_day = today - timedelta(days=days)
+
+    totals = {'cohorts': add_new_cohorts(batch_size), 'users': 0}
+
+    active_users = DailyUserStats.objects.filter(
+        date__range=(first_day, last_day), completions__gt=0
+    ).order_by('user_id').values_list('user_id', flat=True).distinct()
+    last_id = None
+    while True:
+        batch = active_users if last_id is None else active_users.filter(user_id__gt=last_id)
+        user_ids = list(batch[:batch_size])
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+
+        with transaction.atomic():
+            totals['users'] += _fold_activity(user_ids, first_day, last_day)
+        if progress:
+            progress(totals)
+
+    bump_cohort_version()
+    logger.info(
+        f"Built cohorts through {last_day}: {totals['cohorts']} new, "
+        f"{totals['users']} active users since {first_day}"
+    )
+    return totals
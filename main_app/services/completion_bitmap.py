@@ -0,0 +1,136 @@
+"""
+Completion bitmaps.
+
+Every UserHabit carries a compact copy of its completion history derived from
+its HabitCompletion rows: one bit per period (see services.periods), bit 0
+being period ``bitmap_origin`` (the first completed one), set when the habit
+was completed in that period. Missed periods and periods outside the stored
+range are 0 bits, so a miss needs no write.
+
+The streak engine keeps the bitmap in sync on every completion and rewrites
+it whenever it rebuilds a streak. A year of daily history is 46 bytes on the
+habit row, so heatmaps, streaks, completion rates and "completed this
+period?" checks need no HabitCompletion query.
+"""
+
+import numpy as np
+from .periods import PERIODICITIES, period_index
+
+
+def decode(bitmap):
+    """Bitmap bytes (little-endian) to an int whose bit n is period origin + n"""
+    return int.from_bytes(bytes(bitmap or b''), 'little')
+
+
+def encode(value):
+    """Inverse of ``decode``"""
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def build_bitmap(indices):
+    """
+    Build a bitmap from period indices, in any order and with repeats.
+
+    Returns:
+        (bitmap, origin); (b'', None) when there are no indices
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if not len(indices):
+        return b'', None
+    origin = int(indices.min())
+    flags = np.zeros(int(indices.max()) - origin + 1, dtype=bool)
+    flags[indices - origin] = True
+    return np.packbits(flags, bitorder='little').tobytes(), origin
+
+
+def add_period(bitmap, origin, index):
+    """
+    Set the bit of period ``index``, moving the origin back if it is earlier.
+
+    Returns:
+        (bitmap, origin)
+    """
+    if origin is None:
+        return b'\x01', index
+    value = decode(bitmap)
+    if index < origin:
+        return encode(value << (origin - index) | 1), index
+    return encode(value | 1 << (index - origin)), origin
+
+
+class CompletionBitmap:
+    """Read-only view of a habit's completion bitmap"""
+
+    def __init__(self, periodicity, bitmap, origin):
+        self.periodicity = periodicity if periodicity in PERIODICITIES else 'DAILY'
+        self.value = decode(bitmap)
+        self.origin = origin
+
+    @classmethod
+    def for_user_habit(cls, user_habit):
+        """The bitmap of a UserHabit, ideally loaded with its habit"""
+        return cls(user_habit.habit.periodicity, user_habit.completion_bitmap, user_habit.bitmap_origin)
+
+    def _offset(self, day):
+        """Bit position of the period containing ``day`` (negative before the origin)"""
+        if self.origin is None:
+            return -1
+        return period_index(self.periodicity, day) - self.origin
+
+    def is_completed(self, day):
+        """Whether the habit was completed in the period containing ``day``"""
+        offset = self._offset(day)
+        return offset >= 0 and bool(self.value >> offset & 1)
+
+    def completed_periods(self, first_day, last_day):
+        """Number of completed periods from the one containing first_day to the one containing last_day"""
+        low = max(self._offset(first_day), 0)
+        high = self._offset(last_day)
+        if high < low:
+            return 0
+        return (self.value >> low & (1 << (high - low + 1)) - 1).bit_count()
+
+    def completion_rate(self, first_day, last_day):
+        """Percentage of the periods between the two days that were completed"""
+        periods = period_index(self.periodicity, last_day) - period_index(self.periodicity, first_day) + 1
+        if periods <= 0:
+            return 0
+        return round(self.completed_periods(first_day, last_day) / periods * 100, 2)
+
+    def slice(self, first_day, last_day):
+        """
+        Completion flags of the periods between the two days, e.g. for heatmaps.
+
+        Returns:
+            List of (period_index, completed) pairs in period order
+        """
+        first = period_index(self.periodicity, first_day)
+        last = period_index(self.periodicity, last_day)
+        origin = first if self.origin is None else self.origin
+        return [
+            (index, index >= origin and bool(self.value >> (index - origin) & 1))
+            for index in range(first, last + 1)
+        ]
+
+    def _run_ending_at(self, offset):
+        """Length of the run of completed periods ending at bit ``offset``"""
+        if offset < 0 or not self.value >> offset & 1:
+            return 0
+        gaps = ~self.value & (1 << (offset + 1)) - 1
+        return offset - gaps.bit_length() + 1
+
+    def current_streak(self, today):
+        """
+        The streak as of ``today``: the run ending in the current period, or
+        in the previous one while the current period is still open.
+        """
+        offset = self._offset(today)
+        return self._run_ending_at(offset) or self._run_ending_at(offset - 1)
+
+    def longest_streak(self):
+        """Length of the longest run of completed periods"""
+        value, longest = self.value, 0
+        while value:
+            value &= value >> 1
+            longest += 1
+        return longest
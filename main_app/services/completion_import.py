@@ -0,0 +1,275 @@
+"""
+Bulk completion import.
+
+Imports and backfills (e.g. migrating from another tracker or replaying
+offline data) validate rows in memory and insert them with ``bulk_create``,
+which skips the per-row HabitCompletion signals. Streaks, HabitStreak
+history, daily rollups, analytics and the points ledger are then brought up
+to date once per affected habit instead of once per row.
+
+Each row is a dict with a ``completion_date`` (YYYY-MM-DD) and either a
+``user_habit_id`` or a ``username`` and ``habit`` name.
+"""
+
+import bisect
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import islice
+from django.db import transaction
+from django.utils import timezone
+from ..models import UserHabit, HabitCompletion, PointTransaction, UserPoints
+from .analytics_service import AnalyticsService
+from .completion_service import CompletionService
+from .periods import day_start, period_index
+from .rollups import refresh_rollups
+from .streaks import rebuild_streak_history
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+
+# Invalid rows beyond this are counted but not described
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class ImportResult:
+    """Summary of a bulk completion import"""
+    rows: int = 0
+    created: int = 0
+    # Rows already recorded, in the database or earlier in the input
+    skipped: int = 0
+    invalid: int = 0
+    # (row number, message) for the first MAX_REPORTED_ERRORS invalid rows
+    errors: list = field(default_factory=list)
+    habits: int = 0
+    points: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add_error(self, row_number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+
+@dataclass
+class _ImportedHabit:
+    """What the import needs to know about a resolved UserHabit"""
+    id: str
+    user_id: int
+    habit_id: str
+    name: str
+    start_date: date
+    # (completion_date, completion id) of every completion created
+    created: list = field(default_factory=list)
+
+
+def _habit_key(row):
+    user_habit_id = (row.get('user_habit_id') or '').strip()
+    if user_habit_id:
+        return ('id', user_habit_id)
+    return ('name', (row.get('username') or '').strip(), (row.get('habit') or '').strip())
+
+
+def _resolve_habits(rows, habits):
+    """Load the UserHabits referenced by ``rows`` that are not in ``habits`` yet"""
+    keys = {_habit_key(row) for _, row in rows} - habits.keys()
+    if not keys:
+        return
+
+    ids = {key[1] for key in keys if key[0] == 'id'}
+    usernames = {key[1] for key in keys if key[0] == 'name'}
+    names = {key[2] for key in keys if key[0] == 'name'}
+
+    fields = ('id', 'user_id', 'habit_id', 'user__username', 'habit__name', 'start_date')
+    found = list(UserHabit.objects.filter(id__in=ids).values_list(*fields)) if ids else []
+    if usernames:
+        found += UserHabit.objects.filter(
+            user__username__in=usernames,
+            habit__name__in=names
+        ).values_list(*fields)
+
+    for user_habit_id, user_id, habit_id, username, habit_name, start_date in found:
+        imported = habits.get(('id', user_habit_id)) or _ImportedHabit(
+            user_habit_id, user_id, habit_id, habit_name, start_date
+        )
+        habits[('id', user_habit_id)] = imported
+        habits[('name', username, habit_name)] = imported
+
+    # Remember misses too, so they are only looked up once
+    for key in keys:
+        habits.setdefault(key, None)
+
+
+def _parse_row(row, habits, today):
+    """
+    Validate one row.
+
+    Returns:
+        (_ImportedHabit, completion_date)
+
+    Raises:
+        ValueError: with a message describing the problem
+    """
+    imported = habits.get(_habit_key(row))
+    if imported is None:
+        raise ValueError("unknown habit")
+
+    try:
+        completion_date = date.fromisoformat((row.get('completion_date') or '').strip())
+    except ValueError:
+        raise ValueError(f"invalid completion_date {row.get('completion_date')!r}")
+    if completion_date > today:
+        raise ValueError(f"completion_date {completion_date} is in the future")
+
+    return imported, completion_date
+
+
+def _insert_batch(rows, habits, seen, today, result):
+    """Validate and insert one batch of numbered rows"""
+    _resolve_habits(rows, habits)
+
+    parsed = []
+    for row_number, row in rows:
+        try:
+            imported, completion_date = _parse_row(row, habits, today)
+        except ValueError as e:
+            result.add_error(row_number, str(e))
+            continue
+        if (imported.id, completion_date) in seen:
+            result.skipped += 1
+            continue
+        seen.add((imported.id, completion_date))
+        parsed.append((imported, completion_date))
+
+    if not parsed:
+        return
+
+    dates = [completion_date for _, completion_date in parsed]
+    existing = set(HabitCompletion.objects.filter(
+        user_habit_id__in={imported.id for imported, _ in parsed},
+        completion_date__range=(min(dates), max(dates))
+    ).values_list('user_habit_id', 'completion_date'))
+
+    completions = []
+    for imported, completion_date in parsed:
+        if (imported.id, completion_date) in existing:
+            result.skipped += 1
+            continue
+        completion = HabitCompletion(
+            user_habit_id=imported.id,
+            completion_date=completion_date,
+            created_at=day_start(completion_date)
+        )
+        imported.created.append((completion_date, completion.id))
+        completions.append(completion)
+
+    HabitCompletion.objects.bulk_create(completions)
+    result.created += len(completions)
+
+
+def _credit_points(imported_habits, history, result):
+    """
+    Add a ledger entry for every imported completion, worth what the live
+    path would have awarded at the streak it extended, and update each
+    user's total once.
+    """
+    transactions = []
+    totals = {}
+    for imported in imported_habits:
+        periodicity, runs = history[imported.id]
+        firsts = [first for first, _ in runs]
+        for completion_date, completion_id in imported.created:
+            index = period_index(periodicity, completion_date)
+            streak = index - firsts[bisect.bisect_right(firsts, index) - 1] + 1
+            points = CompletionService.points_for_streak(streak)
+            transactions.append(PointTransaction(
+                user_id=imported.user_id,
+                amount=points,
+                transaction_type='COMPLETION',
+                description=f"Completed {imported.name}",
+                timestamp=day_start(completion_date),
+                reference_id=str(completion_id)
+            ))
+            totals[imported.user_id] = totals.get(imported.user_id, 0) + points
+
+    PointTransaction.objects.bulk_create(transactions, batch_size=IMPORT_BATCH_SIZE)
+    for user_id, amount in totals.items():
+        UserPoints.add_to_total(user_id, amount)
+    result.points = sum(totals.values())
+
+
+def import_completions(rows, batch_size=IMPORT_BATCH_SIZE, today=None):
+    """
+    Import habit completions in bulk, in one transaction.
+
+    Rows are validated in memory; invalid rows are reported and skipped, and
+    completions that already exist are skipped. Milestone emails are not
+    sent for imported history.
+
+    Args:
+        rows: Iterable of row dicts (see module docstring)
+        batch_size: Rows validated and inserted per batch
+        today: Reference date for future-date validation and current streaks
+
+    Returns:
+        ImportResult
+    """
+    started = time.perf_counter()
+    today = today or timezone.now().date()
+    result = ImportResult()
+    habits = {}
+    seen = set()
+    numbered = enumerate(rows, start=1)
+
+    with transaction.atomic():
+        while True:
+            batch = list(islice(numbered, batch_size))
+            if not batch:
+                break
+            result.rows += len(batch)
+            _insert_batch(batch, habits, seen, today, result)
+
+        imported_habits = {
+            imported.id: imported for imported in habits.values()
+            if imported is not None and imported.created
+        }.values()
+        result.habits = len(imported_habits)
+
+        # Imported history may predate the day tracking started
+        UserHabit.objects.bulk_update(
+            [
+                UserHabit(id=imported.id, start_date=min(day for day, _ in imported.created))
+                for imported in imported_habits
+                if min(day for day, _ in imported.created) < imported.start_date
+            ],
+            ['start_date'],
+            batch_size=batch_size
+        )
+
+        history = rebuild_streak_history([imported.id for imported in imported_habits], today)
+        _credit_points(imported_habits, history, result)
+        all_dates = [day for imported in imported_habits for day, _ in imported.created]
+        if all_dates:
+            refresh_rollups(
+                min(all_dates), max(all_dates),
+                user_ids={imported.user_id for imported in imported_habits},
+                habit_ids={imported.habit_id for imported in imported_habits}
+            )
+
+        AnalyticsService.recalculate_analytics_bulk(
+            [imported.id for imported in imported_habits], today, rebuild_streaks=False
+        )
+
+    result.seconds = time.perf_counter() - started
+    logger.info(
+        f"Imported {result.created} of {result.rows} completions for {result.habits} habits "
+        f"in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s)"
+    )
+    return result
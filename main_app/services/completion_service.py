@@ -0,0 +1,137 @@
+"""
+Habit completion fast path.
+
+Completing a habit inserts the HabitCompletion and applies every side effect
+(streak, analytics, daily rollups, points, milestone email) in one
+transaction, with conditional UPDATEs instead of read-modify-write saves.
+Duplicates are caught by the (user_habit, completion_date) unique constraint
+rather than checked for up front.
+"""
+
+import logging
+from dataclasses import dataclass
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from ..models import HabitCompletion, HabitAnalytics, UserPoints
+from .analytics_service import AnalyticsService
+from .rollups import count_completion
+from .streaks import record_completion
+
+logger = logging.getLogger(__name__)
+
+# Streak lengths that earn a milestone email
+STREAK_MILESTONES = (7, 14, 21, 30, 60, 90, 120, 180, 365)
+
+COMPLETION_POINTS = 10
+MAX_STREAK_BONUS = 50
+
+
+@dataclass
+class CompletionResult:
+    """Outcome of CompletionService.complete"""
+    completion: HabitCompletion
+    created: bool
+    streak: int
+    points: int = 0
+
+
+class CompletionService:
+    """Service recording habit completions and their side effects"""
+    
+    @staticmethod
+    def points_for_streak(streak):
+        """Points for one completion, with a bonus for every full week of streak"""
+        points = COMPLETION_POINTS
+        if streak >= 7:
+            points += min(streak // 7 * 5, MAX_STREAK_BONUS)
+        return points
+    
+    @classmethod
+    def apply_completion(cls, completion):
+        """
+        Apply the side effects of a newly saved completion. Runs from the
+        HabitCompletion post_save signal, so every way of creating a
+        completion goes through it; ``complete`` calls it directly.
+        
+        Returns:
+            Points awarded
+        """
+        from ..tasks import enqueue
+        
+        user_habit = completion.user_habit
+        streak = record_completion(user_habit, completion.completion_date)
+        
+        # Bump the analytics counters in place, creating the row from the
+        # habit's counters on the first completion. The rate comes from the
+        # completion bitmap record_completion just updated under the habit's
+        # row lock, per period like a recalculation.
+        completion_rate = AnalyticsService.calculate_completion_rate(user_habit)
+        updated = HabitAnalytics.objects.filter(
+            user_id=user_habit.user_id,
+            habit_id=user_habit.habit_id
+        ).update(
+            completions_count=F('completions_count') + 1,
+            longest_streak=Greatest('longest_streak', Value(streak)),
+            completion_rate=completion_rate
+        )
+        if not updated:
+            HabitAnalytics.objects.bulk_create(
+                [HabitAnalytics(
+                    user_id=user_habit.user_id,
+                    habit_id=user_habit.habit_id,
+                    completions_count=user_habit.completions_count,
+                    missed_count=user_habit.missed_count,
+                    longest_streak=user_habit.longest_streak,
+                    completion_rate=completion_rate
+                )],
+                ignore_conflicts=True
+            )
+        count_completion(user_habit, completion.completion_date)
+        
+        points = cls.points_for_streak(streak)
+        UserPoints.credit(
+            user_habit.user_id,
+            points,
+            'COMPLETION',
+            f"Completed {user_habit.habit.name}",
+            reference_id=str(completion.id)
+        )
+        
+        if streak in STREAK_MILESTONES:
+            enqueue('send_streak_milestone_email', user_habit_id=user_habit.id, streak_length=streak)
+        
+        completion.points_awarded = points
+        return points
+    
+    @classmethod
+    def complete(cls, user_habit, completion_date=None):
+        """
+        Record that a habit was completed, in a single transaction.
+        
+        Args:
+            user_habit: The UserHabit, ideally with its habit already loaded
+            completion_date: Defaults to today
+        
+        Returns:
+            CompletionResult; ``created`` is False if the habit was already
+            completed on that date
+        """
+        completion = HabitCompletion(
+            user_habit=user_habit,
+            completion_date=completion_date or timezone.now().date()
+        )
+        # Applied below rather than from the signal, so the savepoint only
+        # covers the insert: an IntegrityError raised by a side effect must
+        # not pass for a duplicate
+        completion._defer_side_effects = True
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    completion.save(force_insert=True, validate=False)
+            except IntegrityError:
+                return CompletionResult(None, False, user_habit.streak)
+            points = cls.apply_completion(completion)
+        
+        return CompletionResult(completion, True, user_habit.streak, points)
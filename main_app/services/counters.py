@@ -0,0 +1,117 @@
+"""
+Habit counters.
+
+``completions_count``, ``missed_count`` and ``longest_streak`` on UserHabit
+and HabitAnalytics are maintained as counters instead of being aggregated
+on every read:
+
+* the completion fast path bumps completions_count and longest_streak with
+  F() expressions in the UPDATEs it already issues (services.streaks and
+  services.completion_service)
+* every recorded miss bumps missed_count, in bulk for the sweep
+  (``count_misses``)
+* rebuilding streaks rewrites completions_count and longest_streak from the
+  completions
+
+``reconcile_counters`` (``manage.py reconcile_counters``) repairs all three
+from the raw rows for paths that bypass the increments, e.g. bulk_create.
+"""
+
+import logging
+from django.db.models import Count, Exists, F, OuterRef
+from django.utils import timezone
+from ..models import UserHabit, MissedHabit, HabitAnalytics
+from .streaks import BREAK_BATCH_SIZE, REBUILD_BATCH_SIZE, chunks, rebuild_all_streaks
+
+logger = logging.getLogger(__name__)
+
+
+def count_misses(user_habit_ids):
+    """Add one miss to the counters of each habit, two UPDATEs per batch"""
+    for chunk in chunks(list(user_habit_ids)):
+        UserHabit.objects.filter(id__in=chunk).update(missed_count=F('missed_count') + 1)
+        HabitAnalytics.objects.filter(Exists(UserHabit.objects.filter(
+            id__in=chunk,
+            user_id=OuterRef('user_id'),
+            habit_id=OuterRef('habit_id')
+        ))).update(missed_count=F('missed_count') + 1)
+
+
+def repair_missed_counts(user_habit_ids):
+    """
+    Recount the misses of a batch of habits and write the counters that drifted.
+
+    Returns:
+        Number of habits whose counter was corrected
+    """
+    user_habit_ids = list(user_habit_ids)
+    counts = dict(MissedHabit.objects.filter(
+        user_habit_id__in=user_habit_ids
+    ).values_list('user_habit_id').annotate(total=Count('id')).order_by())
+    habit_rows = list(UserHabit.objects.filter(
+        id__in=user_habit_ids
+    ).values_list('id', 'user_id', 'habit_id', 'missed_count'))
+
+    repaired = [
+        UserHabit(id=habit_id, missed_count=counts.get(habit_id, 0))
+        for habit_id, _, _, missed_count in habit_rows
+        if missed_count != counts.get(habit_id, 0)
+    ]
+
+    habit_keys = {(user_id, habit_id): user_habit_id for user_habit_id, user_id, habit_id, _ in habit_rows}
+    analytics = []
+    for record in HabitAnalytics.objects.filter(
+        user_id__in={key[0] for key in habit_keys},
+        habit_id__in={key[1] for key in habit_keys}
+    ).only('id', 'user_id', 'habit_id', 'missed_count'):
+        user_habit_id = habit_keys.get((record.user_id, record.habit_id))
+        if user_habit_id and record.missed_count != counts.get(user_habit_id, 0):
+            record.missed_count = counts.get(user_habit_id, 0)
+            analytics.append(record)
+
+    UserHabit.objects.bulk_update(repaired, ['missed_count'], batch_size=BREAK_BATCH_SIZE)
+    HabitAnalytics.objects.bulk_update(analytics, ['missed_count'], batch_size=BREAK_BATCH_SIZE)
+    return len(repaired)
+
+
+def reconcile_counters(batch_size=REBUILD_BATCH_SIZE, today=None, progress=None):
+    """
+    Repair the counters of every habit: completions_count and longest_streak
+    are rebuilt with the streaks (see ``rebuild_all_streaks``), then
+    missed_count is recounted, walking the habits in primary key order.
+
+    Args:
+        batch_size: Habits per batch
+        progress: Optional callable receiving the running totals after each batch
+
+    Returns:
+        Totals of habits, habits whose streak or completion counters were
+        repaired and habits whose miss counter was repaired
+    """
+    today = today or timezone.now().date()
+    totals = {'habits': 0, 'repaired': 0, 'missed_repaired': 0}
+
+    streak_totals = rebuild_all_streaks(batch_size=batch_size, today=today)
+    totals['repaired'] = streak_totals['repaired']
+
+    last_id = None
+    while True:
+        habits = UserHabit.objects.order_by('id')
+        if last_id is not None:
+            habits = habits.filter(id__gt=last_id)
+        ids = list(habits.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        totals['missed_repaired'] += repair_missed_counts(ids)
+        totals['habits'] += len(ids)
+        if progress:
+            progress(totals)
+
+    if totals['repaired'] or totals['missed_repaired']:
+        logger.warning(
+            f"Repaired the counters of {totals['repaired'] + totals['missed_repaired']} "
+            f"of {totals['habits']} habits"
+        )
+    return totals
@@ -0,0 +1,117 @@
+"""
+Batched email delivery over a small pool of reusable backend connections.
+
+``send_mail`` opens and closes a backend connection for every message. When
+many messages go out at once (e.g. a burst of due reminders) the connection
+setup dominates, so prepared messages are instead split into batches and
+sent from a bounded thread pool, each thread borrowing one of a fixed number
+of open connections.
+"""
+
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 100
+
+
+@dataclass
+class DeliveryResult:
+    """Outcome of delivering one message"""
+    message: EmailMessage
+    sent: bool
+    error: str = None
+
+
+def _failed(messages, error):
+    return [DeliveryResult(message, False, error) for message in messages]
+
+
+def _send_batch(connections, batch):
+    """
+    Send a batch over a borrowed connection, one result per message. A
+    connection that cannot be opened fails the messages it would have sent
+    instead of raising, so an SMTP outage is reported, not propagated.
+    """
+    pooled = connections.get()
+    connection = pooled['connection']
+    results = []
+    try:
+        if not pooled['open']:
+            try:
+                connection.open()
+            except Exception as e:
+                logger.error(f"Failed to open an email connection: {str(e)}")
+                return _failed(batch, str(e))
+            pooled['open'] = True
+        
+        for i, message in enumerate(batch):
+            try:
+                sent = connection.send_messages([message]) == 1
+                results.append(DeliveryResult(message, sent))
+            except Exception as e:
+                logger.error(f"Failed to send email to {message.to}: {str(e)}")
+                results.append(DeliveryResult(message, False, str(e)))
+                # The connection may be left half-open after an error; start over
+                pooled['open'] = False
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception as e:
+                    logger.error(f"Failed to reopen an email connection: {str(e)}")
+                    results.extend(_failed(batch[i + 1:], str(e)))
+                    break
+                pooled['open'] = True
+    finally:
+        connections.put(pooled)
+    return results
+
+
+def deliver_messages(messages, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, backend=None):
+    """
+    Send prepared messages over at most ``workers`` open backend connections.
+    
+    Connections are opened by the first batch that borrows them. Connection
+    and delivery errors never escape: the affected messages come back as
+    failed results.
+    
+    Args:
+        messages: Iterable of EmailMessage instances
+        workers: Size of both the thread pool and the connection pool
+        batch_size: Messages handed to a thread per connection checkout
+        backend: Optional email backend path, defaults to EMAIL_BACKEND
+    
+    Returns:
+        List of DeliveryResult in the same order as ``messages``
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+    workers = max(1, min(workers, len(batches)))
+    
+    connections = queue.Queue()
+    pool = [{'connection': get_connection(backend, fail_silently=False), 'open': False} for _ in range(workers)]
+    for pooled in pool:
+        connections.put(pooled)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch_results = executor.map(lambda batch: _send_batch(connections, batch), batches)
+            results = [result for batch in batch_results for result in batch]
+    finally:
+        for pooled in pool:
+            try:
+                pooled['connection'].close()
+            except Exception as e:
+                logger.warning(f"Failed to close an email connection: {str(e)}")
+    
+    sent = sum(1 for result in results if result.sent)
+    logger.info(f"Delivered {sent}/{len(results)} emails over {workers} connections")
+    return results
@@ -0,0 +1,107 @@
+"""
+Completion heatmaps.
+
+GitHub-style calendar heatmaps are served from precomputed data, never from
+a scan of HabitCompletion: per-user daily totals come from the DailyUserStats
+rollup (see services.rollups), and a daily habit's days come from its
+completion bitmap.
+
+Every user has a heatmap version in the cache (see services.cache_versions)
+that is bumped after each transaction that adds completions for them, in
+whichever process it ran. It is part of the ETag and of the cached payloads,
+so a repeat load of an unchanged heatmap costs one cache lookup.
+"""
+
+import hashlib
+from django.core.cache import cache
+from ..models import DailyUserStats, HabitCompletion
+from .cache_versions import bump_cache_version, cache_version
+from .completion_bitmap import CompletionBitmap
+from .periods import period_start
+
+HEATMAP_CACHE_TTL = 24 * 60 * 60
+
+# Longest range a single heatmap may cover
+MAX_HEATMAP_DAYS = 3 * 366
+
+
+def _version_key(user_id):
+    return f'heatmap:version:{user_id}'
+
+
+def _payload_key(user_id, scope, first_day, last_day):
+    return f'heatmap:{user_id}:{scope}:{first_day}:{last_day}'
+
+
+def heatmap_version(user_id):
+    """The current heatmap version of a user"""
+    return cache_version(_version_key(user_id))
+
+
+def bump_heatmap_version(user_id):
+    """Invalidate a user's cached heatmaps and ETags"""
+    bump_cache_version(_version_key(user_id))
+
+
+def heatmap_etag(user_id, first_day, last_day, user_habit_id=None):
+    """ETag of a heatmap; changes only when one of the user's completions lands"""
+    scope = user_habit_id or 'all'
+    version = heatmap_version(user_id)
+    digest = hashlib.md5(f'{user_id}:{scope}:{first_day}:{last_day}:{version}'.encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _daily_counts(user_id, first_day, last_day, user_habit=None):
+    """Completions per day between the two dates, leaving out empty days"""
+    if user_habit is None:
+        return dict(DailyUserStats.objects.filter(
+            user_id=user_id,
+            date__range=(first_day, last_day),
+            completions__gt=0
+        ).values_list('date', 'completions'))
+
+    bitmap = CompletionBitmap.for_user_habit(user_habit)
+    if bitmap.periodicity == 'DAILY':
+        return {
+            period_start('DAILY', index): 1
+            for index, completed in bitmap.slice(first_day, last_day) if completed
+        }
+    # Weekly and monthly bitmaps do not record the day within the period
+    return {
+        day: 1 for day in HabitCompletion.objects.filter(
+            user_habit_id=user_habit.pk,
+            completion_date__range=(first_day, last_day)
+        ).values_list('completion_date', flat=True)
+    }
+
+
+def get_heatmap(user_id, first_day, last_day, user_habit=None):
+    """
+    Daily completion counts of a user, or of one of their habits, between
+    two dates, cached until the user's next completion.
+
+    Args:
+        user_habit: Restrict the heatmap to this UserHabit, loaded with its habit
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    scope = user_habit.pk if user_habit else 'all'
+    version = heatmap_version(user_id)
+    key = _payload_key(user_id, scope, first_day, last_day)
+
+    cached = cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    counts = _daily_counts(user_id, first_day, last_day, user_habit)
+    payload = {
+        'start': first_day.isoformat(),
+        'end': last_day.isoformat(),
+        'habit': user_habit.pk if user_habit else None,
+        'days': {day.isoformat(): count for day, count in sorted(counts.items())},
+        'total': sum(counts.values()),
+        'max': max(counts.values(), default=0),
+    }
+    cache.set(key, (version, payload), HEATMAP_CACHE_TTL)
+    return payload
@@ -0,0 +1,128 @@
+"""
+Compiled notification preferences.
+
+Profiles store notification preferences as JSON with quiet hours as "HH:MM"
+strings. Deciding whether a notification may go out used to mean a profile
+query, a JSON parse and two strptime calls per notification. Instead the
+preferences for a whole batch of users are loaded in one query and compiled
+once into CompiledPreferences, which answers from memory.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.utils import timezone
+from ..models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Notification type -> preference key that enables it
+CHANNEL_PREFERENCES = {
+    'email_reminder': 'email_reminders',
+    'email_streak': 'email_streak_updates',
+    'email_achievement': 'email_achievements',
+    'inapp_reminder': 'inapp_reminders',
+    'inapp_streak': 'inapp_streak_updates',
+    'inapp_achievement': 'inapp_achievements',
+}
+
+
+def _minutes(value):
+    """Convert "HH:MM" into minutes after midnight"""
+    hours, minutes = value.split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(value)
+    return hours * 60 + minutes
+
+
+@dataclass(frozen=True)
+class CompiledPreferences:
+    """A user's notification preferences reduced to what the send path needs"""
+    disabled: frozenset = frozenset()
+    tz: ZoneInfo = ZoneInfo('UTC')
+    # Quiet hours as minutes after local midnight, None when disabled
+    quiet_start: int = None
+    quiet_end: int = None
+    
+    @classmethod
+    def compile(cls, preferences, timezone_name=None, username=None):
+        """
+        Build the compiled form of a notification_preferences dictionary.
+        
+        Args:
+            preferences: The profile's notification preferences
+            timezone_name: The profile's timezone; unknown zones fall back to UTC
+            username: Only used in log messages
+        """
+        disabled = frozenset(
+            notification_type
+            for notification_type, key in CHANNEL_PREFERENCES.items()
+            if not preferences.get(key, True)
+        )
+        
+        try:
+            tz = ZoneInfo(timezone_name or 'UTC')
+        except (ZoneInfoNotFoundError, ValueError):
+            tz = ZoneInfo('UTC')
+        
+        quiet_start = quiet_end = None
+        if preferences.get('quiet_hours_enabled', False):
+            try:
+                quiet_start = _minutes(preferences.get('quiet_hours_start', '22:00'))
+                quiet_end = _minutes(preferences.get('quiet_hours_end', '07:00'))
+            except (ValueError, AttributeError):
+                # If there's an error parsing times, default to allowing notifications
+                logger.warning(f"Error parsing quiet hours for user {username}")
+                quiet_start = quiet_end = None
+        
+        return cls(disabled, tz, quiet_start, quiet_end)
+    
+    def in_quiet_hours(self, now=None):
+        """Whether ``now`` (default: current time) falls in the user's quiet hours"""
+        if self.quiet_start is None:
+            return False
+        
+        local = (now or timezone.now()).astimezone(self.tz)
+        minute = local.hour * 60 + local.minute
+        if self.quiet_start <= self.quiet_end:
+            # Simple case: start time is before end time
+            return self.quiet_start <= minute <= self.quiet_end
+        # Quiet hours span midnight
+        return minute >= self.quiet_start or minute <= self.quiet_end
+    
+    def allows(self, notification_type, now=None):
+        """Whether a notification of the given type may be sent at ``now``"""
+        if self.in_quiet_hours(now):
+            return False
+        return notification_type not in self.disabled
+
+
+# Users without a profile get every notification
+ALLOW_ALL = CompiledPreferences()
+
+
+def resolve_preferences(users):
+    """
+    Load and compile the notification preferences of many users in one query.
+    
+    Args:
+        users: Iterable of users or user ids
+    
+    Returns:
+        Dictionary mapping every given user id to its CompiledPreferences
+    """
+    user_ids = {getattr(user, 'pk', user) for user in users}
+    resolved = dict.fromkeys(user_ids, ALLOW_ALL)
+    if not user_ids:
+        return resolved
+    
+    rows = UserProfile.objects.filter(user_id__in=user_ids).values_list(
+        'user_id', 'timezone', '_notification_preferences'
+    )
+    for user_id, timezone_name, raw_preferences in rows:
+        preferences = json.loads(raw_preferences) if raw_preferences else {}
+        resolved[user_id] = CompiledPreferences.compile(preferences, timezone_name, user_id)
+    
+    return resolved
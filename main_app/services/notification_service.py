@@ -1,9 +1,9 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, send_mail
 from django.template.loader import render_to_string
-from django.utils import timezone
 from django.conf import settings
-from ..models import UserProfile, UserHabit, Reminder
-import datetime
+from ..models import UserHabit, Reminder
+from .email_delivery import deliver_messages
+from .notification_preferences import resolve_preferences
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,115 +12,153 @@ class NotificationService:
     """Service to handle sending notifications based on user preferences"""
     
     @staticmethod
-    def should_send_notification(user, notification_type):
-        """Check if notification should be sent based on user preferences"""
-        try:
-            profile = UserProfile.objects.get(user=user)
-            preferences = profile.notification_preferences
-            
-            # Check if notifications are allowed during current time (quiet hours)
-            if preferences.get('quiet_hours_enabled', False):
-                quiet_start = preferences.get('quiet_hours_start', '22:00')
-                quiet_end = preferences.get('quiet_hours_end', '07:00')
-                
-                # Parse times
-                try:
-                    quiet_start_time = datetime.datetime.strptime(quiet_start, '%H:%M').time()
-                    quiet_end_time = datetime.datetime.strptime(quiet_end, '%H:%M').time()
-                    now = timezone.localtime(timezone.now(), timezone=timezone.pytz.timezone(profile.timezone)).time()
-                    
-                    # Check if current time is within quiet hours
-                    if quiet_start_time <= quiet_end_time:
-                        # Simple case: start time is before end time
-                        if quiet_start_time <= now <= quiet_end_time:
-                            logger.info(f"Not sending {notification_type} to {user.username} - within quiet hours")
-                            return False
-                    else:
-                        # Complex case: quiet hours span midnight
-                        if now >= quiet_start_time or now <= quiet_end_time:
-                            logger.info(f"Not sending {notification_type} to {user.username} - within quiet hours")
-                            return False
-                except ValueError:
-                    # If there's an error parsing times, default to allowing notifications
-                    logger.warning(f"Error parsing quiet hours for user {user.username}")
-            
-            # Check notification-specific preferences
-            if notification_type == 'email_reminder':
-                return preferences.get('email_reminders', True)
-            elif notification_type == 'email_streak':
-                return preferences.get('email_streak_updates', True)
-            elif notification_type == 'email_achievement':
-                return preferences.get('email_achievements', True)
-            elif notification_type == 'inapp_reminder':
-                return preferences.get('inapp_reminders', True)
-            elif notification_type == 'inapp_streak':
-                return preferences.get('inapp_streak_updates', True)
-            elif notification_type == 'inapp_achievement':
-                return preferences.get('inapp_achievements', True)
-            
-            # Default to allowing the notification
-            return True
-            
-        except UserProfile.DoesNotExist:
-            # If profile doesn't exist, default to allowing notifications
-            return True
+    def should_send_notification(user, notification_type, preferences=None):
+        """
+        Check if notification should be sent based on user preferences
+        
+        Args:
+            user: The recipient
+            notification_type: e.g. 'email_reminder' or 'inapp_streak'
+            preferences: The user's CompiledPreferences when already resolved,
+                otherwise they are loaded for this one user
+        """
+        if preferences is None:
+            preferences = resolve_preferences([user])[user.pk]
+        
+        if not preferences.allows(notification_type):
+            logger.info(f"Not sending {notification_type} to {user.username} - disabled or within quiet hours")
+            return False
+        return True
+    
+    @staticmethod
+    def _build_email(subject, template_name, context, user):
+        """Render an email template pair into a message ready to be sent"""
+        html_message = render_to_string(f'emails/{template_name}.html', context)
+        plain_message = render_to_string(f'emails/{template_name}.txt', context)
+        message = EmailMultiAlternatives(
+            subject,
+            plain_message,
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email]
+        )
+        message.attach_alternative(html_message, 'text/html')
+        return message
     
     @classmethod
-    def send_reminder_email(cls, user_habit):
-        """Send reminder email for a habit"""
+    def prepare_reminder_email(cls, user_habit, reminder=None, preferences=None):
+        """
+        Build the reminder email for a habit without sending it
+        
+        Args:
+            user_habit: The UserHabit to remind about
+            reminder: The Reminder being sent, looked up when not given
+            preferences: The user's CompiledPreferences, loaded when not given
+        
+        Returns:
+            The email message, or None if no reminder should be sent
+        """
         user = user_habit.user
         habit = user_habit.habit
         
         # Check if the user wants email reminders
-        if not cls.should_send_notification(user, 'email_reminder'):
-            return False
+        if not cls.should_send_notification(user, 'email_reminder', preferences):
+            return None
         
         # Get the reminder for this habit
-        reminder = Reminder.objects.filter(user_habit=user_habit).first()
+        if reminder is None:
+            reminder = Reminder.objects.filter(user_habit=user_habit).first()
         if not reminder:
-            return False
+            return None
         
-        # Prepare email content
         subject = f"Reminder: Complete your habit '{habit.name}'"
         context = {
             'user': user,
             'habit': habit,
+            'streak': user_habit.streak,
             'reminder_time': reminder.reminder_time,
         }
-        html_message = render_to_string('emails/habit_reminder.html', context)
-        plain_message = render_to_string('emails/habit_reminder.txt', context)
+        return cls._build_email(subject, 'habit_reminder', context, user)
+    
+    @classmethod
+    def send_reminder_email(cls, user_habit, reminder=None):
+        """
+        Send reminder email for a habit
+        
+        Args:
+            user_habit: The UserHabit to remind about
+            reminder: The Reminder being sent, looked up when not given
+        """
+        message = cls.prepare_reminder_email(user_habit, reminder)
+        if message is None:
+            return False
         
         # Send email
         try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                html_message=html_message,
-                fail_silently=False
-            )
-            logger.info(f"Sent reminder email for habit '{habit.name}' to {user.email}")
+            message.send(fail_silently=False)
+            logger.info(f"Sent reminder email for habit '{user_habit.habit.name}' to {user_habit.user.email}")
             return True
         except Exception as e:
             logger.error(f"Failed to send reminder email: {str(e)}")
             return False
     
     @classmethod
-    def send_streak_milestone_email(cls, user_habit, streak_length):
-        """Send email for streak milestone"""
+    def send_reminder_emails(cls, reminders, **delivery_options):
+        """
+        Send the emails for many reminders in one batched delivery
+        
+        Args:
+            reminders: Reminders with user_habit, its user and habit loaded
+            **delivery_options: Passed on to deliver_messages (workers, batch_size, backend)
+        
+        Returns:
+            Dictionary mapping each reminder id to True if its email was sent,
+            False if delivery failed and None if no email was due (e.g. the
+            user turned reminder emails off)
+        """
+        reminders = list(reminders)
+        preferences = resolve_preferences(reminder.user_habit.user_id for reminder in reminders)
+        
+        results = {}
+        prepared = []
+        for reminder in reminders:
+            results[reminder.pk] = None
+            try:
+                message = cls.prepare_reminder_email(
+                    reminder.user_habit, reminder, preferences[reminder.user_habit.user_id]
+                )
+            except Exception as e:
+                logger.error(f"Failed to prepare reminder email: {str(e)}")
+                continue
+            if message is not None:
+                prepared.append((reminder.pk, message))
+        
+        deliveries = deliver_messages([message for _, message in prepared], **delivery_options)
+        for (reminder_id, _), delivery in zip(prepared, deliveries):
+            results[reminder_id] = delivery.sent
+        
+        return results
+    
+    @classmethod
+    def send_streak_milestone_email(cls, user_habit, streak_length, preferences=None):
+        """
+        Send email for streak milestone
+        
+        Raises the mail backend's error when sending fails, so the
+        send_streak_milestone_email task is retried
+        """
         user = user_habit.user
         habit = user_habit.habit
         
-        # Check if the user wants streak update emails
-        if not cls.should_send_notification(user, 'email_streak'):
-            return False
-        
-        # Only send for significant milestones (7, 14, 21, 30, 60, 90, etc.)
+        # Only send for significant milestones (7, 14, 21, 30, 60, 90, etc.),
+        # checked first so ordinary completions never load preferences
         significant_milestones = [7, 14, 21, 30, 60, 90, 120, 180, 365]
         if streak_length not in significant_milestones:
             return False
         
+        # Check if the user wants streak update emails
+        if not cls.should_send_notification(user, 'email_streak', preferences):
+            return False
+        
         # Prepare email content
         subject = f"Congratulations! {streak_length}-day streak for '{habit.name}'"
         context = {
@@ -131,21 +169,17 @@ class NotificationService:
         html_message = render_to_string('emails/streak_milestone.html', context)
         plain_message = render_to_string('emails/streak_milestone.txt', context)
         
-        # Send email
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                html_message=html_message,
-                fail_silently=False
-            )
-            logger.info(f"Sent streak milestone email ({streak_length} days) for habit '{habit.name}' to {user.email}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send streak milestone email: {str(e)}")
-            return False
+        # Send email; failures propagate so the task queue retries them
+        send_mail(
+            subject,
+            plain_message,
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+            html_message=html_message,
+            fail_silently=False
+        )
+        logger.info(f"Sent streak milestone email ({streak_length} days) for habit '{habit.name}' to {user.email}")
+        return True
     
     @classmethod
     def send_achievement_email(cls, user, achievement):
@@ -0,0 +1,114 @@
+"""
+Calendar period engine for habit periodicities.
+
+Every date maps to a (periodicity, period_index) bucket and back in O(1):
+
+* DAILY   - the date's ordinal
+* WEEKLY  - Monday-based weeks counted from 0001-01-01 (a Monday)
+* MONTHLY - year * 12 + month - 1
+
+Consecutive periods always have consecutive indices, so streaks and period
+counts reduce to integer arithmetic instead of walking calendars.
+"""
+
+from datetime import date, datetime, time, timedelta
+from django.db.models import F
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+PERIODICITIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+
+def period_index(periodicity, day):
+    """Return the index of the period containing ``day``"""
+    if periodicity == 'DAILY':
+        return day.toordinal()
+    if periodicity == 'WEEKLY':
+        return (day.toordinal() - 1) // 7
+    if periodicity == 'MONTHLY':
+        return day.year * 12 + day.month - 1
+    raise ValueError(f"Unknown periodicity: {periodicity}")
+
+
+def day_start(day):
+    """Aware datetime of the first moment of ``day`` in the current timezone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def period_start(periodicity, index):
+    """Return the first day of the period with the given index"""
+    if periodicity == 'DAILY':
+        return date.fromordinal(index)
+    if periodicity == 'WEEKLY':
+        return date.fromordinal(index * 7 + 1)
+    if periodicity == 'MONTHLY':
+        return date(index // 12, index % 12 + 1, 1)
+    raise ValueError(f"Unknown periodicity: {periodicity}")
+
+
+def period_end(periodicity, index):
+    """Return the last day of the period with the given index"""
+    return period_start(periodicity, index + 1) - timedelta(days=1)
+
+
+def period_bounds(periodicity, day):
+    """Return (start, end) of the period containing ``day``"""
+    index = period_index(periodicity, day)
+    return period_start(periodicity, index), period_end(periodicity, index)
+
+
+def periods_between(periodicity, first_date, last_date):
+    """
+    Build the boundaries of every period touching the range in one go.
+
+    Returns:
+        List of (index, start, end) tuples from the period containing
+        first_date through the one containing last_date
+    """
+    return [
+        (index, period_start(periodicity, index), period_end(periodicity, index))
+        for index in range(period_index(periodicity, first_date), period_index(periodicity, last_date) + 1)
+    ]
+
+
+def complete_periods(periodicity, first_date, today):
+    """
+    Periods from the one containing first_date that ended before today.
+
+    Returns:
+        List of (index, start, end) tuples
+    """
+    if first_date >= today:
+        return []
+    periods = periods_between(periodicity, first_date, today)
+    return [period for period in periods if period[2] < today]
+
+
+def count_periods(periodicity, first_date, last_date):
+    """Number of periods from the one containing first_date through last_date"""
+    return period_index(periodicity, last_date) - period_index(periodicity, first_date) + 1
+
+
+def completed_periods(completions, periodicity):
+    """
+    Reduce a HabitCompletion queryset to one row per habit and completed period.
+
+    Args:
+        completions: HabitCompletion queryset
+        periodicity: Periodicity whose periods the completions are grouped into
+
+    Returns:
+        Queryset of {'user_habit_id', 'period_start'} dictionaries
+    """
+    if periodicity == 'DAILY':
+        bucket = F('completion_date')
+    elif periodicity == 'WEEKLY':
+        bucket = TruncWeek('completion_date')
+    elif periodicity == 'MONTHLY':
+        bucket = TruncMonth('completion_date')
+    else:
+        raise ValueError(f"Unknown periodicity: {periodicity}")
+
+    return completions.order_by().annotate(
+        period_start=bucket
+    ).values('user_habit_id', 'period_start').distinct()
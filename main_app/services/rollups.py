@@ -0,0 +1,211 @@
+"""
+Daily rollups.
+
+DailyUserStats and DailyHabitStats hold per-day completions, misses and
+points (per user) or distinct users (per habit). They are incremented as
+events land: the completion fast path, the missed-habit sweep and every
+points credit (UserPoints.credit and add_points). Analytics read the rollups instead of scanning
+HabitCompletion, MissedHabit and PointTransaction, so a query covers one
+row per user or habit and day however many events there were.
+
+A nightly job recomputes the last few days from the raw events, correcting
+any drift (e.g. an event written by a path that skipped the increments).
+Bulk paths such as the completion import recompute the affected range the
+same way.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from ..models import (
+    DailyHabitStats, DailyUserStats, HabitCompletion, MissedHabit, PointTransaction, UserHabit
+)
+from .heatmap import bump_heatmap_version
+from .periods import day_start
+
+logger = logging.getLogger(__name__)
+
+# Days recomputed by the nightly reconciliation, ending yesterday
+RECONCILE_DAYS = 2
+
+ROLLUP_BATCH_SIZE = 500
+
+_USER_COUNTERS = ('completions', 'misses', 'points')
+_HABIT_COUNTERS = ('completions', 'misses', 'distinct_users')
+
+
+def count_completion(user_habit, day):
+    """
+    Count one completion of a UserHabit in the user's and the habit's rollups
+    and bump the user's heatmap version once the transaction commits.
+    """
+    user_id, habit_id = user_habit.user_id, user_habit.habit_id
+    DailyUserStats.increment(day, {'completions': 1}, user_id=user_id)
+    # A user can track the same habit more than once; they are only a new
+    # user for the habit's day if none of their other copies was completed
+    counters = {'completions': 1}
+    if not HabitCompletion.objects.filter(
+        user_habit__user_id=user_id,
+        user_habit__habit_id=habit_id,
+        completion_date=day
+    ).exclude(user_habit_id=user_habit.pk).exists():
+        counters['distinct_users'] = 1
+    DailyHabitStats.increment(day, counters, habit_id=habit_id)
+    transaction.on_commit(lambda: bump_heatmap_version(user_id))
+
+
+def count_missed_days(user_habit_ids, day):
+    """Bring the day's rollups of the users and habits of newly missed habits up to date"""
+    user_habit_ids = list(user_habit_ids)
+    for i in range(0, len(user_habit_ids), ROLLUP_BATCH_SIZE):
+        user_ids, habit_ids = set(), set()
+        for user_id, habit_id in UserHabit.objects.filter(
+            id__in=user_habit_ids[i:i + ROLLUP_BATCH_SIZE]
+        ).values_list('user_id', 'habit_id'):
+            user_ids.add(user_id)
+            habit_ids.add(habit_id)
+        refresh_rollups(day, day, user_ids=user_ids, habit_ids=habit_ids)
+
+
+def _user_totals(first_day, last_day, user_ids=None):
+    """{(user_id, date): {counter: value}} computed from the raw events"""
+    completions = HabitCompletion.objects.filter(completion_date__range=(first_day, last_day))
+    misses = MissedHabit.objects.filter(missed_date__range=(first_day, last_day))
+    points = PointTransaction.objects.filter(
+        timestamp__gte=day_start(first_day),
+        timestamp__lt=day_start(last_day + timedelta(days=1))
+    )
+    if user_ids is not None:
+        completions = completions.filter(user_habit__user_id__in=user_ids)
+        misses = misses.filter(user_habit__user_id__in=user_ids)
+        points = points.filter(user_id__in=user_ids)
+
+    totals = defaultdict(dict)
+    for user_id, day, total in completions.values_list(
+        'user_habit__user_id', 'completion_date'
+    ).annotate(total=Count('id')).order_by():
+        totals[user_id, day]['completions'] = total
+    for user_id, day, total in misses.values_list(
+        'user_habit__user_id', 'missed_date'
+    ).annotate(total=Count('id')).order_by():
+        totals[user_id, day]['misses'] = total
+    for user_id, day, total in points.annotate(day=TruncDate('timestamp')).values_list(
+        'user_id', 'day'
+    ).annotate(total=Sum('amount')).order_by():
+        totals[user_id, day]['points'] = total
+    return totals
+
+
+def _habit_totals(first_day, last_day, habit_ids=None):
+    """{(habit_id, date): {counter: value}} computed from the raw events"""
+    completions = HabitCompletion.objects.filter(completion_date__range=(first_day, last_day))
+    misses = MissedHabit.objects.filter(missed_date__range=(first_day, last_day))
+    if habit_ids is not None:
+        completions = completions.filter(user_habit__habit_id__in=habit_ids)
+        misses = misses.filter(user_habit__habit_id__in=habit_ids)
+
+    totals = defaultdict(dict)
+    for habit_id, day, total, users in completions.values_list(
+        'user_habit__habit_id', 'completion_date'
+    ).annotate(
+        total=Count('id'),
+        users=Count('user_habit__user_id', distinct=True)
+    ).order_by():
+        totals[habit_id, day].update(completions=total, distinct_users=users)
+    for habit_id, day, total in misses.values_list(
+        'user_habit__habit_id', 'missed_date'
+    ).annotate(total=Count('id')).order_by():
+        totals[habit_id, day]['misses'] = total
+    return totals
+
+
+def _replace_rows(model, key_field, counters, stored, totals):
+    """
+    Replace the stored rollup rows with the recomputed totals, writing only
+    the rows that differ.
+
+    Returns:
+        Keys of the rows that changed
+    """
+    existing = {
+        (row[key_field], row['date']): row for row in stored.values('id', key_field, 'date', *counters)
+    }
+    changed = set()
+    updates, creates = [], []
+    for key, counts in totals.items():
+        row = existing.pop(key, None)
+        values = {counter: counts.get(counter, 0) for counter in counters}
+        if row is None:
+            creates.append(model(**{key_field: key[0], 'date': key[1]}, **values))
+        elif any(row[counter] != value for counter, value in values.items()):
+            updates.append(model(id=row['id'], **values))
+        else:
+            continue
+        changed.add(key)
+
+    # Rows without any events left in the range
+    stale = [row['id'] for row in existing.values() if any(row[counter] for counter in counters)]
+    changed.update(key for key, row in existing.items() if any(row[counter] for counter in counters))
+    for i in range(0, len(stale), ROLLUP_BATCH_SIZE):
+        model.objects.filter(id__in=stale[i:i + ROLLUP_BATCH_SIZE]).delete()
+    model.objects.bulk_update(updates, counters, batch_size=ROLLUP_BATCH_SIZE)
+    model.objects.bulk_create(creates, batch_size=ROLLUP_BATCH_SIZE)
+    return changed
+
+
+def refresh_rollups(first_day, last_day, user_ids=None, habit_ids=None):
+    """
+    Recompute the rollups between two dates (inclusive) from the raw events.
+
+    Args:
+        user_ids: Only recompute these users' rows; None for every user
+        habit_ids: Only recompute these habits' rows; None for every habit
+
+    Returns:
+        Number of rollup rows corrected
+    """
+    user_rows = DailyUserStats.objects.filter(date__range=(first_day, last_day))
+    habit_rows = DailyHabitStats.objects.filter(date__range=(first_day, last_day))
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        user_rows = user_rows.filter(user_id__in=user_ids)
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        habit_rows = habit_rows.filter(habit_id__in=habit_ids)
+
+    with transaction.atomic(savepoint=False):
+        changed_users = _replace_rows(
+            DailyUserStats, 'user_id', _USER_COUNTERS, user_rows,
+            _user_totals(first_day, last_day, user_ids)
+        )
+        changed_habits = _replace_rows(
+            DailyHabitStats, 'habit_id', _HABIT_COUNTERS, habit_rows,
+            _habit_totals(first_day, last_day, habit_ids)
+        )
+
+    def bump_versions():
+        for user_id in {user_id for user_id, _ in changed_users}:
+            bump_heatmap_version(user_id)
+    transaction.on_commit(bump_versions)
+
+    return len(changed_users) + len(changed_habits)
+
+
+def reconcile_rollups(days=RECONCILE_DAYS, today=None):
+    """
+    Nightly job: recompute the rollups of the last ``days`` days before
+    today from the raw events.
+
+    Returns:
+        Number of rollup rows corrected
+    """
+    today = today or timezone.localdate()
+    first_day, last_day = today - timedelta(days=days), today - timedelta(days=1)
+    corrected = refresh_rollups(first_day, last_day)
+    if corrected:
+        logger.warning(f"Corrected {corrected} daily rollup rows between {first_day} and {last_day}")
+    return corrected
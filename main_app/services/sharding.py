@@ -0,0 +1,111 @@
+"""
+Sharded execution helpers for bulk background work.
+
+Rows are partitioned by a stable hash of their user id (the id modulo the
+shard count), so every shard sees a disjoint, repeatable slice of the data
+and all of a user's rows land in the same shard. Shards run in worker
+processes from a ``concurrent.futures`` pool.
+"""
+
+import os
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.db import connections
+from django.db.models import Value
+from django.db.models.functions import Mod
+
+logger = logging.getLogger(__name__)
+
+
+def shard_filter(queryset, shard_index, shard_count, field='user_id'):
+    """
+    Restrict a queryset to the rows belonging to one shard.
+    
+    Args:
+        queryset: The queryset to partition
+        shard_index: Zero-based index of the shard to keep
+        shard_count: Total number of shards
+        field: Integer field holding the user id
+    
+    Returns:
+        Filtered queryset
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+    
+    return queryset.annotate(
+        shard=Mod(field, Value(shard_count))
+    ).filter(shard=shard_index)
+
+
+class InlineExecutor:
+    """Executor that runs every submitted call immediately in the calling process"""
+    
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def shutdown(self, wait=True):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        return False
+
+
+def _init_worker():
+    """Prepare a pool worker: make sure Django is set up and drop inherited connections"""
+    import django
+    from django.apps import apps
+    
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'habit_tracker.settings')
+        django.setup()
+    
+    # Connections inherited from a forked parent must never be reused
+    connections.close_all()
+
+
+def shard_pool(shard_count, max_workers=None):
+    """
+    Create the executor shards are submitted to.
+    
+    Args:
+        shard_count: Number of shards that will be submitted per batch
+        max_workers: Worker processes to start. Defaults to one per shard,
+            capped at the CPU count. Pass 0 to run shards in the calling process.
+    
+    Returns:
+        An executor usable as a context manager
+    """
+    if max_workers == 0:
+        return InlineExecutor()
+    
+    # Never hand an open connection to forked children
+    connections.close_all()
+    
+    return ProcessPoolExecutor(
+        max_workers=max_workers or min(shard_count, os.cpu_count() or 1),
+        initializer=_init_worker
+    )
+
+
+def map_shards(pool, func, shard_count, *args, **kwargs):
+    """
+    Run ``func(*args, shard_index=i, shard_count=shard_count, **kwargs)`` for every shard.
+    
+    Returns:
+        List of results ordered by shard index
+    """
+    futures = [
+        pool.submit(func, *args, shard_index=shard_index, shard_count=shard_count, **kwargs)
+        for shard_index in range(shard_count)
+    ]
+    return [future.result() for future in futures]
@@ -0,0 +1,513 @@
+"""
+Streak engine.
+
+A habit's streak is the number of consecutive calendar periods (days, weeks
+or months, see services.periods) in which it was completed. The engine keeps
+``UserHabit.streak``, ``UserHabit.last_completed``, the completion counters
+(``completions_count``, ``longest_streak``) and the open HabitStreak record
+up to date from the previous state and the new event alone:
+
+* a completion in the same period as the last one changes nothing
+* a completion in the period right after the last one extends the streak
+* a completion after a gap starts a new streak of 1
+* a missed period (found by the sweep) closes the streak and resets it to 0
+
+Whichever path closes a HabitStreak record (a completion after a gap, the
+sweep or a rebuild), it ends on the last day of the streak's last period.
+
+Only completions back-dated before the last completed period need the full
+recomputation in ``rebuild_streak``, which is otherwise a repair path.
+Repairing many habits at once (imports, ``manage.py rebuild_streaks``) goes
+through ``rebuild_all_streaks``/``rebuild_streak_history``, which find the
+runs of consecutive periods of a whole batch of habits with NumPy.
+"""
+
+import logging
+from collections import defaultdict
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from ..models import UserHabit, HabitCompletion, HabitStreak, HabitAnalytics
+from .completion_bitmap import CompletionBitmap, add_period, build_bitmap
+from .periods import PERIODICITIES, period_index, period_start, period_end
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on ids per IN (...) clause for bulk streak updates
+BREAK_BATCH_SIZE = 500
+
+# Habits repaired per batch by rebuild_all_streaks
+REBUILD_BATCH_SIZE = 500
+
+
+def _periodicity(user_habit):
+    """The habit's periodicity; habits without a valid one are tracked daily"""
+    periodicity = user_habit.habit.periodicity
+    return periodicity if periodicity in PERIODICITIES else 'DAILY'
+
+
+def next_streak(periodicity, streak, last_completed, completion_date):
+    """
+    Compute the streak state after a completion.
+    
+    Returns:
+        (streak, last_completed), or None when the completion predates the
+        last completed period and the streak has to be rebuilt
+    """
+    if last_completed is None:
+        return 1, completion_date
+    
+    last_index = period_index(periodicity, last_completed)
+    new_index = period_index(periodicity, completion_date)
+    
+    if new_index == last_index:
+        return max(streak, 1), max(last_completed, completion_date)
+    if new_index == last_index + 1:
+        return streak + 1, completion_date
+    if new_index > last_index + 1:
+        return 1, completion_date
+    return None
+
+
+def _open_streak(user_habit, periodicity, streak, last_completed):
+    """Point the open HabitStreak record at the current streak"""
+    updated = HabitStreak.objects.filter(
+        user_habit_id=user_habit.pk,
+        end_date__isnull=True
+    ).update(streak_length=streak)
+    if not updated:
+        HabitStreak.objects.create(
+            user_habit_id=user_habit.pk,
+            streak_length=streak,
+            start_date=period_start(periodicity, period_index(periodicity, last_completed) - streak + 1)
+        )
+
+
+def record_completion(user_habit, completion_date):
+    """
+    Apply a new completion to the habit's streak in constant time.
+    
+    The habit row is locked while its state is read and written, so
+    concurrent completions of the same habit are applied one after another.
+    ``user_habit`` is updated in place.
+    
+    Returns:
+        The new streak
+    """
+    periodicity = _periodicity(user_habit)
+    
+    with transaction.atomic(savepoint=False):
+        (streak, last_completed, bitmap, origin,
+         completions, longest, missed) = UserHabit.objects.select_for_update().filter(
+            pk=user_habit.pk
+        ).values_list(
+            'streak', 'last_completed', 'completion_bitmap', 'bitmap_origin',
+            'completions_count', 'longest_streak', 'missed_count'
+        ).get()
+        
+        state = next_streak(periodicity, streak, last_completed, completion_date)
+        if state is None:
+            # Back-dated completion: the periods after it may now connect differently
+            return rebuild_streak(user_habit)
+        new_streak, new_last_completed = state
+        restarted = last_completed is not None and (
+            period_index(periodicity, new_last_completed) > period_index(periodicity, last_completed) + 1
+        )
+        new_bitmap, new_origin = add_period(bitmap, origin, period_index(periodicity, completion_date))
+        
+        if restarted:
+            # A gap the sweep has not recorded yet ends the previous streak
+            HabitStreak.objects.filter(
+                user_habit_id=user_habit.pk,
+                end_date__isnull=True
+            ).update(end_date=period_end(periodicity, period_index(periodicity, last_completed)))
+        UserHabit.objects.filter(pk=user_habit.pk).update(
+            streak=new_streak,
+            last_completed=new_last_completed,
+            completion_bitmap=new_bitmap,
+            bitmap_origin=new_origin,
+            completions_count=F('completions_count') + 1,
+            longest_streak=Greatest('longest_streak', Value(new_streak))
+        )
+        if restarted or new_streak != streak:
+            _open_streak(user_habit, periodicity, new_streak, new_last_completed)
+    
+    user_habit.streak = new_streak
+    user_habit.last_completed = new_last_completed
+    user_habit.completion_bitmap = new_bitmap
+    user_habit.bitmap_origin = new_origin
+    user_habit.completions_count = completions + 1
+    user_habit.longest_streak = max(longest, new_streak)
+    user_habit.missed_count = missed
+    return new_streak
+
+
+def rebuild_streak(user_habit, today=None):
+    """
+    Recompute a habit's streak from all of its completions.
+    
+    This is the repair path, for back-dated completions and for fixing
+    drifted data. A streak is only current if its last period is the current
+    or the previous one; otherwise a whole period was missed and it is 0.
+    ``user_habit`` is updated in place.
+    
+    Returns:
+        The rebuilt streak
+    """
+    periodicity = _periodicity(user_habit)
+    today = today or timezone.now().date()
+    
+    completion_dates = list(HabitCompletion.objects.filter(
+        user_habit_id=user_habit.pk
+    ).values_list('completion_date', flat=True))
+    last_completed = max(completion_dates, default=None)
+    bitmap, origin = build_bitmap([period_index(periodicity, day) for day in completion_dates])
+    completion_bitmap = CompletionBitmap(periodicity, bitmap, origin)
+    streak = completion_bitmap.current_streak(today)
+    longest = completion_bitmap.longest_streak()
+    
+    with transaction.atomic(savepoint=False):
+        HabitStreak.objects.filter(
+            user_habit_id=user_habit.pk,
+            end_date__isnull=True
+        ).delete()
+        UserHabit.objects.filter(pk=user_habit.pk).update(
+            streak=streak,
+            last_completed=last_completed,
+            completion_bitmap=bitmap,
+            bitmap_origin=origin,
+            completions_count=len(completion_dates),
+            longest_streak=longest
+        )
+        if streak:
+            _open_streak(user_habit, periodicity, streak, last_completed)
+    
+    user_habit.streak = streak
+    user_habit.last_completed = last_completed
+    user_habit.completion_bitmap = bitmap
+    user_habit.bitmap_origin = origin
+    user_habit.completions_count = len(completion_dates)
+    user_habit.longest_streak = longest
+    return streak
+
+
+# date.toordinal() of day 0 of numpy's datetime64[D], 1970-01-01
+_EPOCH_ORDINAL = 719163
+
+
+def period_indices(periodicity, dates):
+    """Vectorized ``period_index`` over a datetime64[D] array"""
+    if periodicity == 'DAILY':
+        return dates.astype(np.int64) + _EPOCH_ORDINAL
+    if periodicity == 'WEEKLY':
+        return (dates.astype(np.int64) + _EPOCH_ORDINAL - 1) // 7
+    if periodicity == 'MONTHLY':
+        return dates.astype('datetime64[M]').astype(np.int64) + 1970 * 12
+    raise ValueError(f"Unknown periodicity: {periodicity}")
+
+
+def _group_ends(groups):
+    """Position of the last element of every group in a sorted array of group codes"""
+    if not len(groups):
+        return groups
+    return np.flatnonzero(np.diff(groups, append=groups[-1] + 1))
+
+
+def find_runs(groups, indices):
+    """
+    Find the runs of consecutive period indices within each group.
+    
+    Args:
+        groups: Integer group (habit) codes
+        indices: Period indices; both arrays sorted by (group, index), with
+            repeated indices allowed
+    
+    Returns:
+        (run_groups, run_first, run_last) arrays with one entry per run, in
+        the same order
+    """
+    if not len(indices):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    
+    distinct = np.ones(len(indices), dtype=bool)
+    distinct[1:] = (groups[1:] != groups[:-1]) | (indices[1:] != indices[:-1])
+    groups, indices = groups[distinct], indices[distinct]
+    
+    # A run starts wherever the group changes or a period was skipped
+    starts = np.ones(len(indices), dtype=bool)
+    starts[1:] = (groups[1:] != groups[:-1]) | (np.diff(indices) != 1)
+    run_ids = np.cumsum(starts) - 1
+    run_last = np.empty(run_ids[-1] + 1, dtype=np.int64)
+    run_last[run_ids] = indices
+    return groups[starts], indices[starts], run_last
+
+
+def streak_runs(periodicity, completion_dates):
+    """
+    Group one habit's completion dates into runs of consecutive periods.
+    
+    Returns:
+        Sorted list of (first_index, last_index) period index pairs
+    """
+    indices = np.sort(period_indices(periodicity, np.array(completion_dates, dtype='datetime64[D]')))
+    _, first, last = find_runs(np.zeros(len(indices), dtype=np.int64), indices)
+    return list(zip(first.tolist(), last.tolist()))
+
+
+# Fields _rebuild_batch needs about each habit
+_REBUILD_FIELDS = (
+    'id', 'user_id', 'habit_id', 'habit__periodicity', 'streak', 'last_completed',
+    'completion_bitmap', 'bitmap_origin', 'completions_count', 'longest_streak'
+)
+
+
+def _rebuild_batch(habit_rows, today, collect=False):
+    """
+    Rebuild the streaks of a batch of habits from their completions.
+    
+    The batch's completions are streamed sorted by habit and date, turned
+    into period indices and split into runs with NumPy; the HabitStreak
+    records are then replaced, and the current and longest streaks and the
+    completion bitmaps written, with bulk statements.
+    
+    Args:
+        habit_rows: Tuples of _REBUILD_FIELDS
+        collect: Also return every habit's (periodicity, runs)
+    
+    Returns:
+        (stats, history)
+    """
+    habit_ids = [row[0] for row in habit_rows]
+    periodicities = {
+        row[0]: row[3] if row[3] in PERIODICITIES else 'DAILY' for row in habit_rows
+    }
+    
+    completions = list(HabitCompletion.objects.filter(
+        user_habit_id__in=habit_ids
+    ).order_by('user_habit_id', 'completion_date').values_list('user_habit_id', 'completion_date'))
+    
+    # Code the habits in the order the sorted stream returns them
+    codes = {}
+    for habit_id, _ in completions:
+        codes.setdefault(habit_id, len(codes))
+    coded_ids = list(codes)
+    groups = np.fromiter((codes[habit_id] for habit_id, _ in completions),
+                         dtype=np.int64, count=len(completions))
+    dates = np.array([day for _, day in completions], dtype='datetime64[D]')
+    
+    group_periodicities = np.array([periodicities[habit_id] for habit_id in coded_ids], dtype=object)
+    indices = np.empty(len(completions), dtype=np.int64)
+    for periodicity in PERIODICITIES:
+        mask = group_periodicities[groups] == periodicity
+        indices[mask] = period_indices(periodicity, dates[mask])
+    
+    run_groups, run_first, run_last = find_runs(groups, indices)
+    run_lengths = run_last - run_first + 1
+    final_runs = _group_ends(run_groups)
+    
+    # A habit's last run is its current streak if it reaches the previous period
+    today_indices = np.array(
+        [period_index(periodicity, today) for periodicity in group_periodicities], dtype=np.int64
+    )
+    is_current = run_last[final_runs] >= today_indices - 1
+    open_runs = np.zeros(len(run_first), dtype=bool)
+    open_runs[final_runs[is_current]] = True
+    
+    streaks = dict(zip(coded_ids, np.where(is_current, run_lengths[final_runs], 0).tolist()))
+    longest = dict(zip(coded_ids, np.maximum.reduceat(
+        run_lengths, np.append(0, final_runs[:-1] + 1)
+    ).tolist())) if len(run_lengths) else {}
+    group_ends = _group_ends(groups).tolist()
+    last_completed = {
+        coded_ids[code]: completions[position][1] for code, position in enumerate(group_ends)
+    }
+    bitmaps = {
+        coded_ids[code]: build_bitmap(indices[start:end + 1])
+        for code, (start, end) in enumerate(zip([0] + [end + 1 for end in group_ends[:-1]], group_ends))
+    }
+    
+    runs = list(zip(
+        run_groups.tolist(), run_first.tolist(), run_last.tolist(), run_lengths.tolist(), open_runs.tolist()
+    ))
+    streak_records = []
+    for code, first, last, length, is_open in runs:
+        periodicity = periodicities[coded_ids[code]]
+        streak_records.append(HabitStreak(
+            user_habit_id=coded_ids[code],
+            streak_length=length,
+            start_date=period_start(periodicity, first),
+            end_date=None if is_open else period_end(periodicity, last)
+        ))
+    
+    counts = dict(zip(coded_ids, np.bincount(groups, minlength=len(coded_ids)).tolist()))
+    
+    repaired = []
+    for (habit_id, _, _, _, streak, old_last_completed, old_bitmap, old_origin,
+         old_count, old_longest) in habit_rows:
+        bitmap, origin = bitmaps.get(habit_id, (b'', None))
+        state = (
+            streaks.get(habit_id, 0), last_completed.get(habit_id), bitmap, origin,
+            counts.get(habit_id, 0), longest.get(habit_id, 0)
+        )
+        if state != (streak, old_last_completed, bytes(old_bitmap), old_origin, old_count, old_longest):
+            repaired.append(UserHabit(
+                id=habit_id,
+                streak=state[0],
+                last_completed=state[1],
+                completion_bitmap=bitmap,
+                bitmap_origin=origin,
+                completions_count=state[4],
+                longest_streak=state[5]
+            ))
+    
+    habit_keys = {(row[1], row[2]): row[0] for row in habit_rows}
+    analytics = [
+        record for record in HabitAnalytics.objects.filter(
+            user_id__in={key[0] for key in habit_keys},
+            habit_id__in={key[1] for key in habit_keys}
+        ).only('id', 'user_id', 'habit_id', 'longest_streak', 'completions_count')
+        if (record.user_id, record.habit_id) in habit_keys
+    ]
+    for record in analytics:
+        habit_id = habit_keys[(record.user_id, record.habit_id)]
+        record.longest_streak = longest.get(habit_id, 0)
+        record.completions_count = counts.get(habit_id, 0)
+    
+    with transaction.atomic(savepoint=False):
+        HabitStreak.objects.filter(user_habit_id__in=habit_ids).delete()
+        HabitStreak.objects.bulk_create(streak_records, batch_size=BREAK_BATCH_SIZE)
+        UserHabit.objects.bulk_update(
+            repaired,
+            ['streak', 'last_completed', 'completion_bitmap', 'bitmap_origin', 'completions_count', 'longest_streak'],
+            batch_size=BREAK_BATCH_SIZE
+        )
+        HabitAnalytics.objects.bulk_update(
+            analytics, ['longest_streak', 'completions_count'], batch_size=BREAK_BATCH_SIZE
+        )
+    
+    history = {}
+    if collect:
+        history = {habit_id: (periodicities[habit_id], []) for habit_id in habit_ids}
+        for code, first, last, _, _ in runs:
+            history[coded_ids[code]][1].append((first, last))
+    
+    stats = {'completions': len(completions), 'runs': len(runs), 'repaired': len(repaired)}
+    return stats, history
+
+
+def rebuild_streak_history(user_habit_ids, today=None):
+    """
+    Recompute the streak and the whole HabitStreak history of several habits
+    from their completions, with a fixed number of queries per batch.
+    
+    Every run of consecutive periods becomes one HabitStreak record, closed on
+    the last day of its last period; the latest run stays open while it is
+    still current (see ``rebuild_streak``). Used after bulk imports, which
+    bypass the incremental engine.
+    
+    Returns:
+        Dict of user_habit_id to its (periodicity, runs), see ``streak_runs``
+    """
+    today = today or timezone.now().date()
+    history = {}
+    
+    for chunk in chunks(list(user_habit_ids)):
+        habit_rows = list(UserHabit.objects.filter(id__in=chunk).values_list(*_REBUILD_FIELDS))
+        _, batch_history = _rebuild_batch(habit_rows, today, collect=True)
+        history.update(batch_history)
+    
+    return history
+
+
+def rebuild_all_streaks(batch_size=REBUILD_BATCH_SIZE, today=None, progress=None):
+    """
+    Repair the streaks, HabitStreak history and longest streaks of every
+    habit, walking the habits in primary key order a batch at a time.
+    
+    Args:
+        batch_size: Habits per batch
+        progress: Optional callable receiving the running totals after each batch
+    
+    Returns:
+        Totals of habits, completions, runs and repaired habits
+    """
+    today = today or timezone.now().date()
+    totals = {'habits': 0, 'completions': 0, 'runs': 0, 'repaired': 0}
+    
+    last_id = None
+    while True:
+        habits = UserHabit.objects.order_by('id')
+        if last_id is not None:
+            habits = habits.filter(id__gt=last_id)
+        habit_rows = list(habits.values_list(*_REBUILD_FIELDS)[:batch_size])
+        if not habit_rows:
+            break
+        last_id = habit_rows[-1][0]
+        
+        stats, _ = _rebuild_batch(habit_rows, today)
+        totals['habits'] += len(habit_rows)
+        for key, value in stats.items():
+            totals[key] += value
+        if progress:
+            progress(totals)
+    
+    return totals
+
+
+def chunks(items, size=BREAK_BATCH_SIZE):
+    """Split a list into slices of at most ``size`` items, e.g. for IN (...) clauses"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def break_streaks(periodicity, broken, missed_end):
+    """
+    Close and reset the streaks of habits that missed the period ending on
+    missed_end, in bulk.
+    
+    Habits completed after the missed period (a catch-up sweep, or a user
+    who completed before their zone's sweep ran) already started a new
+    streak and are left alone.
+    
+    Args:
+        broken: List of (user_habit_id, streak, last_completed) with streak > 0
+        missed_end: Last day of the missed period
+    """
+    missed_index = period_index(periodicity, missed_end)
+    missed_start = period_start(periodicity, missed_index)
+    # Period index of each broken streak's last completed period
+    last_periods = {
+        habit_id: period_index(periodicity, last_completed) if last_completed else missed_index - 1
+        for habit_id, _, last_completed in broken
+        if last_completed is None or last_completed < missed_start
+    }
+    streaks = {habit_id: streak for habit_id, streak, _ in broken if habit_id in last_periods}
+    
+    for chunk in chunks(list(streaks)):
+        # Open records are closed on the last day of the streak's last
+        # period, like everywhere else. Queryset updates skip the pre_save
+        # signal, so this is done here.
+        open_records = HabitStreak.objects.filter(
+            user_habit_id__in=chunk, end_date__isnull=True, start_date__lte=missed_end
+        )
+        by_last_period = defaultdict(list)
+        for habit_id in open_records.values_list('user_habit_id', flat=True):
+            by_last_period[last_periods[habit_id]].append(habit_id)
+        for last, habit_ids in by_last_period.items():
+            open_records.filter(user_habit_id__in=habit_ids).update(end_date=period_end(periodicity, last))
+        closed = {habit_id for habit_ids in by_last_period.values() for habit_id in habit_ids}
+        
+        # Habits whose streak predates the records get one saved for the history
+        HabitStreak.objects.bulk_create([
+            HabitStreak(
+                user_habit_id=habit_id,
+                streak_length=streaks[habit_id],
+                start_date=period_start(periodicity, last_periods[habit_id] - streaks[habit_id] + 1),
+                end_date=period_end(periodicity, last_periods[habit_id])
+            )
+            for habit_id in chunk if habit_id not in closed
+        ])
+        UserHabit.objects.filter(id__in=chunk).update(streak=0)
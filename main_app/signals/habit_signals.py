@@ -10,51 +10,22 @@ from datetime import timedelta
 from ..models.habit_models import (
     HabitCompletion, UserHabit, HabitStreak, MissedHabit
 )
-from ..models.analytics_models import HabitAnalytics
-from ..models.gamification_models import UserPoints
+from ..services.completion_service import CompletionService
+from ..services.counters import count_misses
 
 
 @receiver(post_save, sender=HabitCompletion)
 def update_streak_on_completion(sender, instance, created, **kwargs):
-    """Update streak when a habit is completed"""
+    """Update streak, analytics and points when a habit is completed"""
+    if created and not getattr(instance, '_defer_side_effects', False):
+        CompletionService.apply_completion(instance)
+
+
+@receiver(post_save, sender=MissedHabit)
+def count_missed_habit(sender, instance, created, **kwargs):
+    """Count a miss recorded one at a time; the sweep counts its bulk inserts itself"""
     if created:
-        user_habit = instance.user_habit
-        today = instance.completion_date
-        
-        # Increment streak
-        user_habit.increment_streak()
-        user_habit.last_completed = today
-        user_habit.save()
-        
-        # Update analytics
-        analytics, _ = HabitAnalytics.objects.get_or_create(
-            user=user_habit.user,
-            habit=user_habit.habit
-        )
-        analytics.calculate_analytics()
-        
-        # Award points
-        try:
-            user_points, _ = UserPoints.objects.get_or_create(user=user_habit.user)
-            points = 10  # Basic points for completion
-            
-            # Award bonus points for continuing streak
-            if user_habit.streak >= 7:
-                streak_bonus = min(user_habit.streak // 7 * 5, 50)  # Cap bonus at 50 points
-                points += streak_bonus
-            
-            user_points.add_points(
-                points,
-                'COMPLETION',
-                f"Completed {user_habit.habit.name}",
-                reference_id=str(instance.id)
-            )
-            
-        except Exception as e:
-            # Log error but don't stop execution
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error awarding points for habit completion: {e}")
+        count_misses([instance.user_habit_id])
 
 
 @receiver(pre_save, sender=UserHabit)
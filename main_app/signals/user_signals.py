@@ -2,10 +2,11 @@
 Signal handlers for user-related models.
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from ..models.user_models import UserProfile
+from ..updater.timezones import invalidate_timezone_index
 
 
 @receiver(post_save, sender=User)
@@ -24,3 +25,19 @@ def save_user_profile(sender, instance, **kwargs):
     except UserProfile.DoesNotExist:
         # Create profile if it doesn't exist
         UserProfile.objects.create(user=instance)
+
+
+@receiver(post_init, sender=UserProfile)
+def remember_timezone(sender, instance, **kwargs):
+    """Remember the timezone a profile was loaded with"""
+    # Read from __dict__ so a deferred timezone is not fetched
+    instance._loaded_timezone = instance.__dict__.get('timezone')
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_sweep_timezones(sender, instance, created, **kwargs):
+    """Forget the missed-habit sweep's timezone index when a profile's timezone changes"""
+    timezone = instance.__dict__.get('timezone')
+    if created or timezone != instance._loaded_timezone:
+        invalidate_timezone_index()
+    instance._loaded_timezone = timezone
@@ -0,0 +1,10 @@
+"""
+Background task queue for the Habit Tracker application.
+"""
+
+from .queue import (
+    task, enqueue, claim_tasks, run_task, run_pending, backoff_seconds, UnknownTask
+)
+
+# Register the application's tasks
+from . import jobs
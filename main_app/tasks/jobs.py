@@ -0,0 +1,52 @@
+"""
+Background tasks run by ``manage.py run_worker``.
+"""
+
+import json
+import logging
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage
+from ..models import UserHabit, HabitAnalytics
+from ..services.notification_service import NotificationService
+from .queue import task
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def send_streak_milestone_email(user_habit_id, streak_length):
+    """Send the streak milestone email for a completion"""
+    user_habit = UserHabit.objects.select_related('user', 'habit').filter(id=user_habit_id).first()
+    if user_habit is None:
+        return
+    NotificationService.send_streak_milestone_email(user_habit, streak_length)
+
+
+@task
+def recalculate_habit_analytics(user_id, habit_id):
+    """
+    Recalculate the analytics of one user's habit. Completions update the
+    analytics in place, so this is only queued for repairs.
+    """
+    analytics, _ = HabitAnalytics.objects.get_or_create(user_id=user_id, habit_id=habit_id)
+    analytics.calculate_analytics()
+
+
+@task(max_attempts=3)
+def export_user_data(user_id):
+    """Build a user's data export and email it to them as a JSON attachment"""
+    from ..views.admin_settings_privacy import _export_user_data
+    
+    user = User.objects.select_related('profile').get(id=user_id)
+    data = _export_user_data(None, user)
+    
+    message = EmailMessage(
+        'Your Habit Tracker data export',
+        'Your requested data export is attached.',
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email]
+    )
+    message.attach(f'{user.username}_data_export.json', json.dumps(data, indent=4), 'application/json')
+    message.send(fail_silently=False)
+    logger.info(f"Emailed data export to {user.email}")
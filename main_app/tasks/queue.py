@@ -0,0 +1,185 @@
+"""
+Database-backed task queue.
+
+Tasks are plain functions registered with ``@task`` and called with the
+JSON payload given to ``enqueue`` as keyword arguments. Workers claim due
+tasks with a single conditional UPDATE, so any number of ``run_worker``
+processes can share the queue. A claimed task stays invisible to other
+workers until its visibility timeout expires; failures are retried with
+exponential backoff until max_attempts is reached.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from django.db.models import F, Q
+from django.utils import timezone
+from ..models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# Registered task functions by name
+TASKS = {}
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_VISIBILITY_TIMEOUT = 300
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+
+
+class UnknownTask(Exception):
+    """Raised when a task name has no registered function"""
+    pass
+
+
+def task(func=None, *, name=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Register a function as a background task.
+    
+    Usable as ``@task`` or ``@task(name=..., max_attempts=...)``.
+    """
+    def register(func):
+        func.task_name = name or func.__name__
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    
+    if func is not None:
+        return register(func)
+    return register
+
+
+def enqueue(task_or_name, delay=None, **payload):
+    """
+    Queue a task for a worker to run.
+    
+    Args:
+        task_or_name: A registered task function or its name
+        delay: Optional timedelta before the task becomes available
+        **payload: JSON serialisable keyword arguments for the task
+    
+    Returns:
+        The created BackgroundTask
+    """
+    name = getattr(task_or_name, 'task_name', task_or_name)
+    func = TASKS.get(name)
+    if func is None:
+        raise UnknownTask(name)
+    
+    background_task = BackgroundTask(
+        name=name,
+        max_attempts=func.max_attempts,
+        available_at=timezone.now() + (delay or timedelta())
+    )
+    background_task.payload = payload
+    background_task.save()
+    return background_task
+
+
+def backoff_seconds(attempts):
+    """Delay before retrying a task that has failed ``attempts`` times"""
+    return min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+
+def _expire_abandoned(now):
+    """Fail running tasks whose worker vanished after their last allowed attempt"""
+    BackgroundTask.objects.filter(
+        status='RUNNING',
+        locked_until__lt=now,
+        attempts__gte=F('max_attempts')
+    ).update(
+        status='FAILED',
+        last_error='Visibility timeout expired on the final attempt',
+        finished_at=now
+    )
+
+
+def claim_tasks(worker_id, limit=10, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """
+    Claim up to ``limit`` due tasks for a worker.
+    
+    Pending tasks that are due, and running tasks whose visibility timeout
+    expired, are claimable. The claim is one UPDATE guarded by the same
+    conditions, so a task is only ever handed to one worker at a time.
+    
+    Returns:
+        List of claimed BackgroundTask rows
+    """
+    now = timezone.now()
+    _expire_abandoned(now)
+    
+    claimable = (
+        Q(status='PENDING', available_at__lte=now) |
+        Q(status='RUNNING', locked_until__lt=now)
+    ) & Q(attempts__lt=F('max_attempts'))
+    
+    candidates = list(
+        BackgroundTask.objects.filter(claimable).order_by('available_at').values_list('id', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    
+    locked_until = now + timedelta(seconds=visibility_timeout)
+    BackgroundTask.objects.filter(claimable, id__in=candidates).update(
+        status='RUNNING',
+        locked_by=worker_id,
+        locked_until=locked_until,
+        attempts=F('attempts') + 1
+    )
+    return list(BackgroundTask.objects.filter(
+        id__in=candidates,
+        status='RUNNING',
+        locked_by=worker_id,
+        locked_until=locked_until
+    ))
+
+
+def run_task(background_task):
+    """
+    Execute a claimed task and record the outcome.
+    
+    Returns:
+        True if the task succeeded
+    """
+    owned = BackgroundTask.objects.filter(
+        pk=background_task.pk,
+        locked_by=background_task.locked_by,
+        locked_until=background_task.locked_until
+    )
+    
+    try:
+        func = TASKS.get(background_task.name)
+        if func is None:
+            raise UnknownTask(background_task.name)
+        func(**background_task.payload)
+    except Exception as e:
+        now = timezone.now()
+        error = f"{e.__class__.__name__}: {e}\n{traceback.format_exc()}"
+        if background_task.attempts >= background_task.max_attempts:
+            owned.update(status='FAILED', last_error=error, finished_at=now)
+            logger.error(f"Task {background_task} failed permanently: {e}")
+        else:
+            owned.update(
+                status='PENDING',
+                last_error=error,
+                locked_until=None,
+                available_at=now + timedelta(seconds=backoff_seconds(background_task.attempts))
+            )
+            logger.warning(f"Task {background_task} failed, will retry: {e}")
+        return False
+    
+    owned.update(status='DONE', locked_until=None, finished_at=timezone.now())
+    return True
+
+
+def run_pending(worker_id, limit=10, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """
+    Claim and run one batch of due tasks.
+    
+    Returns:
+        Number of tasks that were run
+    """
+    claimed = claim_tasks(worker_id, limit, visibility_timeout)
+    for background_task in claimed:
+        run_task(background_task)
+    return len(claimed)
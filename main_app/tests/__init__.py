@@ -5,4 +5,20 @@ from .test_user_signals import *
 from .test_habit_signals import *
 from .test_gamification_signals import *
 from .test_notification_settings import *
-from .test_integration import *
\ No newline at end of file
+from .test_integration import *
+from .test_periods import *
+from .test_email_delivery import *
+from .test_notification_preferences import *
+from .test_tasks import *
+from .test_leader import *
+from .test_instrumentation import *
+from .test_streaks import *
+from .test_completion_service import *
+from .test_completion_import import *
+from .test_completion_bitmap import *
+from .test_heatmap import *
+from .test_analytics_controller import *
+from .test_rollups import *
+from .test_counters import *
+from .test_histogram import *
+from .test_cohorts import *
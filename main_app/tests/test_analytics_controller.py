@@ -0,0 +1,236 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from main_app.analytics.controller import AnalyticsController, SYSTEM_OVERVIEW_CACHE_KEY
+from main_app.models import (
+    Habit, UserHabit, HabitCompletion, MissedHabit, PointTransaction, HabitAnalytics
+)
+from main_app.services.analytics_service import AnalyticsService
+from main_app.services.counters import reconcile_counters
+
+# Users, habits, user habits, completion trend, missed habits and points
+SYSTEM_OVERVIEW_QUERIES = 6
+
+# User, annotated habits, points and the recent activity union
+USER_ANALYTICS_QUERIES = 4
+
+# Query budgets count database work only, so measure them against a
+# process-local cache rather than the shared database cache
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TestSystemOverview(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.habit = Habit.objects.create(name='Journal', description='Journal daily', periodicity='DAILY')
+    
+    def _add_user(self, name, completed_days_ago):
+        user = User.objects.create_user(username=name, password='testpass123')
+        user_habit = UserHabit.objects.create(user=user, habit=self.habit)
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=user_habit, completion_date=self.today - timedelta(days=n))
+            for n in completed_days_ago
+        ])
+        return user_habit
+    
+    def test_fixed_query_count(self):
+        """Test that the overview costs the same number of queries however much data there is"""
+        self._add_user('first', [0, 1])
+        with self.assertNumQueries(SYSTEM_OVERVIEW_QUERIES):
+            AnalyticsController.get_system_overview()
+        
+        AnalyticsController.invalidate_system_overview()
+        for i in range(5):
+            self._add_user(f'user{i}', range(0, 40, i + 1))
+        with self.assertNumQueries(SYSTEM_OVERVIEW_QUERIES):
+            AnalyticsController.get_system_overview()
+    
+    def test_cached_until_invalidated(self):
+        """Test that repeat loads come from the cache until invalidated"""
+        self._add_user('first', [0])
+        AnalyticsController.get_system_overview()
+        
+        self._add_user('second', [0])
+        with self.assertNumQueries(0):
+            overview = AnalyticsController.get_system_overview()
+        self.assertEqual(overview['completion_stats']['today'], 1)
+        
+        AnalyticsController.invalidate_system_overview()
+        self.assertEqual(AnalyticsController.get_system_overview()['completion_stats']['today'], 2)
+    
+    def test_overview_values(self):
+        """Test the counters and the gap-filled 31-day trend"""
+        user_habit = self._add_user('first', [0, 1, 5, 31])
+        self._add_user('second', [1])
+        UserHabit.objects.filter(pk=user_habit.pk).update(is_active=False)
+        MissedHabit.objects.create(user_habit=user_habit, missed_date=self.today - timedelta(days=1))
+        PointTransaction.objects.create(user=user_habit.user, amount=10, transaction_type='BONUS', description='Today')
+        PointTransaction.objects.create(
+            user=user_habit.user, amount=5, transaction_type='BONUS', description='Earlier',
+            timestamp=timezone.now() - timedelta(days=3)
+        )
+        
+        overview = AnalyticsController.get_system_overview()
+        
+        self.assertEqual(overview['user_stats']['total'], 2)
+        self.assertEqual(overview['user_stats']['new_today'], 2)
+        self.assertEqual(overview['habit_stats']['active_habits'], 1)
+        self.assertEqual(overview['habit_stats']['inactive_habits'], 1)
+        self.assertEqual(
+            {key: overview['completion_stats'][key] for key in ('today', 'yesterday', 'this_month', 'missed_yesterday')},
+            {'today': 1, 'yesterday': 2, 'this_month': 4, 'missed_yesterday': 1}
+        )
+        self.assertEqual(overview['points'], {'total_awarded': 15, 'today': 10})
+        trend = overview['trends']['daily_completions']
+        self.assertEqual(len(trend), 31)
+        self.assertEqual(trend[-1], {'date': self.today.strftime('%Y-%m-%d'), 'count': 1})
+        self.assertEqual([day['count'] for day in trend[-6:]], [1, 0, 0, 0, 2, 1])
+
+
+class TestSystemOverviewInvalidation(TestCase):
+    def test_invalidation_reaches_other_processes(self):
+        """Test that the scheduler's invalidation drops the overview cached by web workers"""
+        cache.clear()
+        AnalyticsController.get_system_overview()
+        scheduler_process = caches.create_connection('default')
+        
+        with mock.patch('main_app.analytics.controller.cache', scheduler_process):
+            AnalyticsController.invalidate_system_overview()
+        
+        self.assertIsNone(cache.get(SYSTEM_OVERVIEW_CACHE_KEY))
+
+
+class TestUserAnalytics(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.user = User.objects.create_user(username='analysed', password='testpass123')
+    
+    def _add_habit(self, name, completed_days_ago, missed_days_ago=()):
+        habit = Habit.objects.create(name=name, description=name, periodicity='DAILY')
+        user_habit = UserHabit.objects.create(
+            user=self.user, habit=habit, start_date=self.today - timedelta(days=10)
+        )
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(
+                user_habit=user_habit,
+                completion_date=self.today - timedelta(days=n),
+                created_at=timezone.now() - timedelta(days=n)
+            )
+            for n in completed_days_ago
+        ])
+        MissedHabit.objects.bulk_create([
+            MissedHabit(user_habit=user_habit, missed_date=self.today - timedelta(days=n))
+            for n in missed_days_ago
+        ])
+        # bulk_create bypasses the counters
+        reconcile_counters()
+        return user_habit
+    
+    def test_fixed_query_count(self):
+        """Test that the lookup costs the same number of queries however many habits there are"""
+        self._add_habit('Read', [0, 1])
+        with self.assertNumQueries(USER_ANALYTICS_QUERIES):
+            AnalyticsController.get_user_analytics(user_id=self.user.id)
+        
+        for i in range(10):
+            self._add_habit(f'Habit {i}', range(0, 8, i + 1), [9])
+        with self.assertNumQueries(USER_ANALYTICS_QUERIES):
+            data = AnalyticsController.get_user_analytics(user_id=self.user.id)
+        self.assertEqual(data['summary']['total_habits'], 11)
+    
+    def test_counts_and_recent_activity(self):
+        """Test the per-habit counts and the merged, newest-first activity stream"""
+        self._add_habit('Read', [1, 2, 3], [4, 5])
+        self._add_habit('Run', [0])
+        PointTransaction.objects.create(
+            user=self.user, amount=5, transaction_type='BONUS', description='Bonus',
+            timestamp=timezone.now() - timedelta(hours=36)
+        )
+        
+        data = AnalyticsController.get_user_analytics(username='analysed')
+        
+        counts = {habit['name']: (habit['completions_count'], habit['missed_count']) for habit in data['habits']}
+        self.assertEqual(counts, {'Read': (3, 2), 'Run': (1, 0)})
+        self.assertEqual(data['summary']['completion_ratio'], 66.7)
+        self.assertEqual(
+            [(entry['type'], entry.get('habit_name')) for entry in data['recent_activity']],
+            [('completion', 'Run'), ('completion', 'Read'), ('points', None),
+             ('completion', 'Read'), ('completion', 'Read')]
+        )
+    
+    def test_fix_user_analytics(self):
+        """Test that fixing a user's analytics rewrites every habit's row in bulk"""
+        user_habit = self._add_habit('Read', [0, 1, 2], [5])
+        self._add_habit('Run', [])
+        
+        AnalyticsController.fix_user_analytics(user_id=self.user.id)
+        MissedHabit.objects.create(user_habit=user_habit, missed_date=self.today - timedelta(days=6))
+        result = AnalyticsController.fix_user_analytics(user_id=self.user.id)
+        
+        self.assertEqual((result['fixed_count'], result['total_count']), (2, 2))
+        analytics = HabitAnalytics.objects.get(user=self.user, habit=user_habit.habit)
+        self.assertEqual((analytics.longest_streak, analytics.missed_count), (3, 2))
+        self.assertEqual(analytics.completion_rate, round(3 / 11 * 100, 2))
+        self.assertEqual(HabitAnalytics.objects.filter(user=self.user).count(), 2)
+
+
+class TestRecalculateAllAnalytics(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.habit = Habit.objects.create(name='Walk', description='Walk daily', periodicity='DAILY')
+        self.user_habits = []
+        for i in range(5):
+            user = User.objects.create_user(username=f'walker{i}', password='testpass123')
+            user_habit = UserHabit.objects.create(
+                user=user, habit=self.habit, start_date=self.today - timedelta(days=9)
+            )
+            HabitCompletion.objects.bulk_create([
+                HabitCompletion(user_habit=user_habit, completion_date=self.today - timedelta(days=n))
+                for n in range(i + 1)
+            ])
+            MissedHabit.objects.bulk_create([
+                MissedHabit(user_habit=user_habit, missed_date=self.today - timedelta(days=9 - n))
+                for n in range(i)
+            ])
+            self.user_habits.append(user_habit)
+    
+    def test_batches_and_totals(self):
+        """Test that every habit is recalculated in batches, with progress reported after each"""
+        reported = []
+        totals = AnalyticsService.recalculate_all_analytics(
+            batch_size=2, progress=lambda totals: reported.append(totals['processed'])
+        )
+        
+        self.assertEqual(totals, {'processed': 5, 'succeeded': 5, 'failed': 0})
+        self.assertEqual(reported, [2, 4, 5])
+        rows = {
+            analytics.user_id: (analytics.longest_streak, analytics.missed_count, analytics.completion_rate)
+            for analytics in HabitAnalytics.objects.all()
+        }
+        self.assertEqual(
+            rows,
+            {uh.user_id: (i + 1, i, (i + 1) * 10.0) for i, uh in enumerate(self.user_habits)}
+        )
+    
+    def test_queries_per_batch_do_not_grow(self):
+        """Test that a batch costs the same number of queries however many habits it holds"""
+        AnalyticsService.recalculate_analytics_bulk([uh.id for uh in self.user_habits], self.today)
+        with CaptureQueriesContext(connection) as small:
+            AnalyticsService.recalculate_analytics_bulk([uh.id for uh in self.user_habits[:1]], self.today)
+        with CaptureQueriesContext(connection) as large:
+            AnalyticsService.recalculate_analytics_bulk([uh.id for uh in self.user_habits], self.today)
+        self.assertEqual(len(small), len(large))
+    
+    def test_sharded_run_covers_every_habit(self):
+        """Test that the shards together recalculate every habit"""
+        summary = AnalyticsService.recalculate_all_analytics_sharded(2, max_workers=0)
+        
+        self.assertEqual((summary['processed'], summary['succeeded']), (5, 5))
+        self.assertEqual(HabitAnalytics.objects.count(), 5)
@@ -0,0 +1,114 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from main_app.analytics.metrics import EngagementMetrics
+from main_app.models import DailyUserStats, UserCohort, CohortActivity
+from main_app.services.cohorts import _VERSION_KEY, build_cohorts, cohort_version
+
+
+# Query budgets count database work only, so measure them against a
+# process-local cache rather than the shared database cache
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TestCohortRetention(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        # Alice and Bob share a month cohort; Carol joined in a later month
+        self.alice = self._user('alice', joined_days_ago=40, active_days=[1, 8, 35])
+        self.bob = self._user('bob', joined_days_ago=40, active_days=[0])
+        self.carol = self._user('carol', joined_days_ago=3, active_days=[1])
+
+    def _user(self, username, joined_days_ago, active_days):
+        user = User.objects.create_user(username=username, password='testpass123')
+        User.objects.filter(pk=user.pk).update(date_joined=timezone.now() - timedelta(days=joined_days_ago))
+        joined = self.today - timedelta(days=joined_days_ago)
+        for day in active_days:
+            DailyUserStats.objects.create(user=user, date=joined + timedelta(days=day), completions=1)
+        return user
+
+    def _weeks(self, user):
+        return list(CohortActivity.objects.filter(cohort__user=user).order_by('week').values_list(
+            'week', 'first_day', 'last_day'
+        ))
+
+    def test_build_folds_activity(self):
+        """Test that the build records each user's cohorts and active days since signup"""
+        totals = build_cohorts(days=None, today=self.today)
+
+        self.assertEqual(totals, {'cohorts': 3, 'users': 3})
+        cohort = UserCohort.objects.get(user=self.alice)
+        joined = self.today - timedelta(days=40)
+        self.assertEqual(cohort.joined, joined)
+        self.assertEqual(cohort.cohort_week.weekday(), 0)
+        self.assertEqual(cohort.cohort_month, joined.replace(day=1))
+        self.assertEqual((cohort.first_active_day, cohort.last_active_day), (1, 35))
+        self.assertEqual(self._weeks(self.alice), [(0, 1, 1), (1, 8, 8), (5, 35, 35)])
+
+    def test_build_is_incremental(self):
+        """Test that later builds merge new days into the recorded activity"""
+        build_cohorts(days=None, today=self.today)
+        DailyUserStats.objects.create(user=self.alice, date=self.today - timedelta(days=4), completions=2)
+        # A day with only points is not activity
+        DailyUserStats.objects.create(user=self.bob, date=self.today - timedelta(days=4), points=5)
+
+        totals = build_cohorts(today=self.today)
+
+        self.assertEqual(totals, {'cohorts': 0, 'users': 2})
+        self.assertEqual(self._weeks(self.alice)[-1], (5, 35, 36))
+        self.assertEqual(UserCohort.objects.get(user=self.bob).last_active_day, 0)
+        # Folding the same days again changes nothing
+        build_cohorts(today=self.today)
+        self.assertEqual(self._weeks(self.alice)[-1], (5, 35, 36))
+        self.assertEqual(CohortActivity.objects.filter(cohort__user=self.alice).count(), 3)
+
+    def test_retention_matrix(self):
+        """Test the day-N and week-N cells, counting only users who have reached them"""
+        build_cohorts(days=None, today=self.today)
+
+        with self.assertNumQueries(1):
+            matrix = EngagementMetrics.retention_matrix(weeks=6)
+
+        self.assertEqual([row['cohort_size'] for row in matrix], [1, 2])
+        recent, older = matrix
+        self.assertEqual([cell['rate'] for cell in older['days']], [50.0, 50.0, 50.0])
+        self.assertEqual(
+            [cell['rate'] for cell in older['weeks']],
+            [50.0, 0.0, 0.0, 0.0, 50.0, None]
+        )
+        # Carol has reached day 1 but not day 7
+        self.assertEqual(recent['days'][0], {'day': 1, 'users': 1, 'retained': 1, 'rate': 100.0})
+        self.assertIsNone(recent['days'][1]['rate'])
+
+        rates = EngagementMetrics.retention_rates()
+        self.assertEqual([row['retention_30d'] for row in rates], [0, 50.0])
+
+    def test_matrix_cached_until_next_build(self):
+        """Test that the matrix is served from the cache until a build completes"""
+        build_cohorts(days=None, today=self.today)
+        EngagementMetrics.retention_matrix(period='week')
+
+        DailyUserStats.objects.create(user=self.bob, date=self.today - timedelta(days=2), completions=1)
+        with self.assertNumQueries(0):
+            matrix = EngagementMetrics.retention_matrix(period='week')
+        self.assertEqual(matrix[-1]['days'][0]['retained'], 1)
+
+        build_cohorts(today=self.today)
+        with self.assertNumQueries(1):
+            matrix = EngagementMetrics.retention_matrix(period='week')
+        self.assertEqual(matrix[-1]['days'][0]['retained'], 2)
+
+
+class TestCohortCacheVersion(TestCase):
+    def test_build_invalidates_other_processes(self):
+        """Test that a build run by the scheduler invalidates the matrices cached by web workers"""
+        web_worker = caches.create_connection('default')
+        version = cohort_version()
+        
+        build_cohorts(today=timezone.localdate())
+        
+        self.assertEqual(web_worker.get(_VERSION_KEY), version + 1)
@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from main_app.models import Habit, UserHabit, HabitCompletion
+from main_app.services.completion_bitmap import CompletionBitmap, add_period, build_bitmap, decode
+from main_app.services.periods import period_index
+from main_app.services.streaks import rebuild_all_streaks
+
+
+class TestCompletionBitmap(TestCase):
+    def setUp(self):
+        self.today = date(2025, 3, 12)
+        # Completed 9-7 days ago, 5 days ago, and yesterday and today
+        self.days = [self.today - timedelta(days=n) for n in (9, 8, 7, 5, 1, 0)]
+        bitmap, origin = build_bitmap([period_index('DAILY', day) for day in self.days])
+        self.bitmap = CompletionBitmap('DAILY', bitmap, origin)
+    
+    def test_build_and_add_agree(self):
+        """Test that setting bits one at a time, in any order, builds the same bitmap"""
+        bitmap, origin = b'', None
+        for day in reversed(self.days):
+            bitmap, origin = add_period(bitmap, origin, period_index('DAILY', day))
+        
+        self.assertEqual((bitmap, origin), build_bitmap([period_index('DAILY', day) for day in self.days]))
+        self.assertEqual(decode(bitmap), 0b1100010111)
+    
+    def test_streaks(self):
+        """Test run-length streaks, including an open current period"""
+        self.assertEqual(self.bitmap.current_streak(self.today), 2)
+        self.assertEqual(self.bitmap.current_streak(self.today + timedelta(days=1)), 2)
+        self.assertEqual(self.bitmap.current_streak(self.today + timedelta(days=2)), 0)
+        self.assertEqual(self.bitmap.longest_streak(), 3)
+    
+    def test_counts_and_rates(self):
+        """Test popcount-based counts over ranges reaching outside the stored bits"""
+        self.assertEqual(self.bitmap.completed_periods(self.today - timedelta(days=30), self.today), 6)
+        self.assertEqual(self.bitmap.completed_periods(self.today - timedelta(days=6), self.today - timedelta(days=2)), 1)
+        self.assertEqual(self.bitmap.completion_rate(self.today - timedelta(days=9), self.today), 60.0)
+        self.assertTrue(self.bitmap.is_completed(self.today - timedelta(days=5)))
+        self.assertFalse(self.bitmap.is_completed(self.today - timedelta(days=4)))
+        self.assertFalse(self.bitmap.is_completed(self.today - timedelta(days=40)))
+    
+    def test_slice(self):
+        """Test that a slice lists every period in range with its flag"""
+        flags = self.bitmap.slice(self.today - timedelta(days=11), self.today - timedelta(days=6))
+        self.assertEqual([completed for _, completed in flags], [False, False, True, True, True, False])
+        self.assertEqual(flags[0][0], period_index('DAILY', self.today - timedelta(days=11)))
+    
+    def test_weekly_periods(self):
+        """Test that several completions in one week set a single bit"""
+        bitmap, origin = build_bitmap([period_index('WEEKLY', date(2025, 3, day)) for day in (3, 5, 9, 10)])
+        weekly = CompletionBitmap('WEEKLY', bitmap, origin)
+        self.assertEqual(weekly.completed_periods(date(2025, 3, 1), date(2025, 3, 16)), 2)
+        self.assertTrue(weekly.is_completed(date(2025, 3, 16)))
+
+
+class TestBitmapSync(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='bitmapper', password='testpass123')
+        habit = Habit.objects.create(name='Walk', description='Walk daily', periodicity='DAILY')
+        self.user_habit = UserHabit.objects.create(user=user, habit=habit)
+        self.today = date.today()
+    
+    def _bitmap(self):
+        user_habit = UserHabit.objects.select_related('habit').get(pk=self.user_habit.pk)
+        return CompletionBitmap.for_user_habit(user_habit)
+    
+    def test_completions_set_bits(self):
+        """Test that live and back-dated completions both keep the bitmap in sync"""
+        for days_ago in (3, 0, 1, 5):
+            HabitCompletion.objects.create(
+                user_habit=self.user_habit,
+                completion_date=self.today - timedelta(days=days_ago)
+            )
+        
+        bitmap = self._bitmap()
+        self.assertEqual(
+            [completed for _, completed in bitmap.slice(self.today - timedelta(days=5), self.today)],
+            [True, False, True, False, True, True]
+        )
+        self.assertEqual(bitmap.current_streak(self.today), 2)
+    
+    def test_rebuild_restores_bitmap(self):
+        """Test that the batch rebuild recreates lost bitmaps"""
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=self.user_habit, completion_date=self.today - timedelta(days=n))
+            for n in range(10)
+        ])
+        self.assertEqual(self._bitmap().completed_periods(self.today - timedelta(days=9), self.today), 0)
+        
+        rebuild_all_streaks()
+        
+        bitmap = self._bitmap()
+        self.assertEqual(bitmap.completed_periods(self.today - timedelta(days=9), self.today), 10)
+        self.assertEqual(bitmap.longest_streak(), 10)
@@ -0,0 +1,138 @@
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from main_app.models import (
+    Habit, UserHabit, HabitCompletion, HabitStreak, HabitAnalytics, UserPoints,
+    PointTransaction, BackgroundTask
+)
+from main_app.services.completion_import import import_completions
+from main_app.services.streaks import streak_runs
+
+
+class TestStreakRuns(TestCase):
+    def test_runs_of_consecutive_periods(self):
+        """Test that dates group into runs of consecutive periods"""
+        dates = [date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 2), date(2025, 3, 5)]
+        runs = streak_runs('DAILY', dates)
+        self.assertEqual([last - first + 1 for first, last in runs], [2, 1])
+
+
+class TestCompletionImport(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='testpass123')
+        self.habit = Habit.objects.create(name='Read', description='Read daily', periodicity='DAILY')
+        self.today = date.today()
+        self.user_habit = UserHabit.objects.create(user=self.user, habit=self.habit, start_date=self.today)
+    
+    def _rows(self, *days_ago):
+        return [
+            {'user_habit_id': self.user_habit.id, 'completion_date': (self.today - timedelta(days=n)).isoformat()}
+            for n in days_ago
+        ]
+    
+    def test_import_rebuilds_streaks_and_history(self):
+        """Test that imported history produces the streak, its records and analytics"""
+        # A closed run of 3 days, then a current run of 8 days
+        result = import_completions(self._rows(*range(14, 11, -1), *range(7, -1, -1)), today=self.today)
+        
+        self.assertEqual((result.rows, result.created, result.habits), (11, 11, 1))
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 8)
+        self.assertEqual(self.user_habit.last_completed, self.today)
+        self.assertEqual(self.user_habit.start_date, self.today - timedelta(days=14))
+        self.assertEqual(
+            list(HabitStreak.objects.filter(user_habit=self.user_habit).order_by('start_date').values_list(
+                'streak_length', 'end_date'
+            )),
+            [(3, self.today - timedelta(days=12)), (8, None)]
+        )
+        analytics = HabitAnalytics.objects.get(user=self.user, habit=self.habit)
+        self.assertEqual(analytics.longest_streak, 8)
+        self.assertEqual(analytics.completion_rate, 73.33)
+    
+    def test_points_ledger(self):
+        """Test that each imported completion earns what the live path would have awarded"""
+        result = import_completions(self._rows(*range(7, -1, -1)), today=self.today)
+        
+        # Six completions at 10 points, then two with a week's streak bonus
+        self.assertEqual(result.points, 6 * 10 + 2 * 15)
+        self.assertEqual(UserPoints.objects.get(user=self.user).total_points, 90)
+        self.assertEqual(PointTransaction.objects.filter(user=self.user).count(), 8)
+        self.assertEqual(
+            set(PointTransaction.objects.values_list('reference_id', flat=True)),
+            set(HabitCompletion.objects.values_list('id', flat=True))
+        )
+    
+    def test_duplicates_and_invalid_rows(self):
+        """Test that existing and repeated rows are skipped and bad rows reported"""
+        HabitCompletion.objects.create(user_habit=self.user_habit, completion_date=self.today)
+        rows = self._rows(0, 1, 1) + [
+            {'username': 'importer', 'habit': 'Read', 'completion_date': (self.today - timedelta(days=2)).isoformat()},
+            {'username': 'importer', 'habit': 'Write', 'completion_date': self.today.isoformat()},
+            {'user_habit_id': self.user_habit.id, 'completion_date': 'yesterday'},
+            {'user_habit_id': self.user_habit.id, 'completion_date': (self.today + timedelta(days=1)).isoformat()},
+        ]
+        
+        result = import_completions(rows, batch_size=2, today=self.today)
+        
+        self.assertEqual((result.created, result.skipped, result.invalid), (2, 2, 3))
+        self.assertEqual([row for row, _ in result.errors], [5, 6, 7])
+        self.assertEqual(HabitCompletion.objects.filter(user_habit=self.user_habit).count(), 3)
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 3)
+    
+    def test_no_per_row_side_effects(self):
+        """Test that imports bypass the completion signal and its queued work"""
+        import_completions(self._rows(*range(30)), today=self.today)
+        
+        self.assertFalse(BackgroundTask.objects.exists())
+    
+    def test_analytics_recalculated_in_bulk(self):
+        """Test that the analytics of every imported habit take a fixed number of queries"""
+        def import_for(count):
+            user_habits = [
+                UserHabit.objects.create(
+                    user=self.user,
+                    habit=Habit.objects.create(name=f'Habit {count}-{i}', periodicity='DAILY'),
+                    start_date=self.today
+                )
+                for i in range(count)
+            ]
+            rows = [
+                {'user_habit_id': user_habit.id, 'completion_date': (self.today - timedelta(days=n)).isoformat()}
+                for user_habit in user_habits for n in range(3)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                import_completions(rows, today=self.today)
+            return len(queries)
+        
+        # The first import also creates the user's points row
+        import_for(1)
+        self.assertEqual(import_for(1), import_for(5))
+        self.assertEqual(HabitAnalytics.objects.filter(user=self.user, completions_count=3).count(), 7)
+    
+    def test_command_reads_ndjson_and_csv(self):
+        """Test the management command with both input formats"""
+        with tempfile.TemporaryDirectory() as directory:
+            ndjson_path = os.path.join(directory, 'completions.ndjson')
+            with open(ndjson_path, 'w') as f:
+                f.writelines(json.dumps(row) + '\n' for row in self._rows(0, 1))
+            csv_path = os.path.join(directory, 'completions.csv')
+            with open(csv_path, 'w') as f:
+                f.write('username,habit,completion_date\n')
+                f.write(f'importer,Read,{(self.today - timedelta(days=2)).isoformat()}\n')
+            
+            out = StringIO()
+            call_command('import_completions', ndjson_path, stdout=out)
+            call_command('import_completions', csv_path, stdout=out)
+        
+        self.assertIn('rows/s', out.getvalue())
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 3)
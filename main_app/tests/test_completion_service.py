@@ -0,0 +1,137 @@
+from datetime import date, timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.db.models import QuerySet
+from django.test import TestCase
+from main_app.models import (
+    Habit, UserHabit, HabitCompletion, HabitStreak, HabitAnalytics, UserPoints,
+    PointTransaction, BackgroundTask
+)
+from main_app.services.analytics_service import AnalyticsService
+from main_app.services.completion_service import CompletionService
+
+# Statements allowed for completing a habit that continues a streak on a day
+# the user already completed something and someone else completed the habit,
+# including the SAVEPOINT/RELEASE pair that stands in for BEGIN/COMMIT inside
+# TestCase and the pair around the insert alone
+COMPLETION_QUERY_BUDGET = 15
+
+
+class TestCompletionService(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='completer', password='testpass123')
+        habit = Habit.objects.create(name='Stretch', description='Stretch daily', periodicity='DAILY')
+        UserHabit.objects.create(user=self.user, habit=habit)
+        self.user_habit = UserHabit.objects.select_related('habit').get(user=self.user)
+        self.today = date.today()
+    
+    def test_query_budget(self):
+        """Test that a completion with all its side effects stays within the query budget"""
+        CompletionService.complete(self.user_habit, self.today - timedelta(days=1))
+        other_habit = Habit.objects.create(name='Floss', description='Floss daily', periodicity='DAILY')
+        CompletionService.complete(UserHabit.objects.create(user=self.user, habit=other_habit), self.today)
+        other_user = User.objects.create_user(username='other', password='testpass123')
+        CompletionService.complete(
+            UserHabit.objects.create(user=other_user, habit=self.user_habit.habit), self.today
+        )
+        
+        with self.assertNumQueries(COMPLETION_QUERY_BUDGET):
+            result = CompletionService.complete(self.user_habit, self.today)
+        
+        self.assertTrue(result.created)
+        self.assertEqual(result.streak, 2)
+    
+    def test_side_effects(self):
+        """Test that the completion updates streak, analytics, points and queues work"""
+        result = CompletionService.complete(self.user_habit, self.today)
+        
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 1)
+        self.assertEqual(self.user_habit.last_completed, self.today)
+        self.assertTrue(HabitStreak.objects.filter(user_habit=self.user_habit, end_date=None).exists())
+        analytics = HabitAnalytics.objects.get(user=self.user, habit=self.user_habit.habit)
+        self.assertEqual((analytics.completions_count, analytics.longest_streak), (1, 1))
+        self.assertEqual(UserPoints.objects.get(user=self.user).total_points, result.points)
+        self.assertEqual(PointTransaction.objects.get(user=self.user).reference_id, str(result.completion.id))
+        # The analytics are up to date, so no recalculation is queued
+        self.assertFalse(BackgroundTask.objects.exists())
+    
+    def test_weekly_rate_matches_recalculation(self):
+        """Test that the fast path and a recalculation agree on a weekly habit's rate"""
+        habit = Habit.objects.create(name='Review', description='Review weekly', periodicity='WEEKLY')
+        user_habit = UserHabit.objects.create(
+            user=self.user, habit=habit, start_date=self.today - timedelta(weeks=4)
+        )
+        # Two completions in one week, then one in the current week
+        for days_ago in (15, 14, 0):
+            CompletionService.complete(user_habit, self.today - timedelta(days=days_ago))
+        analytics = HabitAnalytics.objects.get(user=self.user, habit=habit)
+        
+        recalculated = AnalyticsService.recalculate_analytics(user_habit, rebuild_streaks=False)
+        self.assertEqual(analytics.completion_rate, recalculated.completion_rate)
+        self.assertLessEqual(analytics.completion_rate, 100)
+        analytics.calculate_analytics()
+        self.assertEqual(analytics.completion_rate, recalculated.completion_rate)
+    
+    def test_duplicate_completion(self):
+        """Test that completing twice on a day is caught by the unique constraint"""
+        CompletionService.complete(self.user_habit, self.today)
+        
+        result = CompletionService.complete(self.user_habit, self.today)
+        
+        self.assertFalse(result.created)
+        self.assertEqual(HabitCompletion.objects.filter(user_habit=self.user_habit).count(), 1)
+        self.assertEqual(PointTransaction.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(UserPoints.objects.get(user=self.user).total_points, 10)
+    
+    def test_side_effect_failure_not_taken_for_duplicate(self):
+        """Test that an IntegrityError from a side effect is raised, not reported as a duplicate"""
+        with mock.patch.object(UserPoints, 'credit', side_effect=IntegrityError('points')):
+            with self.assertRaises(IntegrityError):
+                CompletionService.complete(self.user_habit, self.today)
+        
+        self.assertFalse(HabitCompletion.objects.filter(user_habit=self.user_habit).exists())
+    
+    def test_points_row_created_concurrently(self):
+        """Test that crediting a user whose points row appears after the UPDATE still counts"""
+        update = QuerySet.update
+        calls = []
+        
+        def racing_update(queryset, **kwargs):
+            calls.append(queryset.model)
+            if queryset.model is UserPoints and calls.count(UserPoints) == 1:
+                # Another credit creates the row between this UPDATE and the INSERT
+                update(queryset, **kwargs)
+                UserPoints.objects.create(user=self.user, total_points=5)
+                return 0
+            return update(queryset, **kwargs)
+        
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            UserPoints.add_to_total(self.user.id, 10)
+        
+        self.assertEqual(UserPoints.objects.get(user=self.user).total_points, 15)
+    
+    def test_milestone_queued(self):
+        """Test that reaching a milestone queues the email and earns the streak bonus"""
+        UserHabit.objects.filter(pk=self.user_habit.pk).update(
+            streak=6, last_completed=self.today - timedelta(days=1)
+        )
+        
+        result = CompletionService.complete(self.user_habit, self.today)
+        
+        self.assertEqual(result.streak, 7)
+        self.assertEqual(result.points, 15)
+        self.assertEqual(
+            BackgroundTask.objects.get(name='send_streak_milestone_email').payload,
+            {'user_habit_id': self.user_habit.id, 'streak_length': 7}
+        )
+    
+    def test_level_recomputed_in_update(self):
+        """Test that crediting points recomputes the level in the same statement"""
+        UserPoints.objects.create(user=self.user, total_points=995)
+        
+        CompletionService.complete(self.user_habit, self.today)
+        
+        points = UserPoints.objects.get(user=self.user)
+        self.assertEqual((points.total_points, points.level), (1005, 2))
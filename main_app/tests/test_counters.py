@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from main_app.models import Habit, UserHabit, HabitCompletion, MissedHabit, HabitAnalytics
+from main_app.services.achievements.achievement_service import AchievementService
+from main_app.services.completion_service import CompletionService
+from main_app.services.counters import reconcile_counters
+from main_app.updater.scheduler import check_missed_habits
+
+
+class TestHabitCounters(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.user = User.objects.create_user(username='counter', password='testpass123')
+        habit = Habit.objects.create(name='Practice', description='Practice daily', periodicity='DAILY')
+        UserHabit.objects.create(user=self.user, habit=habit, start_date=self.today - timedelta(days=10))
+        self.user_habit = UserHabit.objects.select_related('habit').get(user=self.user)
+
+    def _counters(self):
+        user_habit = UserHabit.objects.get(pk=self.user_habit.pk)
+        analytics = HabitAnalytics.objects.get(user=self.user, habit=self.user_habit.habit)
+        return (
+            (user_habit.completions_count, user_habit.missed_count, user_habit.longest_streak),
+            (analytics.completions_count, analytics.missed_count, analytics.longest_streak),
+        )
+
+    def test_completions_update_counters(self):
+        """Test that completions, including back-dated ones, keep the counters exact"""
+        for days_ago in (4, 3, 2, 0):
+            CompletionService.complete(self.user_habit, self.today - timedelta(days=days_ago))
+        self.assertEqual(self._counters(), ((4, 0, 3), (4, 0, 3)))
+
+        # Back-dated into the gap: the streak is rebuilt and joins up to five
+        CompletionService.complete(self.user_habit, self.today - timedelta(days=1))
+        self.assertEqual(self._counters()[0], (5, 0, 5))
+
+    def test_misses_update_counters(self):
+        """Test that misses recorded by the sweep and one at a time are counted"""
+        CompletionService.complete(self.user_habit, self.today - timedelta(days=3))
+
+        check_missed_habits(start_date=self.today - timedelta(days=1))
+        MissedHabit.objects.create(user_habit=self.user_habit, missed_date=self.today - timedelta(days=2))
+
+        self.assertEqual(self._counters(), ((1, 2, 1), (1, 2, 1)))
+
+    def test_reconcile_repairs_drift(self):
+        """Test that the reconciliation recounts rows written around the counters"""
+        CompletionService.complete(self.user_habit, self.today - timedelta(days=5))
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=self.user_habit, completion_date=self.today - timedelta(days=n))
+            for n in (4, 3)
+        ])
+        MissedHabit.objects.bulk_create([
+            MissedHabit(user_habit=self.user_habit, missed_date=self.today - timedelta(days=2))
+        ])
+
+        totals = reconcile_counters()
+
+        self.assertEqual(totals, {'habits': 1, 'repaired': 1, 'missed_repaired': 1})
+        self.assertEqual(self._counters(), ((3, 1, 3), (3, 1, 3)))
+        self.assertEqual(reconcile_counters(), {'habits': 1, 'repaired': 0, 'missed_repaired': 0})
+
+    def test_achievements_read_counters(self):
+        """Test that achievement progress comes from the counters"""
+        for days_ago in (2, 1, 0):
+            CompletionService.complete(self.user_habit, self.today - timedelta(days=days_ago))
+        UserHabit.objects.filter(pk=self.user_habit.pk).update(streak=0)
+
+        service = AchievementService()
+        self.assertEqual(service._get_habit_completion_count(self.user), 3)
+        self.assertEqual(service._get_max_streak(self.user), 3)
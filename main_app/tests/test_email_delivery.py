@@ -0,0 +1,88 @@
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase
+from main_app.services.email_delivery import deliver_messages
+
+
+class CountingBackend(BaseEmailBackend):
+    """Backend that records how often it connects and rejects one address"""
+    opened = 0
+    delivered = []
+    
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+    
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if 'reject@example.com' in message.to:
+                raise ConnectionError('550 mailbox unavailable')
+            CountingBackend.delivered.append(message)
+        return len(email_messages)
+
+
+class RefusingBackend(BaseEmailBackend):
+    """Backend whose server refuses every connection"""
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+    
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class TestEmailDelivery(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.delivered = []
+    
+    def _messages(self, count):
+        return [
+            EmailMessage(f'Reminder {i}', 'body', 'habits@example.com', [f'user{i}@example.com'])
+            for i in range(count)
+        ]
+    
+    def test_connections_reused_across_messages(self):
+        """Test that a batch is sent over at most one connection per worker"""
+        results = deliver_messages(
+            self._messages(50), workers=2, batch_size=10,
+            backend='main_app.tests.test_email_delivery.CountingBackend'
+        )
+        
+        self.assertEqual(len(results), 50)
+        self.assertTrue(all(result.sent for result in results))
+        self.assertEqual(len(CountingBackend.delivered), 50)
+        self.assertEqual(CountingBackend.opened, 2)
+    
+    def test_per_message_results(self):
+        """Test that one failing message does not fail the rest of its batch"""
+        messages = self._messages(3)
+        messages[1].to = ['reject@example.com']
+        
+        results = deliver_messages(
+            messages, backend='main_app.tests.test_email_delivery.CountingBackend'
+        )
+        
+        self.assertEqual([result.sent for result in results], [True, False, True])
+        self.assertIn('550', results[1].error)
+        self.assertEqual([result.message for result in results], messages)
+    
+    def test_default_backend(self):
+        """Test delivery through the configured backend"""
+        results = deliver_messages(self._messages(5))
+        
+        self.assertEqual(sum(result.sent for result in results), 5)
+        self.assertEqual(len(mail.outbox), 5)
+    
+    def test_outage_reported_as_failures(self):
+        """Test that a server refusing connections fails the messages instead of raising"""
+        messages = self._messages(5)
+        
+        results = deliver_messages(
+            messages, workers=2, batch_size=2,
+            backend='main_app.tests.test_email_delivery.RefusingBackend'
+        )
+        
+        self.assertEqual([result.message for result in results], messages)
+        self.assertFalse(any(result.sent for result in results))
+        self.assertIn('refused', results[0].error)
@@ -0,0 +1,120 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import TestCase
+from django.urls import reverse
+from main_app.models import Habit, UserHabit, DailyUserStats
+from main_app.services.completion_import import import_completions
+from main_app.services.completion_service import CompletionService
+from main_app.services.heatmap import _version_key, heatmap_version
+
+
+class TestHeatmap(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='heatmapper', password='testpass123')
+        self.today = date.today()
+        self.daily = self._user_habit('Meditate', 'DAILY')
+        self.weekly = self._user_habit('Review', 'WEEKLY')
+        self.client.force_login(self.user)
+    
+    def _user_habit(self, name, periodicity):
+        habit = Habit.objects.create(name=name, description=name, periodicity=periodicity)
+        UserHabit.objects.create(user=self.user, habit=habit)
+        return UserHabit.objects.select_related('habit').get(user=self.user, habit=habit)
+    
+    def _complete(self, user_habit, days_ago):
+        with self.captureOnCommitCallbacks(execute=True):
+            CompletionService.complete(user_habit, self.today - timedelta(days=days_ago))
+    
+    def _get(self, **params):
+        return self.client.get(reverse('heatmap'), params)
+    
+    def test_daily_totals_follow_completions(self):
+        """Test that each completion is counted in the user's daily totals"""
+        self._complete(self.daily, 0)
+        self._complete(self.weekly, 0)
+        self._complete(self.daily, 1)
+        
+        self.assertEqual(
+            dict(DailyUserStats.objects.filter(user=self.user).values_list('date', 'completions')),
+            {self.today: 2, self.today - timedelta(days=1): 1}
+        )
+    
+    def test_user_heatmap(self):
+        """Test the per-user heatmap over the default range"""
+        self._complete(self.daily, 0)
+        self._complete(self.weekly, 0)
+        self._complete(self.daily, 400)
+        
+        data = self._get().json()
+        
+        self.assertEqual(data['days'], {self.today.isoformat(): 2})
+        self.assertEqual((data['total'], data['max']), (2, 2))
+        self.assertEqual(data['start'], (self.today - timedelta(days=364)).isoformat())
+    
+    def test_habit_heatmap(self):
+        """Test per-habit heatmaps from the bitmap and, for weekly habits, the completion days"""
+        for days_ago in (0, 2, 3):
+            self._complete(self.daily, days_ago)
+        self._complete(self.weekly, 9)
+        start = (self.today - timedelta(days=10)).isoformat()
+        
+        daily = self._get(habit=self.daily.id, start=start).json()
+        weekly = self._get(habit=self.weekly.id, start=start).json()
+        
+        self.assertEqual(
+            list(daily['days']),
+            [(self.today - timedelta(days=n)).isoformat() for n in (3, 2, 0)]
+        )
+        self.assertEqual(weekly['days'], {(self.today - timedelta(days=9)).isoformat(): 1})
+    
+    def test_etag_changes_only_on_completion(self):
+        """Test that repeat loads are not modified until a completion lands"""
+        self._complete(self.daily, 1)
+        etag = self._get()['ETag']
+        
+        self.assertEqual(self.client.get(reverse('heatmap'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self._get()['ETag'], etag)
+        
+        self._complete(self.daily, 0)
+        response = self.client.get(reverse('heatmap'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total'], 2)
+    
+    def test_version_shared_between_processes(self):
+        """Test that a completion's version bump reaches the caches of other processes"""
+        other_process = caches.create_connection('default')
+        version = heatmap_version(self.user.pk)
+        
+        self._complete(self.daily, 0)
+        
+        self.assertEqual(other_process.get(_version_key(self.user.pk)), version + 1)
+    
+    def test_other_users_habit_not_found(self):
+        """Test that a habit of another user cannot be read"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        habit = Habit.objects.create(name='Secret', description='Secret', periodicity='DAILY')
+        other_habit = UserHabit.objects.create(user=other, habit=habit)
+        
+        self.assertEqual(self._get(habit=other_habit.id).status_code, 404)
+    
+    def test_invalid_range(self):
+        """Test that malformed, reversed and oversized ranges are rejected"""
+        self.assertEqual(self._get(start='yesterday').status_code, 400)
+        self.assertEqual(self._get(start='2025-02-01', end='2025-01-01').status_code, 400)
+        self.assertEqual(self._get(start='2020-01-01', end='2025-01-01').status_code, 400)
+    
+    def test_import_rebuilds_daily_totals(self):
+        """Test that bulk imports, which bypass the completion path, update the totals"""
+        with self.captureOnCommitCallbacks(execute=True):
+            import_completions([
+                {'user_habit_id': habit.id, 'completion_date': (self.today - timedelta(days=n)).isoformat()}
+                for habit in (self.daily, self.weekly) for n in (1, 2)
+            ], today=self.today)
+        
+        self.assertEqual(self._get().json()['total'], 4)
+        self.assertEqual(
+            DailyUserStats.objects.get(user=self.user, date=self.today - timedelta(days=1)).completions, 2
+        )
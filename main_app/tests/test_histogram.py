@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from main_app.analytics.histogram import histogram
+from main_app.analytics.metrics import HabitMetrics
+from main_app.models import Habit, UserHabit
+
+
+class TestHistogram(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        daily = Habit.objects.create(name='Read', description='Read daily', periodicity='DAILY')
+        weekly = Habit.objects.create(name='Hike', description='Hike weekly', periodicity='WEEKLY')
+        for i, (habit, streak) in enumerate([
+            (daily, 0), (daily, 1), (daily, 3), (weekly, 8), (weekly, 400)
+        ]):
+            other = User.objects.create_user(username=f'bucket{i}', password='testpass123')
+            UserHabit.objects.create(
+                user=other, habit=habit, streak=streak,
+                completions_count=streak, missed_count=1 if streak else 0,
+                start_date=self.today - timedelta(days=10)
+            )
+
+    def test_single_query(self):
+        """Test that every bucket is counted in one query"""
+        with self.assertNumQueries(1):
+            result = histogram(UserHabit.objects.all(), 'streak', [0, 1, 2, 7])
+
+        self.assertEqual(result['total'], 5)
+        self.assertEqual(
+            [(bucket['label'], bucket['count']) for bucket in result['buckets']],
+            [('0-1', 1), ('1-2', 1), ('2-7', 1), ('7+', 2)]
+        )
+        self.assertEqual(result['buckets'][-1]['percentage'], 40.0)
+        self.assertIsNone(result['buckets'][-1]['max'])
+
+    def test_grouped(self):
+        """Test that grouping yields one histogram per value, still in one query"""
+        with self.assertNumQueries(1):
+            result = histogram(
+                UserHabit.objects.all(), 'streak', [(0, 'short'), (7, 'long')],
+                group_by='habit__periodicity'
+            )
+
+        self.assertEqual(set(result), {'DAILY', 'WEEKLY'})
+        self.assertEqual([bucket['count'] for bucket in result['DAILY']['buckets']], [3, 0])
+        self.assertEqual([bucket['count'] for bucket in result['WEEKLY']['buckets']], [0, 2])
+
+    def test_edges_must_ascend(self):
+        """Test that unordered or repeated edges are rejected"""
+        with self.assertRaises(ValueError):
+            histogram(UserHabit.objects.all(), 'streak', [0, 7, 7])
+
+    def test_streak_distribution(self):
+        """Test that the streak distribution places each habit in exactly one bucket"""
+        with self.assertNumQueries(1):
+            distribution = HabitMetrics.streak_distribution()
+
+        counts = {row['label']: row['count'] for row in distribution}
+        self.assertEqual(sum(counts.values()), 5)
+        self.assertEqual(counts['No streak'], 1)
+        self.assertEqual(counts['2-3 days'], 1)
+        self.assertEqual(counts['1 year+'], 1)
+        self.assertEqual((distribution[2]['min_days'], distribution[2]['max_days']), (2, 3))
+        self.assertIsNone(distribution[-1]['max_days'])
+
+    def test_completion_rate_distribution(self):
+        """Test that completion rates by periodicity carry a per-habit rate histogram"""
+        with self.assertNumQueries(2):
+            rates = {row['periodicity']: row for row in HabitMetrics.completion_rates_by_periodicity()}
+
+        self.assertEqual(rates['DAILY']['total_habits'], 3)
+        # 1/2 and 3/4 completed; the habit without any history is not bucketed
+        self.assertEqual(
+            [bucket['count'] for bucket in rates['DAILY']['distribution']],
+            [0, 0, 1, 1, 0]
+        )
+        self.assertEqual(
+            [bucket['count'] for bucket in rates['WEEKLY']['distribution']],
+            [0, 0, 0, 2, 0]
+        )
@@ -0,0 +1,70 @@
+import tracemalloc
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from main_app.models import BackgroundTask, JobRun
+from main_app.updater.instrumentation import instrument_job, prune_job_history
+
+
+class TestJobInstrumentation(TestCase):
+    def test_run_recorded(self):
+        """Test that a job's queries, written rows and memory are recorded"""
+        with instrument_job('create_users'):
+            for i in range(3):
+                User.objects.create_user(username=f'user{i}', password='x')
+            User.objects.filter(username__startswith='user').update(first_name='Test')
+            buffer = [0] * 100_000
+        
+        run = JobRun.objects.get(job_name='create_users')
+        self.assertTrue(run.succeeded)
+        self.assertGreaterEqual(run.queries, 4)
+        # Three users and their profiles inserted, then three users updated
+        self.assertGreaterEqual(run.rows_written, 6)
+        self.assertGreater(run.peak_memory, len(buffer) * 8)
+        self.assertGreater(run.duration, 0)
+    
+    def test_overlapping_jobs_share_tracing(self):
+        """Test that a job finishing while another runs neither stops nor resets the other's trace"""
+        self.assertFalse(tracemalloc.is_tracing())
+        with instrument_job('long'):
+            with instrument_job('short'):
+                pass
+            self.assertTrue(tracemalloc.is_tracing())
+            buffer = [0] * 100_000
+        self.assertFalse(tracemalloc.is_tracing())
+        
+        self.assertGreater(JobRun.objects.get(job_name='long').peak_memory, len(buffer) * 8)
+    
+    def test_failure_recorded(self):
+        """Test that a failing job is recorded and the error re-raised"""
+        with self.assertRaises(ValueError):
+            with instrument_job('broken'):
+                raise ValueError('bad input')
+        
+        run = JobRun.objects.get(job_name='broken')
+        self.assertFalse(run.succeeded)
+        self.assertIn('bad input', run.error)
+
+
+class TestJobHistoryRetention(TestCase):
+    def test_old_records_pruned_in_chunks(self):
+        """Test that only records older than the retention period are deleted"""
+        now = timezone.now()
+        JobRun.objects.bulk_create([
+            JobRun(job_name=f'run_{age}', started_at=now - timedelta(days=age))
+            for age in [1, 2, 20, 21, 22, 30, 40]
+        ])
+        BackgroundTask.objects.bulk_create([
+            BackgroundTask(name='done_old', status='DONE', finished_at=now - timedelta(days=30)),
+            BackgroundTask(name='done_recent', status='DONE', finished_at=now - timedelta(days=1)),
+            BackgroundTask(name='failed_old', status='FAILED', finished_at=now - timedelta(days=30)),
+        ])
+        
+        summary = prune_job_history(max_age_days=14, chunk_size=2)
+        
+        self.assertEqual(summary, {'job_runs': 5, 'background_tasks': 1})
+        self.assertEqual(set(JobRun.objects.values_list('job_name', flat=True)), {'run_1', 'run_2'})
+        self.assertEqual(
+            set(BackgroundTask.objects.values_list('name', flat=True)), {'done_recent', 'failed_old'}
+        )
@@ -0,0 +1,127 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from main_app.models import SchedulerLease
+from main_app.updater import updater
+from main_app.updater.leader import LeaderElector, LEASE_TTL
+
+
+class TestLeaderElection(TestCase):
+    def setUp(self):
+        self.processes = [LeaderElector(holder=f'node-{i}') for i in range(4)]
+        self.now = timezone.now()
+    
+    def _at(self, seconds):
+        """Patch the clock to ``seconds`` after the start of the test"""
+        return mock.patch('main_app.updater.leader.timezone.now', return_value=self.now + timedelta(seconds=seconds))
+    
+    def _heartbeat_all(self, processes=None):
+        for process in processes or self.processes:
+            process.heartbeat()
+        return [process for process in self.processes if process.is_leader()]
+    
+    def test_single_leader(self):
+        """Test that only one of several competing processes becomes leader"""
+        with self._at(0):
+            leaders = self._heartbeat_all()
+            # Repeated heartbeats keep the same leader
+            self.assertEqual(self._heartbeat_all(), leaders)
+        
+        self.assertEqual(len(leaders), 1)
+        self.assertEqual(SchedulerLease.objects.get().holder, leaders[0].holder)
+    
+    def test_takeover_after_leader_dies(self):
+        """Test that another process takes over once the leader stops heartbeating"""
+        with self._at(0):
+            leader = self._heartbeat_all()[0]
+        survivors = [process for process in self.processes if process is not leader]
+        
+        with self._at(LEASE_TTL - 1):
+            self.assertEqual(self._heartbeat_all(survivors), [])
+        with self._at(LEASE_TTL + 1):
+            new_leaders = self._heartbeat_all(survivors)
+            # The old leader's lease has run out, so it stands down too
+            self.assertFalse(leader.is_leader())
+        
+        self.assertEqual(len(new_leaders), 1)
+        self.assertIsNot(new_leaders[0], leader)
+    
+    def test_old_leader_cannot_renew_after_takeover(self):
+        """Test that a stalled leader does not get the lease back"""
+        with self._at(0):
+            leader = self._heartbeat_all()[0]
+        survivors = [process for process in self.processes if process is not leader]
+        with self._at(LEASE_TTL + 1):
+            new_leader = self._heartbeat_all(survivors)[0]
+            
+            self.assertFalse(leader.heartbeat())
+            self.assertTrue(new_leader.is_leader())
+    
+    def test_release_hands_over_immediately(self):
+        """Test that a released lease is taken without waiting for expiry"""
+        with self._at(0):
+            leader = self._heartbeat_all()[0]
+            leader.release()
+            others = [process for process in self.processes if process is not leader]
+            
+            self.assertEqual(len(self._heartbeat_all(others)), 1)
+    
+    def test_jobs_only_run_on_leader(self):
+        """Test that scheduled jobs are skipped by processes without the lease"""
+        job = mock.Mock(return_value='ran')
+        follower = LeaderElector(holder='follower')
+        
+        with mock.patch('main_app.updater.updater.ref_to_obj', return_value=job):
+            with self._at(0):
+                self.processes[0].heartbeat()
+                follower.heartbeat()
+            with mock.patch.object(updater, '_elector', follower):
+                self.assertIsNone(updater.run_as_leader('main_app.updater.scheduler:run_timezone_sweep'))
+            with mock.patch.object(updater, '_elector', self.processes[0]):
+                self.assertEqual(updater.run_as_leader('main_app.updater.scheduler:run_timezone_sweep'), 'ran')
+        
+        job.assert_called_once()
+    
+    def test_every_process_keeps_its_own_schedule(self):
+        """Test that jobs live in per-process memory, so a follower cannot consume the leader's firings"""
+        schedulers = [BackgroundScheduler(), BackgroundScheduler()]
+        for scheduler in schedulers:
+            updater.configure_jobs(scheduler)
+        
+        for scheduler in schedulers:
+            jobs = scheduler.get_jobs()
+            self.assertIn('reconcile_rollups', {job.id for job in jobs})
+            self.assertTrue(all(isinstance(store, MemoryJobStore) for store in scheduler._jobstores.values()))
+
+
+class TestConcurrentLeaderElection(TransactionTestCase):
+    def test_concurrent_processes_elect_one_leader(self):
+        """Test that processes heartbeating at the same moment elect exactly one leader"""
+        processes = [LeaderElector(holder=f'node-{i}') for i in range(6)]
+        start = threading.Barrier(len(processes))
+        results = {}
+        
+        def compete(process):
+            try:
+                start.wait()
+                for _ in range(5):
+                    results[process.holder] = process.heartbeat()
+            except Exception as e:
+                results[process.holder] = e
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=compete, args=(process,)) for process in processes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertTrue(all(isinstance(result, bool) for result in results.values()), results)
+        self.assertEqual(sum(1 for result in results.values() if result is True), 1, results)
+        self.assertEqual(SchedulerLease.objects.count(), 1)
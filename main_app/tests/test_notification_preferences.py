@@ -0,0 +1,78 @@
+from datetime import datetime, timezone as dt_timezone
+from django.contrib.auth.models import User
+from django.test import TestCase
+from main_app.models import UserProfile
+from main_app.services.notification_preferences import (
+    ALLOW_ALL, CompiledPreferences, resolve_preferences
+)
+from main_app.services.notification_service import NotificationService
+
+
+class TestCompiledPreferences(TestCase):
+    def test_quiet_hours_spanning_midnight(self):
+        """Test that quiet hours wrapping past midnight are evaluated in local time"""
+        preferences = CompiledPreferences.compile({
+            'quiet_hours_enabled': True,
+            'quiet_hours_start': '22:00',
+            'quiet_hours_end': '07:00',
+        }, 'Asia/Tokyo')
+        
+        # 14:00 UTC is 23:00 in Tokyo, 00:00 UTC is 09:00
+        self.assertTrue(preferences.in_quiet_hours(datetime(2025, 3, 10, 14, 0, tzinfo=dt_timezone.utc)))
+        self.assertFalse(preferences.in_quiet_hours(datetime(2025, 3, 10, 0, 0, tzinfo=dt_timezone.utc)))
+        self.assertEqual((preferences.quiet_start, preferences.quiet_end), (22 * 60, 7 * 60))
+    
+    def test_disabled_channels(self):
+        """Test that switched off notification types are refused"""
+        preferences = CompiledPreferences.compile({'email_reminders': False}, 'UTC')
+        
+        self.assertFalse(preferences.allows('email_reminder'))
+        self.assertTrue(preferences.allows('email_streak'))
+        self.assertTrue(preferences.allows('some_new_type'))
+    
+    def test_invalid_settings_fall_back(self):
+        """Test that unparseable quiet hours and unknown zones do not block notifications"""
+        preferences = CompiledPreferences.compile({
+            'quiet_hours_enabled': True,
+            'quiet_hours_start': 'late',
+        }, 'Not/AZone')
+        
+        self.assertEqual(preferences.tz.key, 'UTC')
+        self.assertFalse(preferences.in_quiet_hours())
+
+
+class TestResolvePreferences(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='testpass123')
+            for i in range(5)
+        ]
+        profile = self.users[0].profile
+        profile.notification_preferences = {'email_streak_updates': False}
+        profile.save()
+    
+    def test_one_query_for_many_users(self):
+        """Test that preferences for a batch of users are loaded in a single query"""
+        with self.assertNumQueries(1):
+            resolved = resolve_preferences(self.users)
+        
+        self.assertEqual(set(resolved), {user.pk for user in self.users})
+        self.assertFalse(resolved[self.users[0].pk].allows('email_streak'))
+        self.assertTrue(resolved[self.users[1].pk].allows('email_streak'))
+    
+    def test_user_without_profile_gets_everything(self):
+        """Test that users without a profile are not filtered"""
+        UserProfile.objects.filter(user=self.users[1]).delete()
+        
+        self.assertIs(resolve_preferences([self.users[1].pk])[self.users[1].pk], ALLOW_ALL)
+    
+    def test_should_send_uses_resolved_preferences(self):
+        """Test that already resolved preferences skip the profile query"""
+        preferences = resolve_preferences(self.users)
+        
+        with self.assertNumQueries(0):
+            allowed = NotificationService.should_send_notification(
+                self.users[0], 'email_streak', preferences[self.users[0].pk]
+            )
+        
+        self.assertFalse(allowed)
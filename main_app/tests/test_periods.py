@@ -0,0 +1,106 @@
+import pytest
+from django.test import TestCase
+from django.utils import timezone
+from datetime import date, timedelta
+from main_app.models import User, Habit, UserHabit, HabitCompletion
+from main_app.services.analytics_service import AnalyticsService
+from main_app.services.periods import (
+    period_index, period_start, period_end, period_bounds,
+    periods_between, complete_periods, count_periods
+)
+
+
+class TestPeriodEngine(TestCase):
+    def test_round_trip(self):
+        """Test that every date maps back to the start of its own period"""
+        day = date(2024, 2, 29)
+        for periodicity in ('DAILY', 'WEEKLY', 'MONTHLY'):
+            start, end = period_bounds(periodicity, day)
+            self.assertLessEqual(start, day)
+            self.assertGreaterEqual(end, day)
+            self.assertEqual(period_index(periodicity, start), period_index(periodicity, end))
+            self.assertEqual(period_start(periodicity, period_index(periodicity, day)), start)
+    
+    def test_weeks_run_monday_to_sunday(self):
+        """Test that weekly periods are calendar weeks"""
+        start, end = period_bounds('WEEKLY', date(2025, 1, 1))
+        self.assertEqual(start, date(2024, 12, 30))
+        self.assertEqual(end, date(2025, 1, 5))
+        self.assertEqual(start.weekday(), 0)
+    
+    def test_months_are_calendar_months(self):
+        """Test month boundaries, including leap years and year ends"""
+        self.assertEqual(period_end('MONTHLY', period_index('MONTHLY', date(2024, 2, 10))), date(2024, 2, 29))
+        self.assertEqual(period_end('MONTHLY', period_index('MONTHLY', date(2023, 12, 5))), date(2023, 12, 31))
+        self.assertEqual(
+            period_index('MONTHLY', date(2024, 1, 1)) - period_index('MONTHLY', date(2023, 12, 31)),
+            1
+        )
+    
+    def test_periods_between(self):
+        """Test that a range produces contiguous period boundaries"""
+        periods = periods_between('MONTHLY', date(2024, 11, 15), date(2025, 2, 3))
+        self.assertEqual(
+            [(start, end) for _, start, end in periods],
+            [
+                (date(2024, 11, 1), date(2024, 11, 30)),
+                (date(2024, 12, 1), date(2024, 12, 31)),
+                (date(2025, 1, 1), date(2025, 1, 31)),
+                (date(2025, 2, 1), date(2025, 2, 28)),
+            ]
+        )
+    
+    def test_complete_periods_exclude_current(self):
+        """Test that only periods that ended before today are complete"""
+        today = date(2025, 3, 12)
+        weeks = complete_periods('WEEKLY', date(2025, 2, 26), today)
+        self.assertEqual([end for _, _, end in weeks], [date(2025, 3, 2), date(2025, 3, 9)])
+        self.assertEqual(complete_periods('DAILY', today, today), [])
+    
+    def test_count_periods(self):
+        """Test that period counts include the first and current period"""
+        self.assertEqual(count_periods('DAILY', date(2025, 1, 1), date(2025, 1, 31)), 31)
+        self.assertEqual(count_periods('MONTHLY', date(2024, 1, 31), date(2024, 3, 1)), 3)
+
+
+@pytest.mark.django_db
+class TestPeriodBasedStreaks(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='periods', password='testpass123')
+    
+    def _user_habit(self, periodicity, start_date=None):
+        habit = Habit.objects.create(
+            name=f'{periodicity} habit',
+            description='Test',
+            periodicity=periodicity
+        )
+        return UserHabit.objects.create(
+            user=self.user,
+            habit=habit,
+            start_date=start_date or timezone.now().date()
+        )
+    
+    def test_monthly_streak_uses_calendar_months(self):
+        """Test that completions in consecutive months form a streak whatever the gap in days"""
+        user_habit = self._user_habit('MONTHLY')
+        for completion_date in (date(2024, 1, 2), date(2024, 2, 28), date(2024, 3, 1)):
+            HabitCompletion.objects.create(user_habit=user_habit, completion_date=completion_date)
+        
+        self.assertEqual(user_habit.calculate_streak(), 3)
+    
+    def test_weekly_streak_counts_each_week_once(self):
+        """Test that several completions in one week count as one period"""
+        user_habit = self._user_habit('WEEKLY')
+        for completion_date in (date(2025, 3, 3), date(2025, 3, 5), date(2025, 3, 12), date(2025, 3, 26)):
+            HabitCompletion.objects.create(user_habit=user_habit, completion_date=completion_date)
+        
+        self.assertEqual(user_habit.calculate_streak(), 1)
+        HabitCompletion.objects.create(user_habit=user_habit, completion_date=date(2025, 3, 20))
+        self.assertEqual(user_habit.calculate_streak(), 4)
+    
+    def test_total_tracking_periods(self):
+        """Test that tracking periods are counted with the period engine"""
+        today = timezone.now().date()
+        user_habit = self._user_habit('DAILY', start_date=today - timedelta(days=9))
+        
+        self.assertEqual(AnalyticsService._calculate_total_tracking_days(user_habit), 10)
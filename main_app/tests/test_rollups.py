@@ -0,0 +1,124 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from main_app.analytics.metrics import EngagementMetrics, HabitMetrics
+from main_app.models import (
+    Habit, UserHabit, HabitCompletion, MissedHabit, DailyUserStats, DailyHabitStats
+)
+from main_app.services.analytics_service import AnalyticsService
+from main_app.services.completion_service import CompletionService
+from main_app.services.rollups import reconcile_rollups, refresh_rollups
+from main_app.updater.scheduler import check_missed_habits
+
+
+class TestDailyRollups(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = date.today()
+        self.habit = Habit.objects.create(name='Journal', description='Write daily', periodicity='DAILY')
+        self.alice = User.objects.create_user(username='alice', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+        self.alice_habit = UserHabit.objects.create(
+            user=self.alice, habit=self.habit, start_date=self.today - timedelta(days=5)
+        )
+        self.bob_habit = UserHabit.objects.create(
+            user=self.bob, habit=self.habit, start_date=self.today - timedelta(days=5)
+        )
+
+    def _user_row(self, user, day):
+        return DailyUserStats.objects.filter(user=user, date=day).values(
+            'completions', 'misses', 'points'
+        ).first()
+
+    def _habit_row(self, day):
+        return DailyHabitStats.objects.filter(habit=self.habit, date=day).values(
+            'completions', 'misses', 'distinct_users'
+        ).first()
+
+    def test_completions_update_rollups(self):
+        """Test that each completion is counted in the user's and the habit's rollups"""
+        first = CompletionService.complete(self.alice_habit, self.today)
+        second = CompletionService.complete(self.bob_habit, self.today)
+
+        self.assertEqual(
+            self._user_row(self.alice, self.today),
+            {'completions': 1, 'misses': 0, 'points': first.points}
+        )
+        self.assertEqual(self._user_row(self.bob, self.today)['points'], second.points)
+        self.assertEqual(
+            self._habit_row(self.today),
+            {'completions': 2, 'misses': 0, 'distinct_users': 2}
+        )
+
+    def test_user_tracking_habit_twice_counted_once(self):
+        """Test that a user completing two copies of a habit is one distinct user for the day"""
+        second_habit = UserHabit.objects.create(
+            user=self.alice, habit=self.habit, start_date=self.today - timedelta(days=5)
+        )
+        CompletionService.complete(self.alice_habit, self.today)
+        CompletionService.complete(second_habit, self.today)
+
+        self.assertEqual(
+            self._habit_row(self.today),
+            {'completions': 2, 'misses': 0, 'distinct_users': 1}
+        )
+        # The reconciliation agrees
+        self.assertEqual(refresh_rollups(self.today, self.today, habit_ids={self.habit.id}), 0)
+
+    def test_sweep_counts_misses(self):
+        """Test that the missed-habit sweep brings the day's rollups up to date"""
+        yesterday = self.today - timedelta(days=1)
+        CompletionService.complete(self.alice_habit, yesterday)
+
+        check_missed_habits(start_date=yesterday)
+
+        self.assertEqual(self._user_row(self.bob, yesterday)['misses'], 1)
+        self.assertEqual(self._user_row(self.alice, yesterday)['misses'], 0)
+        self.assertEqual(
+            self._habit_row(yesterday),
+            {'completions': 1, 'misses': 1, 'distinct_users': 1}
+        )
+
+    def test_reconcile_corrects_drift(self):
+        """Test that the nightly reconciliation recomputes recent rollups from the events"""
+        yesterday = self.today - timedelta(days=1)
+        # Events written without going through the incremental paths
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=self.alice_habit, completion_date=yesterday),
+            HabitCompletion(user_habit=self.bob_habit, completion_date=yesterday),
+        ])
+        MissedHabit.objects.create(user_habit=self.bob_habit, missed_date=yesterday - timedelta(days=1))
+        # A row without any events behind it
+        DailyUserStats.objects.create(user=self.alice, date=yesterday - timedelta(days=1), completions=3)
+
+        self.assertEqual(reconcile_rollups(today=self.today), 6)
+
+        self.assertEqual(self._user_row(self.alice, yesterday)['completions'], 1)
+        self.assertIsNone(self._user_row(self.alice, yesterday - timedelta(days=1)))
+        self.assertEqual(self._user_row(self.bob, yesterday - timedelta(days=1))['misses'], 1)
+        self.assertEqual(self._habit_row(yesterday)['distinct_users'], 2)
+        # A second run finds nothing to correct
+        self.assertEqual(reconcile_rollups(today=self.today), 0)
+
+    def test_analytics_read_rollups(self):
+        """Test that the analytics surfaces report what the rollups hold"""
+        CompletionService.complete(self.alice_habit, self.today)
+        CompletionService.complete(self.bob_habit, self.today)
+        CompletionService.complete(self.alice_habit, self.today - timedelta(days=1))
+        MissedHabit.objects.create(user_habit=self.bob_habit, missed_date=self.today - timedelta(days=1))
+        refresh_rollups(self.today - timedelta(days=1), self.today - timedelta(days=1))
+
+        active = {row['date']: row['active_users'] for row in EngagementMetrics.daily_active_users(days_back=2)}
+        self.assertEqual(active[self.today.strftime('%Y-%m-%d')], 2)
+        self.assertEqual(active[(self.today - timedelta(days=1)).strftime('%Y-%m-%d')], 1)
+
+        daily = next(
+            row for row in HabitMetrics.completion_rates_by_periodicity() if row['periodicity'] == 'DAILY'
+        )
+        self.assertEqual((daily['completions'], daily['misses'], daily['total_habits']), (3, 1, 2))
+        self.assertEqual(daily['completion_rate'], 75.0)
+
+        stats = AnalyticsService.get_global_stats(visibility='all')
+        self.assertEqual(stats['habits_completed_today'], 2)
+        self.assertEqual(stats['total_completions'], 3)
@@ -1,9 +1,24 @@
 import pytest
-from django.test import TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.test import RequestFactory, TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from datetime import datetime, timedelta
-from main_app.models import UserHabit, HabitCompletion, MissedHabit, HabitStreak, Habit, User
-from main_app.updater.scheduler import check_missed_habits
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
+from main_app.models import (
+    UserHabit, HabitCompletion, MissedHabit, HabitStreak, Habit, User, SweepWatermark, Reminder, UserProfile
+)
+from main_app.updater import scheduler
+from main_app.updater.scheduler import (
+    check_missed_habits, run_sharded_sweep, run_timezone_sweep, check_and_send_notifications,
+    REMINDER_RETRY_DELAY
+)
+from main_app.updater.timezones import INDEX_CACHE_KEY, invalidate_timezone_index, zones_at_local_midnight
+from main_app.services.sharding import shard_filter
+from main_app.views.admin_settings_profile import handle_profile_form
 
 @pytest.mark.django_db
 class TestHabitScheduler(TestCase):
@@ -147,11 +162,12 @@ class TestHabitScheduler(TestCase):
         """Test that streak history is recorded when streak is reset"""
         yesterday = timezone.now().date() - timedelta(days=1)
     
-        # Set up a streak and last completed date
+        # Set up a streak that ended the day before the missed one
         streak_length = 5
         self.daily_user_habit.streak = streak_length
-        self.daily_user_habit.last_completed = yesterday
+        self.daily_user_habit.last_completed = yesterday - timedelta(days=1)
         self.daily_user_habit.save()
+        open_record = HabitStreak.objects.get(user_habit=self.daily_user_habit, end_date=None)
     
         # Run the check
         check_missed_habits(start_date=yesterday)
@@ -160,13 +176,17 @@ class TestHabitScheduler(TestCase):
         streak_history = HabitStreak.objects.filter(
             user_habit=self.daily_user_habit,
             streak_length=streak_length,
-            end_date=yesterday
+            end_date=yesterday - timedelta(days=1)
         ).first()
     
         self.assertIsNotNone(streak_history)
         self.assertEqual(streak_history.streak_length, streak_length)
-        self.assertEqual(streak_history.end_date, yesterday)
-        self.assertEqual(streak_history.start_date, yesterday - timedelta(days=streak_length))
+        # Closed on the last completed day, like a rebuild would
+        self.assertEqual(streak_history.end_date, yesterday - timedelta(days=1))
+        # The open record is closed, keeping its start
+        self.assertEqual(streak_history.pk, open_record.pk)
+        self.assertEqual(streak_history.start_date, open_record.start_date)
+        self.assertEqual(HabitStreak.objects.filter(user_habit=self.daily_user_habit).count(), 1)
     
         # Verify streak was reset
         self.daily_user_habit.refresh_from_db()
@@ -206,4 +226,409 @@ class TestHabitScheduler(TestCase):
             missed_date=yesterday
         ).exists()
         
-        self.assertFalse(missed)
\ No newline at end of file
+        self.assertFalse(missed)
+    
+    def test_no_misses_before_habit_started(self):
+        """Test that catching up over past days skips the days before a habit started"""
+        today = timezone.now().date()
+        self.daily_user_habit.start_date = today - timedelta(days=2)
+        self.daily_user_habit.save()
+        
+        check_missed_habits(start_date=today - timedelta(days=5))
+        
+        self.assertEqual(
+            sorted(MissedHabit.objects.filter(user_habit=self.daily_user_habit).values_list('missed_date', flat=True)),
+            [today - timedelta(days=2), today - timedelta(days=1)]
+        )
+    
+    def test_query_count_independent_of_habit_count(self):
+        """Test that the sweep issues the same number of queries for 1 or many habits"""
+        three_days_ago = timezone.now().date() - timedelta(days=3)
+        self.daily_user_habit.streak = 2
+        self.daily_user_habit.save()
+        # Streaks without an open record, as in the second run below
+        HabitStreak.objects.all().delete()
+        
+        with CaptureQueriesContext(connection) as few:
+            check_missed_habits(start_date=three_days_ago)
+        
+        MissedHabit.objects.all().delete()
+        SweepWatermark.objects.all().delete()
+        UserHabit.objects.filter(pk=self.daily_user_habit.pk).update(streak=2)
+        for i in range(25):
+            user = User.objects.create_user(username=f'bulkuser{i}', password='testpass123')
+            UserHabit.objects.create(
+                user=user, habit=self.daily_habit, streak=2,
+                start_date=timezone.now().date() - timedelta(days=30)
+            )
+        
+        with CaptureQueriesContext(connection) as many:
+            check_missed_habits(start_date=three_days_ago)
+        
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(
+            MissedHabit.objects.filter(user_habit__habit=self.daily_habit).count(),
+            26 * 3
+        )
+        self.assertEqual(
+            UserHabit.objects.filter(habit=self.daily_habit, streak__gt=0).count(),
+            0
+        )
+    
+    def test_open_streak_record_closed_on_miss(self):
+        """Test that the active streak record is closed when the sweep resets a streak"""
+        yesterday = timezone.now().date() - timedelta(days=1)
+        
+        self.daily_user_habit.streak = 3
+        self.daily_user_habit.last_completed = yesterday - timedelta(days=1)
+        self.daily_user_habit.save()
+        self.assertTrue(HabitStreak.objects.filter(
+            user_habit=self.daily_user_habit, end_date=None
+        ).exists())
+        
+        check_missed_habits(start_date=yesterday)
+        
+        self.assertFalse(HabitStreak.objects.filter(
+            user_habit=self.daily_user_habit, end_date=None
+        ).exists())
+        # The open record is closed on the last completed day, not duplicated
+        self.assertEqual(
+            list(HabitStreak.objects.filter(user_habit=self.daily_user_habit).values_list(
+                'streak_length', 'end_date'
+            )),
+            [(3, yesterday - timedelta(days=1))]
+        )
+    
+    def test_completion_after_missed_day_keeps_new_streak(self):
+        """Test that sweeping a missed day leaves a streak restarted after it alone"""
+        today = timezone.now().date()
+        for days_ago in (3, 2, 0):
+            HabitCompletion.objects.create(
+                user_habit=self.daily_user_habit, completion_date=today - timedelta(days=days_ago)
+            )
+        SweepWatermark.objects.create(periodicity='DAILY', last_processed_date=today - timedelta(days=2))
+        
+        check_missed_habits()
+        
+        self.assertTrue(MissedHabit.objects.filter(
+            user_habit=self.daily_user_habit, missed_date=today - timedelta(days=1)
+        ).exists())
+        self.daily_user_habit.refresh_from_db()
+        self.assertEqual(self.daily_user_habit.streak, 1)
+        self.assertEqual(self.daily_user_habit.streak, self.daily_user_habit.calculate_streak())
+        self.assertEqual(
+            list(HabitStreak.objects.filter(user_habit=self.daily_user_habit, end_date=None).values_list(
+                'streak_length', 'start_date'
+            )),
+            [(1, today)]
+        )
+        for record in HabitStreak.objects.filter(user_habit=self.daily_user_habit):
+            record.clean()
+    
+    def test_watermark_advanced_after_sweep(self):
+        """Test that the daily watermark records the last processed date"""
+        yesterday = timezone.now().date() - timedelta(days=1)
+        
+        check_missed_habits(start_date=yesterday - timedelta(days=2))
+        
+        watermark = SweepWatermark.objects.get(periodicity='DAILY')
+        self.assertEqual(watermark.last_processed_date, yesterday)
+    
+    def test_nightly_run_resumes_from_watermark(self):
+        """Test that a run without start_date catches up from the watermark"""
+        today = timezone.now().date()
+        SweepWatermark.objects.create(
+            periodicity='DAILY',
+            last_processed_date=today - timedelta(days=4)
+        )
+        
+        check_missed_habits()
+        
+        missed_dates = set(MissedHabit.objects.filter(
+            user_habit=self.daily_user_habit
+        ).values_list('missed_date', flat=True))
+        self.assertEqual(missed_dates, {today - timedelta(days=i) for i in (1, 2, 3)})
+    
+    def test_crash_keeps_completed_chunks(self):
+        """Test that a failure mid catch-up only loses the chunk in flight"""
+        today = timezone.now().date()
+        three_days_ago = today - timedelta(days=3)
+        original = scheduler._mark_missed
+        calls = []
+        
+        def failing_mark_missed(periodicity, *args, **kwargs):
+            if periodicity == 'DAILY':
+                calls.append(args[0])
+                if len(calls) == 2:
+                    raise RuntimeError("worker died")
+            return original(periodicity, *args, **kwargs)
+        
+        with mock.patch.object(scheduler, '_mark_missed', side_effect=failing_mark_missed):
+            with self.assertRaises(RuntimeError):
+                check_missed_habits(start_date=three_days_ago)
+        
+        self.assertEqual(
+            SweepWatermark.objects.get(periodicity='DAILY').last_processed_date,
+            three_days_ago
+        )
+        self.assertEqual(
+            list(MissedHabit.objects.filter(
+                user_habit=self.daily_user_habit
+            ).values_list('missed_date', flat=True)),
+            [three_days_ago]
+        )
+        
+        # The next run picks up where the failed one stopped
+        check_missed_habits()
+        self.assertEqual(
+            MissedHabit.objects.filter(user_habit=self.daily_user_habit).count(),
+            3
+        )
+
+
+@pytest.mark.django_db
+class TestShardedSweep(TestCase):
+    def setUp(self):
+        self.habit = Habit.objects.create(
+            name='Daily Exercise',
+            description='Exercise every day',
+            periodicity='DAILY'
+        )
+        self.user_habits = []
+        for i in range(7):
+            user = User.objects.create_user(username=f'sharduser{i}', password='testpass123')
+            self.user_habits.append(UserHabit.objects.create(
+                user=user,
+                habit=self.habit,
+                streak=i,
+                start_date=timezone.now().date() - timedelta(days=30)
+            ))
+    
+    def test_shards_partition_user_habits(self):
+        """Test that every user habit lands in exactly one shard"""
+        seen = []
+        for shard_index in range(3):
+            shard = shard_filter(UserHabit.objects.all(), shard_index, 3)
+            seen.extend(shard.values_list('id', flat=True))
+        
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {habit.id for habit in self.user_habits})
+    
+    def test_shard_index_out_of_range(self):
+        """Test that an invalid shard index is rejected"""
+        with self.assertRaises(ValueError):
+            shard_filter(UserHabit.objects.all(), 3, 3)
+    
+    def test_sharded_sweep_matches_single_sweep(self):
+        """Test that the sharded sweep records the same misses and merges counts"""
+        two_days_ago = timezone.now().date() - timedelta(days=2)
+        
+        summary = run_sharded_sweep(3, start_date=two_days_ago, max_workers=0)
+        
+        self.assertEqual(summary['missed']['DAILY'], 14)
+        self.assertEqual(sum(summary['missed_per_shard']), sum(summary['missed'].values()))
+        self.assertEqual(MissedHabit.objects.count(), 14)
+        self.assertFalse(UserHabit.objects.filter(streak__gt=0).exists())
+        self.assertEqual(
+            SweepWatermark.objects.get(periodicity='DAILY').last_processed_date,
+            timezone.now().date() - timedelta(days=1)
+        )
+
+
+@pytest.mark.django_db
+class TestTimezoneSweep(TestCase):
+    def setUp(self):
+        invalidate_timezone_index()
+        self.habit = Habit.objects.create(
+            name='Daily Exercise',
+            description='Exercise every day',
+            periodicity='DAILY'
+        )
+        self.tokyo_habit = self._create_user_habit('tokyo', 'Asia/Tokyo')
+        self.new_york_habit = self._create_user_habit('newyork', 'America/New_York')
+        self.broken_habit = self._create_user_habit('broken', 'Not/AZone')
+        # 15:30 UTC is 00:30 the next day in Tokyo and 11:30 in New York
+        self.now = datetime(2025, 3, 10, 15, 30, tzinfo=dt_timezone.utc)
+    
+    def tearDown(self):
+        invalidate_timezone_index()
+    
+    def _create_user_habit(self, username, tz_name):
+        user = User.objects.create_user(username=username, password='testpass123')
+        user.profile.timezone = tz_name
+        user.profile.save()
+        return UserHabit.objects.create(user=user, habit=self.habit, start_date=date(2025, 1, 1))
+    
+    def test_zones_at_local_midnight(self):
+        """Test that only zones in their midnight hour are selected"""
+        zones = zones_at_local_midnight(self.now)
+        
+        self.assertEqual(zones, {'Asia/Tokyo': self.now.date() + timedelta(days=1)})
+    
+    def test_invalid_timezone_swept_as_utc(self):
+        """Test that users with an unknown timezone are swept at UTC midnight"""
+        utc_midnight = datetime(2025, 3, 10, 0, 5, tzinfo=dt_timezone.utc)
+        
+        run_timezone_sweep(utc_midnight)
+        
+        self.assertTrue(MissedHabit.objects.filter(
+            user_habit=self.broken_habit,
+            missed_date=utc_midnight.date() - timedelta(days=1)
+        ).exists())
+        self.assertFalse(MissedHabit.objects.exclude(user_habit=self.broken_habit).exists())
+    
+    def test_sweep_uses_local_day_boundary(self):
+        """Test that an hourly run only sweeps users whose local day just ended"""
+        summary = run_timezone_sweep(self.now)
+        
+        self.assertEqual(list(summary), ['Asia/Tokyo'])
+        self.assertEqual(
+            list(MissedHabit.objects.values_list('user_habit_id', 'missed_date')),
+            [(self.tokyo_habit.id, self.now.date())]
+        )
+        self.assertEqual(
+            SweepWatermark.objects.get(periodicity='DAILY', timezone='Asia/Tokyo').last_processed_date,
+            self.now.date()
+        )
+    
+    def test_timezone_change_invalidates_index(self):
+        """Test that a user who changes timezone is swept in the new zone"""
+        # 11:30 UTC is 00:30 the next day in Auckland
+        now = datetime(2025, 3, 10, 11, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(zones_at_local_midnight(now), {})
+        
+        user = self.new_york_habit.user
+        request = RequestFactory().post('/fake-url', {
+            'email': 'newyork@example.com',
+            'timezone': 'Pacific/Auckland'
+        })
+        request.user = user
+        setattr(request, 'session', 'session')
+        setattr(request, '_messages', FallbackStorage(request))
+        handle_profile_form(None, request, user.profile)
+        
+        self.assertEqual(zones_at_local_midnight(now), {'Pacific/Auckland': date(2025, 3, 11)})
+    
+    def test_timezone_saved_anywhere_invalidates_index(self):
+        """Test that timezone changes made outside the settings form (admin, shell) reach the sweep"""
+        now = datetime(2025, 3, 10, 11, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(zones_at_local_midnight(now), {})
+        
+        profile = UserProfile.objects.get(user=self.new_york_habit.user)
+        profile.bio = 'Unrelated change'
+        profile.save()
+        self.assertIsNotNone(cache.get(INDEX_CACHE_KEY))
+        
+        profile.timezone = 'Pacific/Auckland'
+        profile.save()
+        self.assertEqual(zones_at_local_midnight(now), {'Pacific/Auckland': date(2025, 3, 11)})
+
+
+@pytest.mark.django_db
+class TestReminderQueue(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reminded', password='testpass123')
+        self.user.profile.timezone = 'Asia/Tokyo'
+        self.user.profile.save()
+        habit = Habit.objects.create(
+            name='Daily Exercise',
+            description='Exercise every day',
+            periodicity='DAILY'
+        )
+        self.user_habit = UserHabit.objects.create(user=self.user, habit=habit)
+        # 23:30 UTC is 08:30 the next day in Tokyo
+        self.now = datetime(2025, 3, 10, 23, 30, tzinfo=dt_timezone.utc)
+    
+    def _create_reminder(self, reminder_time, reminder_date=None):
+        """Create a reminder scheduled as if it had been saved an hour before self.now"""
+        reminder = Reminder.objects.create(
+            user_habit=self.user_habit,
+            reminder_time=reminder_time,
+            reminder_date=reminder_date
+        )
+        reminder.next_fire_at = reminder.compute_next_fire_at(after=self.now - timedelta(hours=1))
+        reminder.save(update_fields=['next_fire_at'])
+        return reminder
+    
+    def test_next_fire_at_uses_user_timezone(self):
+        """Test that reminder times are interpreted in the user's timezone"""
+        reminder = Reminder.objects.create(user_habit=self.user_habit, reminder_time=time(8, 0))
+        
+        fire_at = reminder.compute_next_fire_at(after=self.now)
+        
+        # 08:00 in Tokyo already passed, so the next one is the day after
+        self.assertEqual(fire_at, datetime(2025, 3, 11, 23, 0, tzinfo=dt_timezone.utc))
+    
+    def test_only_due_reminders_sent(self):
+        """Test that only reminders whose fire time passed are sent"""
+        self._create_reminder(time(8, 15))
+        self._create_reminder(time(9, 0))
+        
+        sent = check_and_send_notifications(self.now)
+        
+        self.assertEqual(sent, 1)
+        self.assertEqual(len(mail.outbox), 1)
+    
+    def test_recurring_reminder_rescheduled(self):
+        """Test that a sent daily reminder moves to the next day and is not resent"""
+        reminder = self._create_reminder(time(8, 15))
+        
+        check_and_send_notifications(self.now)
+        check_and_send_notifications(self.now)
+        
+        reminder.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(reminder.next_fire_at, datetime(2025, 3, 11, 23, 15, tzinfo=dt_timezone.utc))
+    
+    def test_one_off_reminder_cleared(self):
+        """Test that a one-off reminder leaves the queue once sent"""
+        reminder = self._create_reminder(time(8, 15), date(2025, 3, 11))
+        
+        check_and_send_notifications(self.now)
+        
+        reminder.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNone(reminder.next_fire_at)
+    
+    @mock.patch('main_app.updater.scheduler.NotificationService.send_reminder_emails')
+    def test_due_reminders_delivered_as_one_batch(self, send_batch):
+        """Test that due reminders are handed over for delivery together"""
+        first = self._create_reminder(time(8, 0))
+        second = self._create_reminder(time(8, 15))
+        send_batch.side_effect = lambda reminders: {reminder.pk: True for reminder in reminders}
+        
+        sent = check_and_send_notifications(self.now)
+        
+        self.assertEqual(sent, 2)
+        send_batch.assert_called_once()
+        self.assertEqual({r.pk for r in send_batch.call_args.args[0]}, {first.pk, second.pk})
+    
+    @mock.patch('main_app.updater.scheduler.NotificationService.send_reminder_emails')
+    def test_failed_reminders_retried(self, send_batch):
+        """Test that reminders whose delivery failed are retried shortly instead of skipped to tomorrow"""
+        reminder = self._create_reminder(time(8, 15))
+        one_off = self._create_reminder(time(8, 0), date(2025, 3, 11))
+        send_batch.side_effect = ConnectionRefusedError('Connection refused')
+        
+        self.assertEqual(check_and_send_notifications(self.now), 0)
+        
+        retry_at = self.now + REMINDER_RETRY_DELAY
+        reminder.refresh_from_db()
+        one_off.refresh_from_db()
+        self.assertEqual((reminder.next_fire_at, one_off.next_fire_at), (retry_at, retry_at))
+        
+        send_batch.side_effect = lambda reminders: {r.pk: True for r in reminders}
+        self.assertEqual(check_and_send_notifications(retry_at), 2)
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, datetime(2025, 3, 11, 23, 15, tzinfo=dt_timezone.utc))
+    
+    def test_timezone_change_reschedules_reminders(self):
+        """Test that reminders follow the user to a new timezone"""
+        reminder = Reminder.objects.create(user_habit=self.user_habit, reminder_time=time(8, 0))
+        self.user.profile.timezone = 'UTC'
+        self.user.profile.save()
+        
+        Reminder.reschedule_for_user(self.user)
+        
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at.astimezone(dt_timezone.utc).time(), time(8, 0))
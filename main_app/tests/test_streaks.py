@@ -0,0 +1,204 @@
+import random
+from datetime import date, timedelta
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from main_app.models import Habit, UserHabit, HabitCompletion, HabitStreak, HabitAnalytics
+from main_app.services.periods import period_index
+from main_app.services.streaks import (
+    next_streak, record_completion, rebuild_streak, period_indices, rebuild_all_streaks,
+    rebuild_streak_history
+)
+from main_app.updater.scheduler import check_missed_habits
+
+
+class TestNextStreak(TestCase):
+    def test_daily_transitions(self):
+        """Test same-day, next-day and gap completions"""
+        last = date(2025, 3, 10)
+        
+        self.assertEqual(next_streak('DAILY', 4, last, last), (4, last))
+        self.assertEqual(next_streak('DAILY', 4, last, date(2025, 3, 11)), (5, date(2025, 3, 11)))
+        self.assertEqual(next_streak('DAILY', 4, last, date(2025, 3, 13)), (1, date(2025, 3, 13)))
+        self.assertEqual(next_streak('DAILY', 0, None, last), (1, last))
+    
+    def test_calendar_periods(self):
+        """Test that weeks and months follow the calendar, not a fixed number of days"""
+        # Sunday to the following Monday is the next week
+        self.assertEqual(next_streak('WEEKLY', 2, date(2025, 3, 9), date(2025, 3, 10))[0], 3)
+        # Monday to Sunday of the same week keeps the streak
+        self.assertEqual(next_streak('WEEKLY', 2, date(2025, 3, 10), date(2025, 3, 16))[0], 2)
+        # January 1st to February 28th is the next month, though 58 days apart
+        self.assertEqual(next_streak('MONTHLY', 1, date(2025, 1, 1), date(2025, 2, 28))[0], 2)
+        self.assertEqual(next_streak('MONTHLY', 5, date(2025, 1, 31), date(2025, 3, 1))[0], 1)
+    
+    def test_backdated_completion_needs_rebuild(self):
+        """Test that completions before the last completed period are not applied incrementally"""
+        self.assertIsNone(next_streak('DAILY', 3, date(2025, 3, 10), date(2025, 3, 1)))
+
+
+class TestStreakEngine(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streaker', password='testpass123')
+        self.habit = Habit.objects.create(name='Run', description='Run daily', periodicity='DAILY')
+        self.user_habit = UserHabit.objects.create(user=self.user, habit=self.habit)
+        self.today = date.today()
+    
+    def _complete(self, days_ago):
+        return HabitCompletion.objects.create(
+            user_habit=self.user_habit,
+            completion_date=self.today - timedelta(days=days_ago)
+        )
+    
+    def test_completion_counted_once(self):
+        """Test that one completion adds exactly one to the streak"""
+        self._complete(1)
+        self._complete(0)
+        
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 2)
+        self.assertEqual(self.user_habit.last_completed, self.today)
+        self.assertEqual(HabitStreak.objects.get(user_habit=self.user_habit, end_date=None).streak_length, 2)
+    
+    def test_constant_queries(self):
+        """Test that the update cost does not depend on the completion history"""
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=self.user_habit, completion_date=self.today - timedelta(days=n))
+            for n in range(3, 200)
+        ])
+        UserHabit.objects.filter(pk=self.user_habit.pk).update(
+            streak=197, last_completed=self.today - timedelta(days=3)
+        )
+        record_completion(self.user_habit, self.today - timedelta(days=2))
+        
+        with CaptureQueriesContext(connection) as first:
+            record_completion(self.user_habit, self.today - timedelta(days=1))
+        with CaptureQueriesContext(connection) as second:
+            record_completion(self.user_habit, self.today)
+        
+        self.assertEqual(self.user_habit.streak, 200)
+        self.assertLessEqual(len(first), 5)
+        self.assertEqual(len(first), len(second))
+    
+    def test_gap_restarts_streak(self):
+        """Test that a completion after a gap closes the old streak record and opens a new one"""
+        self._complete(5)
+        self._complete(4)
+        self._complete(0)
+        
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 1)
+        closed = HabitStreak.objects.get(user_habit=self.user_habit, end_date__isnull=False)
+        self.assertEqual((closed.streak_length, closed.end_date), (2, self.today - timedelta(days=4)))
+        current = HabitStreak.objects.get(user_habit=self.user_habit, end_date=None)
+        self.assertEqual((current.streak_length, current.start_date), (1, self.today))
+    
+    def test_backdated_completion_rebuilds(self):
+        """Test that filling a gap in the past reconnects the streak"""
+        self._complete(3)
+        self._complete(1)
+        self._complete(0)
+        self._complete(2)
+        
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 4)
+        self.assertEqual(HabitStreak.objects.get(user_habit=self.user_habit, end_date=None).streak_length, 4)
+    
+    def test_rebuild_resets_stale_streak(self):
+        """Test that a rebuild does not report a streak whose last period was missed"""
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=self.user_habit, completion_date=self.today - timedelta(days=n))
+            for n in (5, 6)
+        ])
+        UserHabit.objects.filter(pk=self.user_habit.pk).update(streak=9)
+        
+        self.assertEqual(rebuild_streak(self.user_habit), 0)
+        self.user_habit.refresh_from_db()
+        self.assertEqual(self.user_habit.streak, 0)
+        self.assertEqual(self.user_habit.last_completed, self.today - timedelta(days=5))
+
+
+class TestStreakRepair(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='repairer', password='testpass123')
+        self.today = date(2025, 3, 12)
+    
+    def _user_habit(self, periodicity, days_ago):
+        habit = Habit.objects.create(name=f'{periodicity} habit', description='Test', periodicity=periodicity)
+        user_habit = UserHabit.objects.create(user=self.user, habit=habit, start_date=date(2024, 1, 1))
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(user_habit=user_habit, completion_date=self.today - timedelta(days=n))
+            for n in days_ago
+        ])
+        return user_habit
+    
+    def test_period_indices_match_scalar(self):
+        """Test that the vectorized period indices agree with period_index"""
+        days = [date(2023, 12, 25) + timedelta(days=n) for n in range(0, 500, 3)]
+        for periodicity in ('DAILY', 'WEEKLY', 'MONTHLY'):
+            self.assertEqual(
+                period_indices(periodicity, np.array(days, dtype='datetime64[D]')).tolist(),
+                [period_index(periodicity, day) for day in days]
+            )
+    
+    def test_repairs_corrupted_history(self):
+        """Test that drifted streaks, history and longest streaks are rebuilt"""
+        user_habit = self._user_habit('DAILY', [20, 19, 18, 17, 10, 1, 0])
+        UserHabit.objects.filter(pk=user_habit.pk).update(streak=40, last_completed=date(2020, 1, 1))
+        HabitStreak.objects.create(user_habit=user_habit, streak_length=40, start_date=date(2020, 1, 1))
+        HabitAnalytics.objects.create(user=self.user, habit=user_habit.habit, longest_streak=40)
+        
+        totals = rebuild_all_streaks(batch_size=2, today=self.today)
+        
+        self.assertEqual((totals['habits'], totals['completions'], totals['runs'], totals['repaired']), (1, 7, 3, 1))
+        user_habit.refresh_from_db()
+        self.assertEqual((user_habit.streak, user_habit.last_completed), (2, self.today))
+        self.assertEqual(
+            list(HabitStreak.objects.filter(user_habit=user_habit).order_by('start_date').values_list(
+                'streak_length', 'end_date'
+            )),
+            [(4, self.today - timedelta(days=17)), (1, self.today - timedelta(days=10)), (2, None)]
+        )
+        self.assertEqual(HabitAnalytics.objects.get(habit=user_habit.habit).longest_streak, 4)
+    
+    def test_matches_incremental_engine(self):
+        """Test that the batch rebuild agrees with the per-habit rebuild for random histories"""
+        rng = random.Random(16)
+        user_habits = [
+            self._user_habit(periodicity, rng.sample(range(120), rng.randint(0, 60)))
+            for periodicity in ('DAILY', 'WEEKLY', 'MONTHLY', '') * 3
+        ]
+        
+        rebuild_all_streaks(batch_size=5, today=self.today)
+        
+        for user_habit in user_habits:
+            user_habit.refresh_from_db()
+            rebuilt = user_habit.streak
+            self.assertEqual(rebuild_streak(user_habit, today=self.today), rebuilt)
+            self.assertLessEqual(
+                HabitStreak.objects.filter(user_habit=user_habit, end_date=None).count(), 1
+            )
+    
+    def test_incremental_history_matches_rebuild(self):
+        """Test that streaks closed by completions and by the sweep end where a rebuild ends them"""
+        habit = Habit.objects.create(name='Weekly review', description='Test', periodicity='WEEKLY')
+        user_habit = UserHabit.objects.create(user=self.user, habit=habit, start_date=date(2025, 1, 27))
+        # Two consecutive weeks, a missed week, then one week followed by misses
+        for day in (date(2025, 1, 29), date(2025, 2, 3), date(2025, 2, 20)):
+            HabitCompletion.objects.create(user_habit=user_habit, completion_date=day)
+        check_missed_habits(start_date=date(2025, 1, 27), today=self.today)
+        
+        def history():
+            return list(HabitStreak.objects.filter(user_habit=user_habit).order_by('start_date').values_list(
+                'streak_length', 'start_date', 'end_date'
+            ))
+        
+        incremental = history()
+        self.assertEqual(incremental, [
+            (2, date(2025, 1, 27), date(2025, 2, 9)),
+            (1, date(2025, 2, 17), date(2025, 2, 23))
+        ])
+        rebuild_streak_history([user_habit.id], today=self.today)
+        self.assertEqual(history(), incremental)
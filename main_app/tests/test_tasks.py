@@ -0,0 +1,146 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from io import StringIO
+from unittest import mock
+from main_app.models import BackgroundTask, Habit, HabitAnalytics, UserHabit, HabitCompletion
+from main_app.tasks import (
+    task, enqueue, claim_tasks, run_task, run_pending, backoff_seconds, UnknownTask
+)
+
+calls = []
+
+
+@task(max_attempts=2)
+def record_call(value):
+    calls.append(value)
+
+
+@task
+def always_fails():
+    raise RuntimeError('boom')
+
+
+class TestTaskQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+    
+    def test_enqueue_and_run(self):
+        """Test that a queued task runs with its payload"""
+        queued = enqueue(record_call, value=42)
+        
+        self.assertEqual(run_pending('worker-1'), 1)
+        
+        queued.refresh_from_db()
+        self.assertEqual(calls, [42])
+        self.assertEqual(queued.status, 'DONE')
+        self.assertEqual(queued.attempts, 1)
+    
+    def test_unknown_task_rejected(self):
+        """Test that only registered tasks can be queued"""
+        with self.assertRaises(UnknownTask):
+            enqueue('no_such_task')
+    
+    def test_delayed_task_not_claimed_early(self):
+        """Test that tasks are only claimed once available"""
+        enqueue(record_call, delay=timedelta(minutes=5), value=1)
+        
+        self.assertEqual(claim_tasks('worker-1'), [])
+    
+    def test_claimed_task_invisible_to_other_workers(self):
+        """Test that a task is handed to one worker at a time"""
+        enqueue(record_call, value=1)
+        
+        self.assertEqual(len(claim_tasks('worker-1')), 1)
+        self.assertEqual(claim_tasks('worker-2'), [])
+    
+    def test_expired_claim_is_retried(self):
+        """Test that a task whose worker died is reclaimed after the visibility timeout"""
+        enqueue(record_call, value=1)
+        claim_tasks('worker-1', visibility_timeout=60)
+        BackgroundTask.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        
+        reclaimed = claim_tasks('worker-2')
+        
+        self.assertEqual(len(reclaimed), 1)
+        self.assertEqual(reclaimed[0].locked_by, 'worker-2')
+        self.assertEqual(reclaimed[0].attempts, 2)
+    
+    def test_failure_retried_with_backoff(self):
+        """Test that a failed task is rescheduled with exponential backoff"""
+        queued = enqueue(always_fails)
+        before = timezone.now()
+        
+        run_pending('worker-1')
+        
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'PENDING')
+        self.assertIn('boom', queued.last_error)
+        self.assertGreaterEqual(queued.available_at, before + timedelta(seconds=backoff_seconds(1)))
+        self.assertEqual([backoff_seconds(n) for n in (1, 2, 3)], [10, 20, 40])
+    
+    def test_failure_after_max_attempts(self):
+        """Test that a task stops being retried after max_attempts"""
+        queued = enqueue(always_fails)
+        BackgroundTask.objects.update(attempts=queued.max_attempts - 1)
+        
+        for background_task in claim_tasks('worker-1'):
+            run_task(background_task)
+        
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'FAILED')
+        self.assertIsNotNone(queued.finished_at)
+    
+    def test_run_worker_once(self):
+        """Test that the worker command drains the queue"""
+        for value in range(3):
+            enqueue(record_call, value=value)
+        
+        call_command('run_worker', '--once', stdout=StringIO())
+        
+        self.assertEqual(sorted(calls), [0, 1, 2])
+        self.assertFalse(BackgroundTask.objects.exclude(status='DONE').exists())
+
+
+class TestApplicationTasks(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='worker', email='worker@example.com', password='testpass123'
+        )
+        habit = Habit.objects.create(name='Read', description='Read daily', periodicity='DAILY')
+        self.user_habit = UserHabit.objects.create(user=self.user, habit=habit)
+    
+    def test_completion_updates_analytics_in_place(self):
+        """Test that completing a habit updates its analytics without queueing a recalculation"""
+        HabitCompletion.objects.create(user_habit=self.user_habit)
+        
+        self.assertFalse(BackgroundTask.objects.filter(name='recalculate_habit_analytics').exists())
+        analytics = HabitAnalytics.objects.get(user=self.user, habit=self.user_habit.habit)
+        self.assertEqual((analytics.completions_count, analytics.completion_rate), (1, 100.0))
+    
+    def test_export_emailed(self):
+        """Test that the export task emails the data as an attachment"""
+        HabitCompletion.objects.create(user_habit=self.user_habit)
+        enqueue('export_user_data', user_id=self.user.id)
+        
+        call_command('run_worker', '--once', stdout=StringIO())
+        
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['worker@example.com'])
+        self.assertEqual(mail.outbox[0].attachments[0][0], 'worker_data_export.json')
+    
+    @mock.patch('main_app.services.notification_service.render_to_string', return_value='7 days')
+    @mock.patch('main_app.services.notification_service.send_mail', side_effect=ConnectionRefusedError('refused'))
+    def test_milestone_email_failure_retried(self, send_mail, render):
+        """Test that a milestone email that could not be sent stays queued for a retry"""
+        queued = enqueue('send_streak_milestone_email', user_habit_id=self.user_habit.id, streak_length=7)
+        
+        run_pending('worker-1')
+        
+        queued.refresh_from_db()
+        send_mail.assert_called_once()
+        self.assertEqual(queued.status, 'PENDING')
+        self.assertIn('refused', queued.last_error)
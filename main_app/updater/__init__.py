@@ -1 +1,4 @@
-from .updater import start
\ No newline at end of file
+def start():
+    """Start the background scheduler in this process (imports APScheduler lazily)"""
+    from .updater import start as start_scheduler
+    start_scheduler()
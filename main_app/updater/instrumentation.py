@@ -0,0 +1,155 @@
+"""
+Instrumentation and history retention for scheduled jobs.
+
+Every scheduled job runs inside ``instrument_job``, which records a JobRun
+with its duration, the queries it issued, the rows they read and wrote and
+the peak memory allocated while it ran.
+"""
+
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from ..models import BackgroundTask, JobRun
+
+logger = logging.getLogger(__name__)
+
+PRUNE_CHUNK_SIZE = 1000
+
+# tracemalloc is process-wide while jobs run on a thread pool, so tracing is
+# shared by every job in flight: started by the first and stopped by the last
+_tracing_lock = threading.Lock()
+_tracing_jobs = 0
+_started_tracing = False
+
+
+def _start_tracing():
+    """Join the shared memory trace; returns the memory traced when joining"""
+    global _tracing_jobs, _started_tracing
+    with _tracing_lock:
+        if _tracing_jobs == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            # Only reset the peak while no other job is measuring it
+            tracemalloc.reset_peak()
+        _tracing_jobs += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing():
+    """Leave the shared memory trace; returns the peak traced memory"""
+    global _tracing_jobs, _started_tracing
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_jobs -= 1
+        if _tracing_jobs == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+        return peak
+
+
+class QueryStats:
+    """Database execute wrapper counting queries and affected rows"""
+    
+    def __init__(self):
+        self.queries = 0
+        self.rows_read = 0
+        self.rows_written = 0
+    
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        # rowcount is -1 where the database does not report it (e.g. SQLite SELECTs)
+        rowcount = context['cursor'].rowcount
+        if rowcount > 0:
+            if sql.lstrip().upper().startswith('SELECT'):
+                self.rows_read += rowcount
+            else:
+                self.rows_written += rowcount
+        return result
+
+
+@contextmanager
+def instrument_job(job_name):
+    """
+    Record a JobRun for the code run inside the block.
+    
+    Peak memory is the peak traced above what was allocated when the job
+    started. While jobs overlap it also includes the others' allocations,
+    so it is an upper bound.
+    
+    Failures are recorded and re-raised.
+    """
+    stats = QueryStats()
+    baseline = _start_tracing()
+    
+    run = JobRun(job_name=job_name, started_at=timezone.now())
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(stats):
+            yield run
+    except Exception as e:
+        run.succeeded = False
+        run.error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        run.duration = time.perf_counter() - started
+        run.peak_memory = max(0, _stop_tracing() - baseline)
+        run.queries = stats.queries
+        run.rows_read = stats.rows_read
+        run.rows_written = stats.rows_written
+        try:
+            run.save()
+        except Exception as e:
+            logger.error(f"Could not record run of {job_name}: {str(e)}")
+        logger.info(
+            f"Job {job_name} took {run.duration:.2f}s, {run.queries} queries, "
+            f"{run.rows_read} rows read, {run.rows_written} rows written, "
+            f"peak memory {run.peak_memory / 1024:.0f} KiB"
+        )
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    """Delete the rows of ``queryset`` a chunk at a time, keeping transactions short"""
+    deleted = 0
+    while True:
+        chunk = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not chunk:
+            return deleted
+        queryset.model.objects.filter(pk__in=chunk).delete()
+        deleted += len(chunk)
+
+
+def prune_job_history(max_age_days=None, chunk_size=PRUNE_CHUNK_SIZE):
+    """
+    Delete job runs, and background tasks that finished successfully, older
+    than the retention period.
+    
+    Args:
+        max_age_days: Defaults to settings.JOB_HISTORY_RETENTION_DAYS
+        chunk_size: Rows deleted per statement
+    
+    Returns:
+        Dictionary with the number of rows deleted per table
+    """
+    if max_age_days is None:
+        max_age_days = getattr(settings, 'JOB_HISTORY_RETENTION_DAYS', 14)
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+    
+    summary = {
+        'job_runs': _delete_in_chunks(
+            JobRun.objects.filter(started_at__lt=cutoff), chunk_size
+        ),
+        # Failed tasks are kept for inspection
+        'background_tasks': _delete_in_chunks(
+            BackgroundTask.objects.filter(status='DONE', finished_at__lt=cutoff), chunk_size
+        ),
+    }
+    logger.info(f"Pruned scheduler history older than {max_age_days} days: {summary}")
+    return summary
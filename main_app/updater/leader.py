@@ -0,0 +1,101 @@
+"""
+Leader election over a database lease.
+
+Every process that starts the scheduler competes for one SchedulerLease row.
+Acquiring and renewing are conditional UPDATEs that only match while the
+caller already holds the lease or the lease has expired, so at most one
+process holds it at any time. The holder renews it with a heartbeat; when it
+dies the lease expires and another process takes over on its next heartbeat.
+"""
+
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from ..models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'scheduler'
+# The leader heartbeats every LEASE_HEARTBEAT seconds; a lease that has not
+# been renewed for LEASE_TTL seconds is up for grabs
+LEASE_TTL = 15
+LEASE_HEARTBEAT = 5
+# Stop acting as leader this long before the lease runs out, so a late
+# heartbeat never leaves two processes believing they lead
+LEASE_SAFETY_MARGIN = 2
+
+
+def default_holder_id():
+    """Identify this process uniquely across the cluster"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class LeaderElector:
+    """Acquires, renews and releases the scheduler lease for one process"""
+    
+    def __init__(self, name=LEASE_NAME, holder=None, ttl=LEASE_TTL):
+        self.name = name
+        self.holder = holder or default_holder_id()
+        self.ttl = ttl
+        self._expires_at = None
+    
+    def _ensure_lease_row(self):
+        if SchedulerLease.objects.filter(name=self.name).exists():
+            return
+        try:
+            SchedulerLease.objects.create(name=self.name, expires_at=timezone.now())
+        except IntegrityError:
+            # Another process created it first
+            pass
+    
+    def heartbeat(self):
+        """
+        Acquire the lease if it is free or expired, or renew it if held.
+        
+        Returns:
+            True if this process holds the lease afterwards
+        """
+        self._ensure_lease_row()
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        lease = SchedulerLease.objects.filter(name=self.name)
+        
+        renewed = lease.filter(holder=self.holder, expires_at__gt=now).update(
+            heartbeat_at=now,
+            expires_at=expires_at
+        )
+        if not renewed:
+            acquired = lease.filter(Q(holder='') | Q(expires_at__lte=now)).update(
+                holder=self.holder,
+                acquired_at=now,
+                heartbeat_at=now,
+                expires_at=expires_at
+            )
+            if not acquired:
+                if self._expires_at is not None:
+                    logger.warning(f"{self.holder} lost the {self.name} lease")
+                self._expires_at = None
+                return False
+            logger.info(f"{self.holder} acquired the {self.name} lease")
+        
+        self._expires_at = expires_at
+        return True
+    
+    def is_leader(self):
+        """Whether this process may run leader-only work right now"""
+        if self._expires_at is None:
+            return False
+        return timezone.now() < self._expires_at - timedelta(seconds=LEASE_SAFETY_MARGIN)
+    
+    def release(self):
+        """Give up the lease so another process can take over immediately"""
+        SchedulerLease.objects.filter(name=self.name, holder=self.holder).update(
+            holder='',
+            expires_at=timezone.now()
+        )
+        self._expires_at = None
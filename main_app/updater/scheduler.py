@@ -1,233 +1,333 @@
-from apscheduler.schedulers.background import BackgroundScheduler
 from django.conf import settings
 from django.utils import timezone
 from main_app.services.notification_service import NotificationService
-from ..models import HabitCompletion, UserHabit, MissedHabit, HabitStreak, Reminder
-from datetime import datetime, timedelta
+from ..analytics.controller import AnalyticsController
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from ..services.periods import PERIODICITIES, complete_periods
+from ..services.counters import count_misses
+from ..services.rollups import count_missed_days
+from ..services.streaks import break_streaks
+from ..services.sharding import shard_filter, shard_pool, map_shards
+from .timezones import timezone_filter, zones_at_local_midnight
+from ..models import (
+    HabitCompletion, UserHabit, MissedHabit, Reminder, SweepWatermark
+)
+from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
-def check_missed_habits(start_date=None):
+# Upper bound on rows per INSERT issued by the sweep
+SWEEP_BATCH_SIZE = 500
+
+# Due reminders fetched per query by check_and_send_notifications
+REMINDER_BATCH_SIZE = 200
+
+# Delay before a reminder whose email could not be delivered is tried again
+REMINDER_RETRY_DELAY = timedelta(minutes=5)
+
+
+def _mark_missed(periodicity, start, end, shard=None, timezone_name=None):
     """
-    Checks for habits that should have been completed but weren't
-    and marks them as missed, updating streaks accordingly.
-    Handles system downtime by checking all dates from last operation to current date.
+    Record a miss for every active habit of the given periodicity that had
+    started by end, has no completion between start and end (inclusive) and
+    no MissedHabit on the period's last day yet, then close and reset any
+    broken streaks.
+    
+    The candidates come from a single anti-join, so the number of queries
+    issued does not depend on how many habits there are.
     
     Args:
-        start_date: Optional date to start checking from. If None, checks from yesterday.
+        shard: Optional (shard_index, shard_count) restricting the sweep to
+            one partition of the users
+        timezone_name: Optional sweep zone restricting the sweep to the
+            users whose local day boundary it is
+    
+    Returns:
+        Number of habits newly marked as missed
     """
-    today = timezone.now().date()
+    completed = HabitCompletion.objects.filter(
+        user_habit=OuterRef('pk'),
+        completion_date__gte=start,
+        completion_date__lte=end
+    )
+    already_missed = MissedHabit.objects.filter(
+        user_habit=OuterRef('pk'),
+        missed_date=end
+    )
+    habits = UserHabit.objects.filter(
+        is_active=True,
+        habit__periodicity=periodicity,
+        start_date__lte=end
+    )
+    if shard is not None:
+        habits = shard_filter(habits, *shard)
+    if timezone_name:
+        habits = habits.filter(timezone_filter(timezone_name))
     
-    # If no start date provided, default to yesterday
-    if not start_date:
-        start_date = today - timedelta(days=1)
+    missed = list(
+        habits.exclude(
+            Exists(completed)
+        ).exclude(
+            Exists(already_missed)
+        ).values_list('id', 'streak', 'last_completed')
+    )
     
-    # Ensure start_date is not in the future
-    start_date = min(start_date, today - timedelta(days=1))
+    if not missed:
+        return 0
     
-    # Generate list of dates to check
-    dates_to_check = []
-    current_date = start_date
-    while current_date < today:
-        dates_to_check.append(current_date)
-        current_date += timedelta(days=1)
+    MissedHabit.objects.bulk_create(
+        [MissedHabit(user_habit_id=habit_id, missed_date=end) for habit_id, _, _ in missed],
+        batch_size=SWEEP_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    missed_ids = [habit_id for habit_id, _, _ in missed]
+    count_misses(missed_ids)
+    count_missed_days(missed_ids, end)
     
-    # ---------- DAILY HABITS ----------
-    # Get all active daily habits
-    daily_habits = UserHabit.objects.filter(
-        is_active=True,
-        habit__periodicity='DAILY'
+    # Close and reset the streaks the missed period broke
+    break_streaks(periodicity, [habit for habit in missed if habit[1] > 0], end)
+    
+    return len(missed)
+
+
+def _next_unprocessed_date(periodicity, today, timezone_name=None):
+    """Day after the sweep watermark, or yesterday if the sweep never ran"""
+    watermark = SweepWatermark.objects.filter(
+        periodicity=periodicity,
+        timezone=timezone_name or ''
+    ).values_list('last_processed_date', flat=True).first()
+    
+    if watermark is None:
+        return today - timedelta(days=1)
+    return watermark + timedelta(days=1)
+
+
+def _advance_watermark(periodicity, processed_date, timezone_name=None):
+    """Move the watermark forward to processed_date, never backwards"""
+    watermark, created = SweepWatermark.objects.get_or_create(
+        periodicity=periodicity,
+        timezone=timezone_name or '',
+        defaults={'last_processed_date': processed_date}
     )
+    if not created and watermark.last_processed_date < processed_date:
+        SweepWatermark.objects.filter(pk=watermark.pk).update(
+            last_processed_date=processed_date
+        )
+
+
+def check_missed_habits(start_date=None, timezone_name=None, today=None):
+    """
+    Checks for habits that should have been completed but weren't
+    and marks them as missed, updating streaks accordingly.
     
-    for habit in daily_habits:
-        for check_date in dates_to_check:
-            # Skip if already completed on this date
-            if HabitCompletion.objects.filter(
-                user_habit=habit,
-                completion_date=check_date
-            ).exists():
-                continue
-            
-            # Skip if already marked as missed
-            if MissedHabit.objects.filter(
-                user_habit=habit,
-                missed_date=check_date
-            ).exists():
-                continue
-            
-            # Mark as missed
-            MissedHabit.objects.create(
-                user_habit=habit,
-                missed_date=check_date
-            )
-            
-            # Reset streak if it was active
-            if habit.streak > 0:
-                # Save old streak for historical records
-                streak_start = check_date - timedelta(days=habit.streak)
-                HabitStreak.objects.create(
-                    user_habit=habit,
-                    streak_length=habit.streak,
-                    start_date=streak_start,
-                    end_date=check_date
-                )
-                # Reset current streak
-                habit.streak = 0
-                habit.save()
-    
-    # ---------- WEEKLY HABITS ----------
-    # Process each week in the date range
-    current_week_start = start_date
-    while current_week_start < today:
-        # Find week boundaries
-        week_start = current_week_start - timedelta(days=current_week_start.weekday())
-        week_end = week_start + timedelta(days=6)
+    Work is done one period (day, week or month) at a time, each in its own
+    transaction together with the sweep watermark for its periodicity. After
+    downtime or a crash the next run resumes from the watermark, losing at
+    most the chunk that was in flight.
+    
+    Args:
+        start_date: Optional date to start checking from. If None, each
+            periodicity resumes after its watermark (or yesterday on first run).
+        timezone_name: Optional sweep zone; only its users are checked and it
+            keeps its own watermarks
+        today: The current date for the users being swept, defaults to the
+            server date
+    
+    Returns:
+        Dictionary mapping each periodicity to the number of misses recorded
+    """
+    today = today or timezone.now().date()
+    summary = {}
+    
+    for periodicity in PERIODICITIES:
+        summary[periodicity] = 0
         
-        if week_end >= today:
-            break
+        first_date = start_date or _next_unprocessed_date(periodicity, today, timezone_name)
+        # Ensure the first date is not in the future
+        first_date = min(first_date, today - timedelta(days=1))
         
-        weekly_habits = UserHabit.objects.filter(
-            is_active=True,
-            habit__periodicity='WEEKLY'
-        )
-        
-        for habit in weekly_habits:
-            # Check if completed within this week
-            completed_this_week = HabitCompletion.objects.filter(
-                user_habit=habit,
-                completion_date__gte=week_start,
-                completion_date__lte=week_end
-            ).exists()
-            
-            if completed_this_week:
-                continue
-                
-            # Skip if already marked as missed
-            if MissedHabit.objects.filter(
-                user_habit=habit,
-                missed_date=week_end
-            ).exists():
-                continue
-                
-            # Mark as missed
-            MissedHabit.objects.create(
-                user_habit=habit,
-                missed_date=week_end
-            )
-            
-            # Reset streak if it was active
-            if habit.streak > 0:
-                # Save streak history
-                streak_start = week_end - timedelta(weeks=habit.streak)
-                HabitStreak.objects.create(
-                    user_habit=habit,
-                    streak_length=habit.streak,
-                    start_date=streak_start,
-                    end_date=week_end
+        for _, start, end in complete_periods(periodicity, first_date, today):
+            with transaction.atomic():
+                summary[periodicity] += _mark_missed(
+                    periodicity, start, end, timezone_name=timezone_name
                 )
-                # Reset current streak
-                habit.streak = 0
-                habit.save()
-        
-        current_week_start += timedelta(days=7)
-    
-    # ---------- MONTHLY HABITS ----------
-    # Process each month in the date range
-    current_month = start_date
-    while current_month < today:
-        # Find month boundaries
-        month_start = current_month.replace(day=1)
-        next_month = (month_start + timedelta(days=32)).replace(day=1)
-        month_end = next_month - timedelta(days=1)
-        
-        if month_end >= today:
-            break
-        
-        monthly_habits = UserHabit.objects.filter(
-            is_active=True,
-            habit__periodicity='MONTHLY'
+                _advance_watermark(periodicity, end, timezone_name)
+            
+            logger.debug(f"Swept {periodicity} habits for {start} - {end}")
+    
+    return summary
+
+
+def sweep_shard(periodicity, start, end, shard_index, shard_count, timezone_name=None):
+    """
+    Pool worker: sweep one period for one shard of the users in its own transaction.
+    
+    Returns:
+        Number of habits newly marked as missed in this shard
+    """
+    with transaction.atomic():
+        return _mark_missed(
+            periodicity, start, end,
+            shard=(shard_index, shard_count),
+            timezone_name=timezone_name
         )
-        
-        for habit in monthly_habits:
-            # Check if completed within this month
-            completed_this_month = HabitCompletion.objects.filter(
-                user_habit=habit,
-                completion_date__gte=month_start,
-                completion_date__lte=month_end
-            ).exists()
+
+
+def run_sharded_sweep(shard_count, start_date=None, max_workers=None, timezone_name=None, today=None):
+    """
+    Run the missed-habit sweep with UserHabit partitioned into shard_count
+    shards, each processed by a worker process.
+    
+    Periods are still processed in order. The watermark for a period only
+    advances once every shard has committed it, and re-running a period is
+    harmless because the sweep skips habits that were already marked.
+    
+    Args:
+        shard_count: Number of partitions of the users
+        start_date: Optional date to start checking from, as for check_missed_habits
+        max_workers: Worker processes to use (0 runs every shard in this process)
+        timezone_name: Optional sweep zone, as for check_missed_habits
+        today: The current date for the users being swept
+    
+    Returns:
+        Summary with total and per-shard miss counts
+    """
+    today = today or timezone.now().date()
+    summary = {
+        'shards': shard_count,
+        'periods': 0,
+        'missed': {},
+        'missed_per_shard': [0] * shard_count,
+    }
+    
+    with shard_pool(shard_count, max_workers) as pool:
+        for periodicity in PERIODICITIES:
+            summary['missed'][periodicity] = 0
             
-            if completed_this_month:
-                continue
-                
-            # Skip if already marked as missed
-            if MissedHabit.objects.filter(
-                user_habit=habit,
-                missed_date=month_end
-            ).exists():
-                continue
-                
-            # Mark as missed
-            MissedHabit.objects.create(
-                user_habit=habit,
-                missed_date=month_end
-            )
+            first_date = start_date or _next_unprocessed_date(periodicity, today, timezone_name)
+            first_date = min(first_date, today - timedelta(days=1))
             
-            # Reset streak if it was active
-            if habit.streak > 0:
-                # Calculate streak start date
-                streak_start = month_end
-                for _ in range(habit.streak):
-                    month = streak_start.month - 1
-                    year = streak_start.year
-                    if month == 0:
-                        month = 12
-                        year -= 1
-                    
-                    day = min(streak_start.day, [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1])
-                    streak_start = streak_start.replace(year=year, month=month, day=day)
-                
-                # Save streak history
-                HabitStreak.objects.create(
-                    user_habit=habit,
-                    streak_length=habit.streak,
-                    start_date=streak_start,
-                    end_date=month_end
+            for _, start, end in complete_periods(periodicity, first_date, today):
+                counts = map_shards(
+                    pool, sweep_shard, shard_count, periodicity, start, end,
+                    timezone_name=timezone_name
                 )
-                # Reset current streak
-                habit.streak = 0
-                habit.save()
-        
-        current_month = next_month
+                _advance_watermark(periodicity, end, timezone_name)
+                
+                summary['periods'] += 1
+                summary['missed'][periodicity] += sum(counts)
+                for shard_index, count in enumerate(counts):
+                    summary['missed_per_shard'][shard_index] += count
+    
+    logger.info(f"Sharded sweep finished: {summary}")
+    return summary
 
 
-def check_and_send_notifications():
-    """Check for due reminders and send notifications"""
-    current_time = timezone.localtime(timezone.now())
-    logger.info(f"Running notification check at {current_time}")
+def run_timezone_sweep(now=None):
+    """
+    Hourly entry point: sweep only the users whose local midnight just passed,
+    using each zone's local date as "today". The sweep is sharded when
+    SCHEDULER_SHARDS is configured.
+    
+    Returns:
+        Dictionary mapping each swept zone to its sweep summary
+    """
+    shard_count = getattr(settings, 'SCHEDULER_SHARDS', 0)
+    summary = {}
+    
+    for zone, local_today in sorted(zones_at_local_midnight(now).items()):
+        if shard_count > 1:
+            summary[zone] = run_sharded_sweep(shard_count, timezone_name=zone, today=local_today)
+        else:
+            summary[zone] = check_missed_habits(timezone_name=zone, today=local_today)
+        logger.info(f"Swept habits for timezone {zone} (local date {local_today})")
+    
+    if summary:
+        # New missed habits and reset streaks should show on the admin
+        # dashboard; the cache is shared, so this reaches the web workers
+        AnalyticsController.invalidate_system_overview()
+    return summary
 
-    # Get all reminders
-    reminders = Reminder.objects.select_related('user_habit', 'user_habit__user', 'user_habit__habit').all()
 
-    for reminder in reminders:
-        try:
-            user_habit = reminder.user_habit
-            reminder_time = reminder.reminder_time
-
-            # Convert reminder time to current date
-            reminder_datetime = datetime.combine(
-                current_time.date(),
-                reminder_time
-            )
-
-            # Check if it's time to send the reminder (within the current hour)
-            if current_time.hour == reminder_datetime.hour:
-                # Send the reminder
-                success = NotificationService.send_reminder_email(user_habit)
-                if success:
-                    logger.info(f"Sent reminder for habit '{user_habit.habit.name}' to {user_habit.user.email}")
-                else:
-                    logger.warning(f"Failed to send reminder for habit '{user_habit.habit.name}' to {user_habit.user.email}")
+def _claim_reminder(reminder, now):
+    """
+    Move a due reminder on to its next fire time.
+    
+    The update only matches while next_fire_at is still the value that was
+    read, so when several schedulers race for the same reminder exactly one
+    of them claims it.
+    
+    Returns:
+        True if this call claimed the reminder
+    """
+    due_at = reminder.next_fire_at
+    reminder.next_fire_at = reminder.compute_next_fire_at(after=max(now, due_at))
+    return Reminder.objects.filter(
+        pk=reminder.pk,
+        next_fire_at=due_at
+    ).update(next_fire_at=reminder.next_fire_at) == 1
 
+
+def _retry_reminders(reminder_ids, now):
+    """
+    Bring claimed reminders whose email was not delivered back to a fire time
+    shortly after now, unless they are already due again sooner.
+    """
+    retry_at = now + REMINDER_RETRY_DELAY
+    Reminder.objects.filter(pk__in=reminder_ids).filter(
+        Q(next_fire_at__isnull=True) | Q(next_fire_at__gt=retry_at)
+    ).update(next_fire_at=retry_at)
+
+
+def check_and_send_notifications(now=None):
+    """
+    Send every reminder whose next fire time has passed.
+    
+    Due reminders are read from the next_fire_at index in batches, so the
+    cost depends on how many reminders are due rather than how many exist.
+    Each reminder is claimed (moved to its next fire time) before it is sent,
+    and every batch is delivered over a few reused mail connections.
+    Reminders whose email could not be delivered are tried again after
+    REMINDER_RETRY_DELAY instead of waiting for their next fire time.
+    
+    Returns:
+        Number of reminders sent
+    """
+    now = now or timezone.now()
+    logger.info(f"Running notification check at {now}")
+    sent = 0
+    
+    while True:
+        due = list(
+            Reminder.objects.filter(
+                next_fire_at__lte=now
+            ).select_related(
+                'user_habit__user__profile', 'user_habit__habit'
+            ).order_by('next_fire_at')[:REMINDER_BATCH_SIZE]
+        )
+        if not due:
+            break
+        
+        claimed = [reminder for reminder in due if _claim_reminder(reminder, now)]
+        try:
+            results = NotificationService.send_reminder_emails(claimed)
         except Exception as e:
-            logger.error(f"Error processing reminder: {str(e)}")
+            logger.error(f"Failed to send reminder emails: {str(e)}")
+            results = {reminder.pk: False for reminder in claimed}
+        
+        failed = []
+        for reminder in claimed:
+            user_habit = reminder.user_habit
+            if results[reminder.pk]:
+                sent += 1
+                logger.info(f"Sent reminder for habit '{user_habit.habit.name}' to {user_habit.user.email}")
+            elif results[reminder.pk] is False:
+                failed.append(reminder.pk)
+                logger.warning(f"Failed to send reminder for habit '{user_habit.habit.name}' to {user_habit.user.email}")
+        
+        if failed:
+            _retry_reminders(failed, now)
+    
+    return sent
@@ -0,0 +1,76 @@
+"""
+Timezone index used to stagger the missed-habit sweep.
+
+Instead of sweeping every user at 00:01 server time, the scheduler runs
+hourly and only sweeps the users whose local midnight just passed, so each
+user's "yesterday" is their own and the load is spread over 24 runs.
+"""
+
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from ..models import UserProfile
+
+INDEX_CACHE_KEY = 'sweep:timezone-index'
+INDEX_CACHE_TTL = 10 * 60
+
+# Users without a profile or with an unknown timezone are swept as UTC
+FALLBACK_TIMEZONE = 'UTC'
+
+
+def _is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def timezone_index():
+    """
+    Map every timezone stored on a profile to the zone its users are swept in.
+    
+    Built from one query over the indexed UserProfile.timezone column and
+    cached briefly so a run can resolve all of its zones from memory.
+    """
+    index = cache.get(INDEX_CACHE_KEY)
+    if index is None:
+        index = {FALLBACK_TIMEZONE: FALLBACK_TIMEZONE}
+        for name in UserProfile.objects.values_list('timezone', flat=True).distinct():
+            index[name] = name if name and _is_valid_timezone(name) else FALLBACK_TIMEZONE
+        cache.set(INDEX_CACHE_KEY, index, INDEX_CACHE_TTL)
+    return index
+
+
+def invalidate_timezone_index():
+    """Forget the cached index; called whenever a profile's timezone changes"""
+    cache.delete(INDEX_CACHE_KEY)
+
+
+def zones_at_local_midnight(now=None):
+    """
+    Find the sweep zones whose local time is in the midnight hour.
+    
+    Args:
+        now: Aware datetime to evaluate, defaults to the current time
+    
+    Returns:
+        Dictionary mapping zone name to its local date at ``now``
+    """
+    now = now or timezone.now()
+    zones = {}
+    for zone in set(timezone_index().values()):
+        local_now = now.astimezone(ZoneInfo(zone))
+        if local_now.hour == 0:
+            zones[zone] = local_now.date()
+    return zones
+
+
+def timezone_filter(zone):
+    """Q object selecting the UserHabit rows whose owner is swept in ``zone``"""
+    names = [name for name, swept_in in timezone_index().items() if swept_in == zone]
+    condition = Q(user__profile__timezone__in=names)
+    if zone == FALLBACK_TIMEZONE:
+        condition |= Q(user__profile__isnull=True)
+    return condition
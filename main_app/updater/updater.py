@@ -1,37 +1,149 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from django_apscheduler.jobstores import DjangoJobStore 
-from .scheduler import check_and_send_notifications, check_missed_habits
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import ref_to_obj
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from .leader import LeaderElector, LEASE_HEARTBEAT
+from .instrumentation import instrument_job
+import atexit
+import logging
+
+logger = logging.getLogger(__name__)
 
 _scheduler = None
+_elector = None
 
-def start():
-    from django.apps import apps
-    if not apps.ready:
-        return
-        
-    global _scheduler
+
+def heartbeat():
+    """Renew (or try to take over) the scheduler lease for this process"""
+    try:
+        _elector.heartbeat()
+    except Exception as e:
+        logger.error(f"Scheduler lease heartbeat failed: {str(e)}")
+
+
+def run_as_leader(job_ref):
+    """
+    Entry point of every scheduled job: every process running the scheduler
+    fires the job from its own schedule, but only the lease holder actually
+    runs it.
+
+    Args:
+        job_ref: Textual reference to the job function, e.g. "module:function"
+    """
+    if _elector is None or not _elector.is_leader():
+        return None
+    with instrument_job(job_ref.rsplit(":", 1)[-1]):
+        return ref_to_obj(job_ref)()
+
+
+def _shutdown():
     if _scheduler is not None:
-        return
-        
-    _scheduler = BackgroundScheduler()
-    _scheduler.add_jobstore(DjangoJobStore(), "default")
-    
-    # Run daily at 00:01 to check for habits that were missed yesterday
-    _scheduler.add_job(
-        check_missed_habits,
-        trigger=CronTrigger(hour=0, minute=1),
+        _scheduler.shutdown(wait=False)
+    if _elector is not None:
+        _elector.release()
+
+
+def configure_jobs(scheduler):
+    """
+    Register the job store and every scheduled job on ``scheduler``.
+
+    Jobs are kept in memory rather than in a shared database job store:
+    with a shared store whichever process wakes first claims each firing,
+    and if that is a follower ``run_as_leader`` skips it and the run is
+    lost. With a schedule per process every process fires every job and
+    the lease alone decides which one runs it.
+    """
+    scheduler.add_jobstore(MemoryJobStore(), "default")
+
+    scheduler.add_job(
+        heartbeat,
+        trigger=IntervalTrigger(seconds=LEASE_HEARTBEAT),
+        id="scheduler_lease_heartbeat",
+        max_instances=1,
+        replace_existing=True,
+    )
+
+    # Run hourly; each run sweeps the users whose local midnight just passed
+    scheduler.add_job(
+        run_as_leader,
+        args=["main_app.updater.scheduler:run_timezone_sweep"],
+        trigger=CronTrigger(minute=1),
         id="check_missed_habits",
         max_instances=1,
         replace_existing=True,
     )
-    
-    _scheduler.add_job(
-        check_and_send_notifications,
+
+    scheduler.add_job(
+        run_as_leader,
+        args=["main_app.updater.scheduler:check_and_send_notifications"],
         trigger=CronTrigger(second=0),
         id="check_and_send_notifications",
         max_instances=1,
         replace_existing=True,
     )
-    
+
+    # Correct any drift in the daily rollups once the day's sweeps are done
+    scheduler.add_job(
+        run_as_leader,
+        args=["main_app.services.rollups:reconcile_rollups"],
+        trigger=CronTrigger(hour=2, minute=15),
+        id="reconcile_rollups",
+        max_instances=1,
+        replace_existing=True,
+    )
+
+    # Fold the reconciled rollups into the signup cohorts
+    scheduler.add_job(
+        run_as_leader,
+        args=["main_app.services.cohorts:build_cohorts"],
+        trigger=CronTrigger(hour=2, minute=45),
+        id="build_cohorts",
+        max_instances=1,
+        replace_existing=True,
+    )
+
+    # Keep the per-minute execution history from growing forever
+    scheduler.add_job(
+        run_as_leader,
+        args=["main_app.updater.instrumentation:prune_job_history"],
+        trigger=CronTrigger(hour=3, minute=30),
+        id="prune_job_history",
+        max_instances=1,
+        replace_existing=True,
+    )
+
+
+def run_scheduler():
+    """Run the scheduler in the foreground until interrupted (manage.py runscheduler)"""
+    global _scheduler, _elector
+
+    _elector = LeaderElector()
+    heartbeat()
+
+    _scheduler = BlockingScheduler()
+    configure_jobs(_scheduler)
+    try:
+        _scheduler.start()
+    finally:
+        _elector.release()
+
+
+def start():
+    """Start the scheduler on a background thread of the current process"""
+    from django.apps import apps
+    if not apps.ready:
+        return
+
+    global _scheduler, _elector
+    if _scheduler is not None:
+        return
+
+    _elector = LeaderElector()
+    heartbeat()
+
+    _scheduler = BackgroundScheduler()
+    configure_jobs(_scheduler)
     _scheduler.start()
+    atexit.register(_shutdown)
@@ -5,7 +5,7 @@ from .views import (
     
     # Main app views
     DashboardView, HabitListView, UserHabitListView, 
-    HabitCompletionView, HabitCreateView,
+    HabitCompletionView, HabitCreateView, HabitHeatmapView,
     
     # Gamification views
     UserGamificationView, LeaderboardView, AchievementsView, BadgesView,
@@ -38,6 +38,9 @@ urlpatterns = [
     path('admin-panel/achievements/', AdminAchievementsView.as_view(), name='admin_achievements'),
     path('admin-panel/settings/', AdminSettingsView.as_view(), name='admin_settings'),
     
+    # Habit data URLs
+    path('api/heatmap/', HabitHeatmapView.as_view(), name='heatmap'),
+    
     # Points URLs
     path('points/', UserPointsView.as_view(), name='points'),
     path('points/transactions/', TransactionsView.as_view(), name='transactions'),
@@ -14,7 +14,7 @@ from .dashboard_views import DashboardView
 
 # Export habit views
 from .habit_views import (
-    HabitListView, UserHabitListView, HabitCompletionView, HabitCreateView
+    HabitListView, UserHabitListView, HabitCompletionView, HabitCreateView, HabitHeatmapView
 )
 
 # Export gamification views
@@ -11,7 +11,7 @@ from django.utils import timezone
 from .admin_views import AdminViewMixin
 from django.views import View
 from ..models import Habit, Category, UserHabit, HabitCompletion, MissedHabit, Reminder, get_uuid
-from ..services.notification_service import NotificationService
+from ..services.completion_service import CompletionService
 import datetime
 
 
@@ -326,20 +326,13 @@ class AdminMyHabitsView(AdminViewMixin, View):
     def _handle_complete_habit(self, request):
         habit_id = request.POST.get('habit_id')
         try:
-            user_habit = UserHabit.objects.get(id=habit_id, user=request.user)
-            
-            # Create completion record
-            completion = HabitCompletion(
-                id=get_uuid(),
-                user_habit=user_habit,
-                completion_date=timezone.now().date(),
-                timestamp=timezone.now()
-            )
-            completion.save()
+            user_habit = UserHabit.objects.select_related('habit').get(id=habit_id, user=request.user)
             
-            # Check preferences and send notifications if needed
-            if user_habit.streak in [7, 14, 21, 30, 60, 90, 120, 180, 365]:
-                NotificationService.send_streak_milestone_email(user_habit, user_habit.streak)
+            # Streak, points and milestone emails are handled by the completion service
+            result = CompletionService.complete(user_habit, timezone.now().date())
+            if not result.created:
+                messages.info(request, f'"{user_habit.habit.name}" is already completed for today.')
+                return redirect('admin_my_habits')
             
             messages.success(request, f'You completed "{user_habit.habit.name}" for today!')
         except UserHabit.DoesNotExist:
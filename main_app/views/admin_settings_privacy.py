@@ -6,6 +6,7 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from django.http import HttpResponse
 from ..forms import PrivacySettingsForm
+from ..tasks import enqueue
 import json
 
 
@@ -40,7 +41,13 @@ def handle_privacy_form(self, request, profile):
 def handle_data_form(self, request):
     """Handle data management actions"""
     if 'export_data' in request.POST:
-        # Generate a JSON export of the user's data
+        if request.user.email:
+            # Build the export on the task worker and email it to the user
+            enqueue('export_user_data', user_id=request.user.id)
+            messages.success(request, f'Your data export is being prepared and will be emailed to {request.user.email}.')
+            return redirect('admin_settings')
+        
+        # Without an email address, generate a JSON export of the user's data directly
         data = self._export_user_data(request.user)
         
         # Create a downloadable JSON response
@@ -108,7 +115,7 @@ def _export_user_data(self, user):
         data['completions'].append({
             'habit_name': completion.user_habit.habit.name,
             'completion_date': completion.completion_date.isoformat(),
-            'timestamp': completion.timestamp.isoformat(),
+            'timestamp': completion.created_at.isoformat(),
         })
     
     # Get achievements
@@ -5,6 +5,7 @@ Profile settings handlers for the admin settings view.
 from django.shortcuts import redirect
 from django.contrib import messages
 from ..forms import ProfileSettingsForm
+from ..models import Reminder
 
 
 def handle_profile_form(self, request, profile):
@@ -20,9 +21,14 @@ def handle_profile_form(self, request, profile):
             profile.profile_picture = request.FILES['profile_picture']
         
         profile.bio = request.POST.get('bio', '')
+        old_timezone = profile.timezone
         profile.timezone = request.POST.get('timezone', 'UTC')
         profile.save()
         
+        # Reminders fire at local times, so move them with the user's timezone
+        if profile.timezone != old_timezone:
+            Reminder.reschedule_for_user(request.user)
+        
         messages.success(request, 'Profile updated successfully!')
     else:
         for field, errors in form.errors.items():
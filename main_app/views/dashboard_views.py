@@ -5,7 +5,8 @@ Dashboard views for the main application dashboard.
 from django.shortcuts import render
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from ..models import UserHabit, HabitCompletion
+from ..models import UserHabit
+from ..services.completion_bitmap import CompletionBitmap
 from django.utils import timezone
 
 
@@ -23,11 +24,11 @@ class DashboardView(LoginRequiredMixin, View):
             is_active=True
         ).select_related('habit')
         
-        # Get today's completions
-        today_completions = HabitCompletion.objects.filter(
-            user_habit__user=request.user,
-            completion_date=today
-        ).values_list('user_habit_id', flat=True)
+        # Habits completed in their current period, read from the completion bitmaps
+        today_completions = {
+            habit.id for habit in active_habits
+            if CompletionBitmap.for_user_habit(habit).is_completed(today)
+        }
         
         # User's appearance preferences (for UI customization)
         try:
@@ -2,15 +2,20 @@
 Views for managing habits, including creating, editing, and completing habits.
 """
 
+from datetime import date, timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
+from django.http import JsonResponse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
-from ..models import Habit, UserHabit, Category, HabitCompletion, get_uuid
-from ..services.notification_service import NotificationService
-import datetime
+from ..models import Habit, UserHabit, Category, get_uuid
+from ..services.completion_bitmap import CompletionBitmap
+from ..services.completion_service import CompletionService
+from ..services.heatmap import MAX_HEATMAP_DAYS, get_heatmap, heatmap_etag
 
 
 class HabitListView(LoginRequiredMixin, View):
@@ -72,14 +77,7 @@ class UserHabitListView(LoginRequiredMixin, View):
             is_active=True
         ).select_related('habit', 'habit__category')
         
-        # Get today's completions
         today = timezone.now().date()
-        completed_today = set(
-            HabitCompletion.objects.filter(
-                user_habit__user=request.user,
-                completion_date=today
-            ).values_list('user_habit_id', flat=True)
-        )
         
         # Group habits by category
         habits_by_category = {}
@@ -94,7 +92,8 @@ class UserHabitListView(LoginRequiredMixin, View):
                 'name': user_habit.habit.name,
                 'description': user_habit.habit.description,
                 'streak': user_habit.streak,
-                'completed_today': user_habit.id in completed_today,
+                # Completed in the current day, week or month, from the bitmap on the row
+                'completed_today': CompletionBitmap.for_user_habit(user_habit).is_completed(today),
                 'periodicity': user_habit.habit.periodicity
             })
         
@@ -111,53 +110,72 @@ class HabitCompletionView(LoginRequiredMixin, View):
     login_url = 'login'
     
     def post(self, request, habit_id):
-        user_habit = get_object_or_404(UserHabit, id=habit_id, user=request.user)
-        today = timezone.now().date()
-        
-        # Check if already completed today
-        already_completed = HabitCompletion.objects.filter(
-            user_habit=user_habit,
-            completion_date=today
-        ).exists()
+        user_habit = get_object_or_404(
+            UserHabit.objects.select_related('habit'), id=habit_id, user=request.user
+        )
         
-        if already_completed:
+        # Streak, points and milestone emails are handled by the completion service
+        result = CompletionService.complete(user_habit, timezone.now().date())
+        if not result.created:
             messages.info(request, f"You've already completed '{user_habit.habit.name}' today.")
             return redirect('my_habits')
-        
-        # Create completion record
-        completion = HabitCompletion(
-            id=get_uuid(),
-            user_habit=user_habit,
-            completion_date=today,
-            timestamp=timezone.now()
-        )
-        completion.save()
-        
-        # Update streak
-        yesterday = today - datetime.timedelta(days=1)
-        completed_yesterday = HabitCompletion.objects.filter(
-            user_habit=user_habit,
-            completion_date=yesterday
-        ).exists()
-        
-        # Update streak logic
-        if completed_yesterday or user_habit.streak == 0:
-            user_habit.streak += 1
-        else:
-            # Reset streak if chain was broken
-            user_habit.streak = 1
-            
-        user_habit.last_completed = today
-        user_habit.save()
-        
-        # Check for streak milestones and send notifications if applicable
-        if user_habit.streak in [7, 14, 21, 30, 60, 90, 180, 365]:
-            NotificationService.send_streak_milestone_email(user_habit, user_habit.streak)
             
         messages.success(request, f"You've completed '{user_habit.habit.name}' for today!")
         return redirect('my_habits')
 
 
+def _heatmap_range(request):
+    """
+    Read the ?start= and ?end= dates (YYYY-MM-DD) of a heatmap request,
+    defaulting to the year up to today.
+    
+    Returns:
+        (first_day, last_day), or None if the range is invalid
+    """
+    try:
+        last_day = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.now().date()
+        first_day = (
+            date.fromisoformat(request.GET['start']) if request.GET.get('start')
+            else last_day - timedelta(days=364)
+        )
+    except ValueError:
+        return None
+    if first_day > last_day or (last_day - first_day).days >= MAX_HEATMAP_DAYS:
+        return None
+    return first_day, last_day
+
+
+def _heatmap_etag(request):
+    bounds = _heatmap_range(request)
+    if bounds is None:
+        return None
+    return heatmap_etag(request.user.id, *bounds, request.GET.get('habit'))
+
+
+class HabitHeatmapView(LoginRequiredMixin, View):
+    """JSON calendar heatmap of the user's daily completions, or of one habit with ?habit=<id>"""
+    login_url = 'login'
+    
+    # A repeat load with a matching If-None-Match is answered from the cached version alone
+    @method_decorator(condition(etag_func=_heatmap_etag))
+    def get(self, request):
+        bounds = _heatmap_range(request)
+        if bounds is None:
+            return JsonResponse({
+                'error': f"start and end must be dates (YYYY-MM-DD) less than {MAX_HEATMAP_DAYS} days apart"
+            }, status=400)
+        
+        user_habit = None
+        if request.GET.get('habit'):
+            user_habit = get_object_or_404(
+                UserHabit.objects.select_related('habit'), id=request.GET['habit'], user=request.user
+            )
+        
+        response = JsonResponse(get_heatmap(request.user.id, *bounds, user_habit))
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
 class HabitCreateView(LoginRequiredMixin, View):
     """View to create a new custom habit"""
     login_url = 'login'